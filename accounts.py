@@ -0,0 +1,130 @@
+import os
+import re
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger('gmail_organizer')
+
+DEFAULT_ACCOUNT = 'default'  # The account the app had before it knew about several
+ACCOUNTS_DIR = 'accounts'  # One directory per additional account, holding its token and caches
+ACCOUNT_TOKEN_FILE = 'token.json'  # OAuth token of an additional account, inside its directory
+ACCOUNT_NAME_PATTERN = re.compile(r'[\w@+-][\w.@+-]{0,63}')  # Also used as a directory name
+
+def valid_account_name(name):
+    return bool(name) and ACCOUNT_NAME_PATTERN.fullmatch(name) is not None
+
+# One Gmail account: its name and where its credentials and caches live. The message
+# store, body cache, domain index, event stream, Gmail clients and fetch state are
+# attached by the registry's `setup` callback when the account is first used.
+class Account:
+    def __init__(self, name, token_file, cache_dir):
+        self.name = name
+        self.token_file = token_file
+        self.cache_dir = cache_dir
+
+    def __repr__(self):
+        return f'Account({self.name!r})'
+
+# The accounts the app knows about, opened lazily and kept open, so switching between
+# them reuses their in-memory index and caches instead of fetching again.
+#
+# The default account keeps the token file and cache directory the app always used;
+# every other account gets a directory under `accounts_dir`. Code that works on "the"
+# account asks current(), which is the account bound to the calling thread (the one a
+# request selected, or the one a background task was started for) and otherwise the
+# default account.
+class AccountRegistry:
+    def __init__(self, setup, default_token_file, default_cache_dir, accounts_dir=ACCOUNTS_DIR):
+        self.setup = setup
+        self.default_token_file = default_token_file
+        self.default_cache_dir = default_cache_dir
+        self.accounts_dir = accounts_dir
+        self.lock = threading.RLock()
+        self.local = threading.local()
+        self.opened = {}
+
+    def _paths(self, name):
+        if name == DEFAULT_ACCOUNT:
+            return self.default_token_file, self.default_cache_dir
+        directory = os.path.join(self.accounts_dir, name)
+        return os.path.join(directory, ACCOUNT_TOKEN_FILE), directory
+
+    # Names of all known accounts, the default account first
+    def names(self):
+        names = set(self.opened)
+        if os.path.isdir(self.accounts_dir):
+            names.update(
+                entry for entry in os.listdir(self.accounts_dir)
+                if valid_account_name(entry) and os.path.isdir(os.path.join(self.accounts_dir, entry))
+            )
+        names.discard(DEFAULT_ACCOUNT)
+        return [DEFAULT_ACCOUNT] + sorted(names)
+
+    def exists(self, name):
+        return name in self.opened or name in self.names()
+
+    # The account called `name`, opening it on first use. Raises KeyError for unknown accounts.
+    def get(self, name):
+        account = self.opened.get(name)
+        if account is not None:
+            return account
+        if not self.exists(name):
+            raise KeyError(name)
+        with self.lock:
+            account = self.opened.get(name)
+            if account is None:
+                account = Account(name, *self._paths(name))
+                os.makedirs(account.cache_dir, exist_ok=True)
+                self.setup(account)
+                self.opened[name] = account
+                logger.info(f"Opened account {name} with caches in {account.cache_dir}")
+        return account
+
+    # Register a new account; its credentials are requested the first time it calls Gmail.
+    # Raises ValueError for names that cannot be used as a directory name.
+    def add(self, name):
+        if not valid_account_name(name):
+            raise ValueError(f"Invalid account name: {name!r}")
+        if name != DEFAULT_ACCOUNT:
+            os.makedirs(os.path.join(self.accounts_dir, name), exist_ok=True)
+        return self.get(name)
+
+    # Accounts opened so far
+    def all(self):
+        return list(self.opened.values())
+
+    def current(self):
+        account = getattr(self.local, 'account', None)
+        return account if account is not None else self.get(DEFAULT_ACCOUNT)
+
+    # Make `account` current for the calling thread; None falls back to the default account
+    def bind(self, account):
+        self.local.account = account
+
+    @contextmanager
+    def use(self, account):
+        previous = getattr(self.local, 'account', None)
+        self.local.account = account
+        try:
+            yield account
+        finally:
+            self.local.account = previous
+
+    # Call fn(*args) with `account` current, e.g. from a thread that serves several accounts
+    def call_as(self, account, fn, *args):
+        with self.use(account):
+            return fn(*args)
+
+    # fn wrapped to run with the calling thread's current account, for callbacks that
+    # are invoked from other threads
+    def bound(self, fn):
+        account = self.current()
+        return lambda *args: self.call_as(account, fn, *args)
+
+    # Run target(*args) in a daemon thread, for the calling thread's current account
+    def spawn(self, target, *args):
+        account = self.current()
+        thread = threading.Thread(target=self.call_as, args=(account, target) + args, daemon=True)
+        thread.start()
+        return thread
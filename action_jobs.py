@@ -0,0 +1,238 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger('gmail_organizer')
+
+JOB_CHUNK_SIZE = 1000  # IDs applied between two checkpoints of a job (one batchModify call)
+JOBS_KEPT = 50  # Finished jobs kept on disk and listed by /jobs
+ACTIVE_STATES = ('queued', 'running')  # States of jobs that are resumed after a restart
+
+# An action on many emails, run in the background. `pending` is None until the IDs
+# of a bulk rule have been resolved; after that every ID is in exactly one of
+# pending, done and failed ({message_id: error}).
+class ActionJob:
+    def __init__(self, job_id, action_type, message_ids=None, rule=None):
+        self.id = job_id
+        self.action_type = action_type
+        self.rule = rule
+        self.state = 'queued'
+        self.pending = None if message_ids is None else list(dict.fromkeys(message_ids))
+        self.done = []
+        self.failed = {}
+        self.error = None
+        self.created = time.time()
+        self.updated = self.created
+        self.finished = None
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, data):
+        job = cls(data['id'], data['action_type'])
+        vars(job).update(data)
+        return job
+
+    # Counts and state for the UI; `failed_ids` adds the failed IDs with their errors
+    def summary(self, failed_ids=False):
+        pending = len(self.pending) if self.pending is not None else None
+        total = len(self.done) + len(self.failed) + (pending or 0)
+        summary = {
+            'id': self.id,
+            'action_type': self.action_type,
+            'rule': self.rule,
+            'state': self.state,
+            'total': total if self.pending is not None else None,
+            'done': len(self.done),
+            'failed': len(self.failed),
+            'pending': pending,
+            'progress': round((len(self.done) + len(self.failed)) / total, 3) if total else (1.0 if self.finished else 0.0),
+            'error': self.error,
+            'created': self.created,
+            'updated': self.updated,
+            'finished': self.finished,
+        }
+        if failed_ids:
+            summary['failed_ids'] = self.failed
+        return summary
+
+# Background queue of action jobs for one account, persisted to `directory`.
+#
+# Jobs run one at a time in submission order on a worker thread, JOB_CHUNK_SIZE IDs
+# at a time. After every chunk the job is written to its JSON file, so a restart loses
+# at most the chunk in flight. Opening the queue loads the jobs; queued or running ones
+# start again when the owner calls resume(), once whatever they act on is ready. Label
+# changes are idempotent, so the interrupted chunk is simply applied again.
+#
+# `resolve(rule)` returns the message IDs a bulk rule selects, `apply(job, message_ids)`
+# applies the job's action to one chunk and returns (processed IDs, {failed ID: error}),
+# and `on_update(summary)` hears about every state change and checkpoint.
+class ActionJobQueue:
+    def __init__(self, directory, resolve, apply, on_update=None,
+                 chunk_size=JOB_CHUNK_SIZE, keep=JOBS_KEPT):
+        self.directory = directory
+        self.resolve = resolve
+        self.apply = apply
+        self.on_update = on_update
+        self.chunk_size = chunk_size
+        self.keep = keep
+        self.condition = threading.Condition()
+        self.jobs = {}
+        self.queue = deque()
+        self.worker = None
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.json')
+
+    def _load(self):
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    job = ActionJob.from_dict(json.load(f))
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Skipping unreadable action job {name}: {e}")
+                continue
+            self.jobs[job.id] = job
+
+    # Queue the jobs a restart interrupted again, oldest first, and start working on them
+    def resume(self):
+        with self.condition:
+            resumed = sorted((job for job in self.jobs.values() if job.state in ACTIVE_STATES), key=lambda job: job.created)
+            for job in resumed:
+                job.state = 'queued'
+                if job.id not in self.queue:
+                    self.queue.append(job.id)
+            if resumed:
+                logger.info(f"Resuming {len(resumed)} action jobs from {self.directory}")
+                self._start_worker()
+                self.condition.notify_all()
+        return len(resumed)
+
+    # Write the job to its file; the rename keeps the old state if we crash mid-write
+    def _save(self, job):
+        job.updated = time.time()
+        path = self._path(job.id)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(job.to_dict(), f)
+        os.replace(path + '.tmp', path)
+
+    def _start_worker(self):
+        if self.worker is None:
+            self.worker = threading.Thread(target=self._run, daemon=True)
+            self.worker.start()
+
+    def _changed(self, job):
+        with self.condition:
+            self._save(job)
+            summary = job.summary()
+        if self.on_update:
+            try:
+                self.on_update(summary)
+            except Exception as e:
+                logger.warning(f"Error reporting progress of action job {job.id}: {e}")
+
+    # Queue `action_type` for `message_ids`, or for the IDs `rule` resolves to
+    def submit(self, action_type, message_ids=None, rule=None):
+        job = ActionJob(uuid.uuid4().hex[:12], action_type, message_ids, rule)
+        with self.condition:
+            self.jobs[job.id] = job
+            self._save(job)
+            self.queue.append(job.id)
+            self._start_worker()
+            self.condition.notify_all()
+        logger.info(f"Queued action job {job.id}: {action_type} on {len(job.pending) if job.pending is not None else 'rule ' + str(rule)}")
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    # Jobs newest first
+    def list(self):
+        with self.condition:
+            return sorted(self.jobs.values(), key=lambda job: job.created, reverse=True)
+
+    # Stop a job; a running one stops after its current chunk. Returns False if it had finished.
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        with self.condition:
+            if job is None or job.state not in ACTIVE_STATES:
+                return False
+            job.state = 'cancelled'
+            job.finished = time.time()
+        self._changed(job)
+        logger.info(f"Cancelled action job {job_id}")
+        return True
+
+    def _next_job(self):
+        with self.condition:
+            self.condition.wait_for(lambda: self.queue)
+            return self.jobs.get(self.queue.popleft())
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+            if job is None or job.state != 'queued':
+                continue
+            self._run_job(job)
+            self._prune()
+
+    def _run_job(self, job):
+        with self.condition:
+            job.state = 'running'
+        self._changed(job)
+        try:
+            if job.pending is None:
+                message_ids = list(dict.fromkeys(self.resolve(job.rule)))
+                with self.condition:
+                    job.pending = message_ids
+                self._changed(job)
+                logger.info(f"Action job {job.id} resolved {job.rule} to {len(message_ids)} emails")
+            while job.pending and job.state == 'running':
+                chunk = job.pending[:self.chunk_size]
+                processed, errors = self.apply(job, chunk)
+                succeeded = set(processed)
+                with self.condition:
+                    job.done.extend(message_id for message_id in chunk if message_id in succeeded)
+                    for message_id in chunk:
+                        if message_id not in succeeded:
+                            job.failed[message_id] = errors.get(message_id, 'Not processed')
+                    job.pending = job.pending[len(chunk):]
+                self._changed(job)
+        except Exception as e:
+            logger.error(f"Action job {job.id} failed: {e}")
+            with self.condition:
+                job.state = 'failed'
+                job.error = str(e)
+        with self.condition:
+            if job.state == 'running':
+                job.state = 'done'
+            job.finished = job.finished or time.time()
+        self._changed(job)
+        logger.info(f"Action job {job.id} {job.state}: {job.action_type} on {len(job.done)} emails, {len(job.failed)} failed")
+
+    # Forget the oldest finished jobs beyond `keep`
+    def _prune(self):
+        with self.condition:
+            finished = [job for job in self.list() if job.state not in ACTIVE_STATES]
+            for job in finished[self.keep:]:
+                del self.jobs[job.id]
+                try:
+                    os.remove(self._path(job.id))
+                except OSError as e:
+                    logger.warning(f"Could not remove action job file {job.id}: {e}")
+
+    def report(self):
+        with self.condition:
+            states = {}
+            for job in self.jobs.values():
+                states[job.state] = states.get(job.state, 0) + 1
+            return {'queued': len(self.queue), 'jobs': states}
@@ -1,18 +1,31 @@
 import os
 import json
-import base64
-import pandas as pd
-import re
+import atexit
 import html
-import pickle
 import time
 import threading
 import logging
-from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, jsonify
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from datetime import datetime
+from flask import Flask, Response, g, render_template, request, redirect, jsonify
+from werkzeug.local import LocalProxy
+from gmail_client import GmailClientPool
+from gmail_rest import AsyncGmailEngine, GMAIL_API_URL
+from gmail_batch import fetch_metadata_batch, fetch_full_batch
+from gmail_actions import apply_action, rule_query, list_message_ids, ACTION_TYPES, RULE_SELECTORS
+from mime_extract import extract_body, gmail_attachment_fetcher, PREVIEW_MAX_BYTES
+from accounts import AccountRegistry, DEFAULT_ACCOUNT
+from fetch_engine import FetchEngine, TokenBucket, CompositeBucket
+from request_scheduler import RequestScheduler
+from domain_index import DomainIndex, StoredDomainIndex
+from search_index import SearchIndex, StoredSearchIndex, SEARCH_RESULTS_LIMIT
+from sender_domains import DomainNormalizer
+from message_store import MessageStore
+from body_cache import BodyCache
+from body_prefetch import BodyPrefetcher, PREFETCH_PER_DOMAIN
+from action_jobs import ActionJobQueue
+from fetch_events import EventBroadcaster
+from history_sync import HistoryExpired, get_mailbox_history_id, list_history_changes
+from metrics import REGISTRY, Counter, Gauge, Histogram
 
 logging.getLogger('googleapiclient.discovery_cache').setLevel(logging.ERROR)
 
@@ -35,98 +48,277 @@ app.jinja_env.globals.update(min=min)
 SCOPES = ['https://mail.google.com/']
 CACHE_DIR = 'email_cache'
 CACHE_EXPIRY = 24  # Cache expiry in hours
-MAX_EMAILS_PER_PAGE = 100  # Maximum number of emails to fetch per page (reduced for faster initial load)
-MAX_TOTAL_EMAILS = 10000  # Maximum total emails to fetch
-
-# Create cache directory if it doesn't exist
-if not os.path.exists(CACHE_DIR):
-    os.makedirs(CACHE_DIR)
-
-# Global variables to track fetching status
-fetch_status = {
-    'is_fetching': False,
-    'total_emails': 0,
-    'fetched_emails': 0,
-    'next_page_token': None,
-    'grouped_emails': {},
-    'error': None,
-    'is_paused': False,  # New flag to track if fetching is paused
-    'last_fetch_time': None  # Track when the last fetch occurred
-}
+MAX_EMAILS_PER_PAGE = 100  # Initial list page size; the request scheduler adapts it to latency and errors
+MAX_TOTAL_EMAILS = 10000  # Maximum total emails to fetch when every email is held in memory (STREAMING_FETCH off)
+FETCH_WORKERS = 4  # Number of threads fetching message details in parallel
+FETCH_QUOTA_UNITS_PER_SECOND = 200  # Share of Gmail's 250 units/second per-user quota used for fetching
+
+MESSAGE_STORE_FILE = 'messages.db'  # SQLite database with fetched message metadata, inside each account's cache directory
+BODY_CACHE_FILE = 'bodies.db'  # Compressed email bodies shown in the preview, inside each account's cache directory
+ACTION_JOBS_DIR = 'jobs'  # Checkpoints of background action jobs, inside each account's cache directory
+BODY_CACHE_MEMORY_MB = 32  # In-process budget for recently viewed email bodies
+BODY_CACHE_DISK_MB = 512  # On-disk budget for compressed email bodies
+PREFETCH_TOP_DOMAINS = 3  # Largest domains whose first emails are prefetched when the page loads
+INITIAL_DOMAINS = 20  # Domains rendered with the page and per /domains page; the rest load on demand
+DOMAIN_EMAILS_PAGE = 50  # Emails per domain rendered with the page and per /domains/<domain>/emails page
+MAX_LISTING_LIMIT = 500  # Largest page size accepted by the listing endpoints
+GROUP_BY_REGISTRABLE_DOMAIN = False  # Group mail.foo.com and news.foo.com under foo.com (public suffix aware)
+GLOBAL_FETCH_WORKERS = 8  # Gmail fetch calls in flight across all accounts together
+GLOBAL_QUOTA_UNITS_PER_SECOND = 500  # Quota units per second spent across all accounts together
+STREAMING_FETCH = True  # Keep only per-domain counts in memory and read emails from the store, so any mailbox size fits
+ACCOUNT_COOKIE = 'account'  # Cookie remembering the account the browser is looking at
+BULK_RULE_MAX_MESSAGES = 100000  # Most messages one bulk rule resolves and applies to
+REST_FETCH = False  # Fetch message metadata and bodies with the asyncio REST engine (one pooled GET per message) instead of batch requests
+GMAIL_REST_URL = GMAIL_API_URL  # Where the REST engine sends its requests; a gmail_stub_server URL for offline runs
+REST_MAX_IN_FLIGHT = 100  # Requests the REST engine of an account keeps on the wire at once
+
+# Maps From headers to the domain emails are grouped under; shared by all accounts
+domain_normalizer = DomainNormalizer(registrable=GROUP_BY_REGISTRABLE_DOMAIN)
+
+# Quota budget and fetch concurrency shared by the fetches of all accounts
+global_quota_bucket = TokenBucket(GLOBAL_QUOTA_UNITS_PER_SECOND)
+fetch_slots = threading.BoundedSemaphore(GLOBAL_FETCH_WORKERS)
+
+# Fetch status of an account that has not fetched anything yet
+def new_fetch_status():
+    return {
+        'is_fetching': False,
+        'total_emails': 0,
+        'fetched_emails': 0,
+        'next_page_token': None,
+        'error': None,
+        'is_paused': False,  # New flag to track if fetching is paused
+        'last_fetch_time': None,  # Track when the last fetch occurred
+        'history_id': None,  # Mailbox history ID the cached data is in sync with
+        'scan_complete': False  # Whether a full scan of the unread listing has finished
+    }
+
+# Open the caches, Gmail clients and fetch state of an account when it is first used
+def open_account(account):
+    # Fetched message metadata and sync state, persisted across restarts
+    account.message_store = MessageStore(os.path.join(account.cache_dir, MESSAGE_STORE_FILE))
+
+    # Stored emails grouped some other way (or before grouping was recorded) are regrouped once
+    if account.message_store.get_meta('domain_grouping') != domain_normalizer.mode:
+        moved = account.message_store.regroup(domain_normalizer.domain, domain_normalizer.mode)
+        logger.info(f"Regrouped stored emails of account {account.name} by {domain_normalizer.mode}, {moved} changed domain")
+
+    # Email bodies for the preview pane, in memory and compressed on disk
+    account.body_cache = BodyCache(
+        os.path.join(account.cache_dir, BODY_CACHE_FILE),
+        memory_bytes=BODY_CACHE_MEMORY_MB * 1024 * 1024,
+        disk_bytes=BODY_CACHE_DISK_MB * 1024 * 1024,
+        ttl=CACHE_EXPIRY * 3600
+    )
+
+    account.fetch_status = new_fetch_status()
+
+    # Emails fetched so far, grouped by domain
+    account.email_index = StoredDomainIndex(account.message_store) if STREAMING_FETCH else DomainIndex()
+
+    # Words of the fetched emails' senders, subjects and cached bodies, for /search; kept in
+    # the message store along with the emails when streaming, so memory use stays flat
+    if STREAMING_FETCH and account.message_store.searchable:
+        account.search_index = StoredSearchIndex(account.message_store)
+    else:
+        account.search_index = SearchIndex()
+
+    # Progress events for /fetch-events subscribers
+    account.fetch_events = EventBroadcaster()
+
+    # Outcome of the most recently applied chunk of an action job, per batch
+    account.last_action = {}
+
+    # The account's own per-user quota, spent together with the budget shared by all accounts
+    account.quota_bucket = CompositeBucket(TokenBucket(FETCH_QUOTA_UNITS_PER_SECOND), global_quota_bucket)
+
+    # Spends the account's quota per method, retries throttled requests and sizes pages and batches
+    account.scheduler = RequestScheduler(account.quota_bucket, page_size=MAX_EMAILS_PER_PAGE)
+
+    # Gmail API clients, one per thread, sharing credentials that are refreshed in the background
+    account.client_pool = GmailClientPool(account.token_file, "credentials.json", SCOPES)
+
+    # With REST_FETCH, an event loop of its own that fetches messages over pooled keep-alive connections
+    account.rest_engine = AsyncGmailEngine(
+        lambda: rest_access_token(account),
+        base_url=GMAIL_REST_URL,
+        max_in_flight=REST_MAX_IN_FLIGHT
+    ) if REST_FETCH else None
+
+    # Warms the body cache for the emails the user is likely to preview next
+    account.body_prefetcher = BodyPrefetcher(
+        lambda message_ids: accounts.call_as(account, prefetch_email_bodies, message_ids),
+        lambda message_id: message_id in account.body_cache,
+        scheduler=account.scheduler
+    )
+
+    account.fetch_run = {'started': None, 'finished': None, 'pages': 0, 'messages': 0}  # Rates of the current or last fetch
+
+    # /action and /bulk-action run as background jobs, checkpointed to disk after every chunk
+    account.action_jobs = ActionJobQueue(
+        os.path.join(account.cache_dir, ACTION_JOBS_DIR),
+        lambda rule: accounts.call_as(account, resolve_rule, rule),
+        lambda job, message_ids: accounts.call_as(account, run_action_chunk, job, message_ids),
+        on_update=lambda summary: account.fetch_events.publish('job', summary)
+    )
+
+    # Jobs a restart interrupted go on only now that the store and the index they update are ready
+    account.action_jobs.resume()
+
+# Gmail accounts with their own credentials, caches and fetch state. The default account
+# uses token.json and CACHE_DIR as before, so existing caches stay warm.
+accounts = AccountRegistry(open_account, "token.json", CACHE_DIR)
+
+# Stop the REST engines of the opened accounts at shutdown, closing their event loops and
+# the keep-alive connections they pool
+@atexit.register
+def close_rest_engines():
+    for account in accounts.all():
+        if account.rest_engine is None:
+            continue
+        try:
+            account.rest_engine.close()
+        except Exception as e:
+            logger.warning(f"Error closing REST engine of account {account.name}: {e}")
+
+# The objects of the account the current request or background task works on
+message_store = LocalProxy(lambda: accounts.current().message_store)
+body_cache = LocalProxy(lambda: accounts.current().body_cache)
+fetch_status = LocalProxy(lambda: accounts.current().fetch_status)
+email_index = LocalProxy(lambda: accounts.current().email_index)
+search_index = LocalProxy(lambda: accounts.current().search_index)
+fetch_events = LocalProxy(lambda: accounts.current().fetch_events)
+last_action = LocalProxy(lambda: accounts.current().last_action)
+quota_bucket = LocalProxy(lambda: accounts.current().quota_bucket)
+scheduler = LocalProxy(lambda: accounts.current().scheduler)
+client_pool = LocalProxy(lambda: accounts.current().client_pool)
+body_prefetcher = LocalProxy(lambda: accounts.current().body_prefetcher)
+fetch_run = LocalProxy(lambda: accounts.current().fetch_run)
+action_jobs = LocalProxy(lambda: accounts.current().action_jobs)
+
+# Metrics served at /metrics
+ROUTE_LATENCY = Histogram('http_request_duration_seconds', 'Flask request latency by route', ['route', 'method', 'status'])
+FETCH_PAGES = Counter('gmail_fetch_pages_total', 'List pages fetched and stored', ['account'])
+FETCH_MESSAGES = Counter('gmail_fetch_messages_total', 'Messages fetched and stored', ['account'])
+
+def fetch_run_rates():
+    rates = {}
+    for account in accounts.all():
+        run = account.fetch_run
+        if not run['started']:
+            continue
+        elapsed = (run['finished'] or time.monotonic()) - run['started']
+        if elapsed > 0:
+            rates[(account.name, 'pages')] = run['pages'] / elapsed
+            rates[(account.name, 'messages')] = run['messages'] / elapsed
+    return rates
+
+# {(account name, *labels): value} from `values(account)`, a {label tuple: value} dict
+def per_account(values):
+    return lambda: {
+        (account.name,) + labels: value
+        for account in accounts.all() for labels, value in values(account).items()
+    }
+
+Gauge('gmail_fetch_rate_per_second', 'Pages and messages per second of the current or last fetch', ['account', 'unit'], collect=fetch_run_rates)
+Gauge('body_cache_hit_ratio', 'Share of preview lookups served from the body cache', ['account'], collect=per_account(lambda account: {
+    (): account.body_cache.stats()['hit_ratio']
+}))
+Counter('body_cache_lookups_total', 'Body cache lookups by result', ['account', 'result'], collect=per_account(lambda account: {
+    (result,): account.body_cache.stats()[key] for result, key in (('memory_hit', 'memory_hits'), ('disk_hit', 'disk_hits'), ('miss', 'misses'))
+}))
+Counter('body_cache_evictions_total', 'Body cache evictions by tier', ['account', 'tier'], collect=per_account(lambda account: {
+    ('memory',): account.body_cache.stats()['memory_evictions'], ('disk',): account.body_cache.stats()['disk_evictions']
+}))
+Counter('sender_domain_lookups_total', 'Sender domain extractions by memo result', ['result'], collect=lambda: {
+    ('hit',): domain_normalizer.stats()['hits'], ('miss',): domain_normalizer.stats()['misses']
+})
+Gauge('cache_size_bytes', 'Size of the local caches', ['account', 'cache'], collect=per_account(lambda account: {
+    ('messages',): sum(os.path.getsize(path) for path in (account.message_store.path, account.message_store.path + '-wal') if os.path.exists(path)),
+    ('bodies',): account.body_cache.stats()['disk_bytes'],
+    ('bodies_memory',): account.body_cache.stats()['memory_bytes'],
+}))
+Counter('gmail_quota_units_total', 'Gmail quota units spent by method', ['account', 'method'], collect=per_account(lambda account: {
+    (method,): units for method, units in account.scheduler.ledger.usage()[0].items()
+}))
+Gauge('gmail_quota_headroom_ratio', 'Share of the per-user quota left over the last minute', ['account'], collect=per_account(lambda account: {
+    (): account.scheduler.report()['headroom_ratio']
+}))
+Gauge('gmail_fetch_page_size', 'Current adaptive messages.list page size', ['account'], collect=per_account(lambda account: {
+    (): account.scheduler.page_size.value
+}))
+Gauge('gmail_fetch_batch_width', 'Current adaptive messages per metadata batch request', ['account'], collect=per_account(lambda account: {
+    (): account.scheduler.batch_width.value
+}))
+Gauge('action_jobs', 'Background action jobs by state', ['account', 'state'], collect=per_account(lambda account: {
+    (state,): count for state, count in account.action_jobs.report()['jobs'].items()
+}))
+Gauge('search_index_size', 'Emails, bodies, words and postings in the search index', ['account', 'kind'], collect=per_account(lambda account: {
+    (kind,): value for kind, value in account.search_index.stats().items()
+}))
+Gauge('emails_indexed', 'Emails in the in-memory domain index', ['account'], collect=per_account(lambda account: {
+    (): len(account.email_index)
+}))
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+# Work on the account picked with ?account= or, failing that, the account cookie
+@app.before_request
+def select_account():
+    name = request.args.get('account') or request.cookies.get(ACCOUNT_COOKIE) or DEFAULT_ACCOUNT
+    try:
+        account = accounts.get(name)
+    except KeyError:
+        logger.warning(f"Unknown account {name!r} requested, using {DEFAULT_ACCOUNT}")
+        account = accounts.get(DEFAULT_ACCOUNT)
+    accounts.bind(account)
+
+@app.teardown_request
+def release_account(exception=None):
+    accounts.bind(None)
+
+@app.context_processor
+def inject_accounts():
+    return {'account_names': accounts.names(), 'current_account': accounts.current().name}
+
+@app.after_request
+def record_request_latency(response):
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        ROUTE_LATENCY.observe(time.perf_counter() - started, route=route, method=request.method, status=response.status_code)
+    return response
 
 # Authenticate with Google
 def get_gmail_service():
-    logger.info("Authenticating with Google")
-    creds = None
-    if os.path.exists("token.json"):
-        logger.info("Found existing token.json file")
-        creds = Credentials.from_authorized_user_file("token.json", SCOPES)
-    if not creds or not creds.valid:
-        logger.info("No valid credentials found, initiating OAuth flow")
-        flow = InstalledAppFlow.from_client_secrets_file(
-            "credentials.json",
-            SCOPES
-        )
-        # Request offline access and force approval prompt to get refresh token
-        creds = flow.run_local_server(port=0, access_type='offline')
-        with open("token.json", "w") as token:
-            token.write(creds.to_json())
-        logger.info("New credentials obtained and saved to token.json")
+    return client_pool.get_service()
 
-    logger.info("Building Gmail API service")
-    return build("gmail", "v1", credentials=creds)
+# OAuth access token the REST engine of `account` sends
+def rest_access_token(account):
+    return account.client_pool.access_token()
 
 # Extract domain from email address
 def extract_domain(email):
-    # Match email pattern and extract domain
-    match = re.search(r'[\w\.-]+@([\w\.-]+)', email)
-    if match:
-        return match.group(1)
-    # If no email pattern found, try to extract domain from a URL or company name
-    match = re.search(r'([\w\.-]+\.(com|org|net|edu|io|co|gov))\b', email)
-    if match:
-        return match.group(1)
-    return "Other"
-
-# Check if cache is valid
-def is_cache_valid(cache_file):
-    if not os.path.exists(cache_file):
-        logger.debug(f"Cache file {cache_file} does not exist")
-        return False
-
-    # Check if cache is expired
-    file_modified_time = datetime.fromtimestamp(os.path.getmtime(cache_file))
-    if datetime.now() - file_modified_time > timedelta(hours=CACHE_EXPIRY):
-        logger.debug(f"Cache file {cache_file} is expired (older than {CACHE_EXPIRY} hours)")
+    return domain_normalizer.domain(email)
+
+# Whether the message store holds data worth starting from. An expired store is still
+# usable when it carries a history ID, because a history sync brings it up to date.
+def is_store_usable():
+    age = message_store.age()
+    if age is None:
+        logger.debug("Message store is empty")
         return False
+    if age <= CACHE_EXPIRY * 3600:
+        return True
+    if message_store.get_meta('history_id'):
+        logger.info("Message store is expired but has a history ID, reusing it for a history sync")
+        return True
+    logger.debug(f"Message store is expired (older than {CACHE_EXPIRY} hours)")
+    return False
 
-    logger.debug(f"Cache file {cache_file} is valid")
-    return True
-
-# Save emails to cache
-def save_to_cache(data, cache_type='list'):
-    cache_file = os.path.join(CACHE_DIR, f'{cache_type}_cache.pkl')
-    logger.debug(f"Saving data to cache file {cache_file}")
-    try:
-        with open(cache_file, 'wb') as f:
-            pickle.dump(data, f)
-        logger.debug(f"Successfully saved data to cache file {cache_file}")
-    except Exception as e:
-        logger.error(f"Error saving to cache file {cache_file}: {e}", exc_info=True)
-
-# Load emails from cache
-def load_from_cache(cache_type='list'):
-    cache_file = os.path.join(CACHE_DIR, f'{cache_type}_cache.pkl')
-    logger.debug(f"Attempting to load data from cache file {cache_file}")
-    if is_cache_valid(cache_file):
-        try:
-            with open(cache_file, 'rb') as f:
-                data = pickle.load(f)
-            logger.debug(f"Successfully loaded data from cache file {cache_file}")
-            return data
-        except Exception as e:
-            logger.error(f"Error loading cache from {cache_file}: {e}", exc_info=True)
-    return None
+def pagination_state_file():
+    return os.path.join(accounts.current().cache_dir, 'pagination_state.json')
 
 # Save pagination state
 def save_pagination_state(next_page_token, fetched_count, total_count):
@@ -136,7 +328,7 @@ def save_pagination_state(next_page_token, fetched_count, total_count):
         'total_count': total_count,
         'timestamp': datetime.now().timestamp()
     }
-    state_file = os.path.join(CACHE_DIR, 'pagination_state.json')
+    state_file = pagination_state_file()
     logger.debug(f"Saving pagination state to {state_file}: {state}")
     try:
         with open(state_file, 'w') as f:
@@ -147,7 +339,7 @@ def save_pagination_state(next_page_token, fetched_count, total_count):
 
 # Load pagination state
 def load_pagination_state():
-    state_file = os.path.join(CACHE_DIR, 'pagination_state.json')
+    state_file = pagination_state_file()
     logger.debug(f"Attempting to load pagination state from {state_file}")
     if os.path.exists(state_file):
         try:
@@ -164,6 +356,41 @@ def load_pagination_state():
             logger.error(f"Error loading pagination state from {state_file}: {e}", exc_info=True)
     return None
 
+# Build the email record used throughout the app from a message resource
+def build_email_record(msg_detail):
+    headers = msg_detail.get('payload', {}).get('headers', [])
+    sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown')
+    subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
+    date = next((h['value'] for h in headers if h['name'] == 'Date'), '')
+    return {
+        'id': msg_detail['id'],
+        'sender': sender,
+        'subject': subject,
+        'date': date,
+        'domain': extract_domain(sender)
+    }
+
+# Metadata message resources for `message_ids`, from the REST engine with REST_FETCH and
+# otherwise from batch requests of `batch_size` messages (all of them in one by default).
+# Returns and fills in `stats` like fetch_metadata_batch.
+def fetch_metadata(service, message_ids, stats=None, batch_size=None):
+    rest_engine = accounts.current().rest_engine
+    if rest_engine is not None:
+        return rest_engine.fetch_metadata_batch(message_ids, stats=stats)
+    return fetch_metadata_batch(service, message_ids, batch_size=batch_size or len(message_ids), stats=stats)
+
+# Fetch sender/subject/date for a page of messages using batched metadata requests
+def fetch_email_details(service, messages):
+    message_ids = [msg['id'] for msg in messages]
+    logger.debug(f"Fetching metadata for {len(message_ids)} messages in batches")
+    scheduler.charge('messages.get', len(message_ids))
+    stats = {}
+    details, failed_ids = fetch_metadata(service, message_ids, stats, scheduler.batch_width.value)
+    scheduler.record_batch('messages.get', len(message_ids), stats)
+    if failed_ids:
+        logger.warning(f"Skipping {len(failed_ids)} messages whose metadata could not be fetched: {failed_ids}")
+    return [build_email_record(msg_detail) for msg_detail in details]
+
 # Fetch a batch of emails
 def fetch_email_batch(page_token=None):
     service = get_gmail_service()
@@ -171,12 +398,13 @@ def fetch_email_batch(page_token=None):
     # We won't rely on the API's resultSizeEstimate as it seems inaccurate
     # Instead, we'll count the actual emails we fetch
     logger.info(f"Fetching batch of emails with page token: {page_token}")
-    results = service.users().messages().list(
+    page_size = scheduler.page_size.value
+    results = scheduler.execute('messages.list', service.users().messages().list(
         userId='me',
         q='is:unread',
-        maxResults=MAX_EMAILS_PER_PAGE,
+        maxResults=page_size,
         pageToken=page_token
-    ).execute()
+    ))
 
     messages = results.get('messages', [])
     logger.info(f"Fetched {len(messages)} messages in this batch")
@@ -185,7 +413,7 @@ def fetch_email_batch(page_token=None):
     # set a reasonable initial estimate based on what we've fetched
     if fetch_status['total_emails'] == 0 and messages:
         # If we got a full page, there are likely more emails
-        if len(messages) == MAX_EMAILS_PER_PAGE:
+        if len(messages) == page_size:
             # Set an initial estimate that's higher than what we've fetched
             # We'll adjust this as we fetch more
             fetch_status['total_emails'] = len(messages) * 3  # Arbitrary multiplier
@@ -195,24 +423,8 @@ def fetch_email_batch(page_token=None):
             fetch_status['total_emails'] = len(messages)
             logger.info(f"Setting total email count to {len(messages)} based on first batch")
 
-    email_data = []
-
-    # Process each message in the current page
-    for msg in messages:
-        logger.debug(f"Fetching details for message ID: {msg['id']}")
-        msg_detail = service.users().messages().get(userId='me', id=msg['id']).execute()
-        headers = msg_detail['payload']['headers']
-        sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown')
-        subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
-        date = next((h['value'] for h in headers if h['name'] == 'Date'), '')
-        domain = extract_domain(sender)
-        email_data.append({
-            'id': msg['id'],
-            'sender': sender,
-            'subject': subject,
-            'date': date,
-            'domain': domain
-        })
+    # Fetch the headers of every message in the current page with batched requests
+    email_data = fetch_email_details(service, messages)
 
     # Get next page token
     next_page_token = results.get('nextPageToken')
@@ -229,9 +441,103 @@ def fetch_email_batch(page_token=None):
 
     return email_data, next_page_token
 
-# Sort grouped emails by count
-def sort_grouped_emails(grouped_emails):
-    return dict(sorted(grouped_emails.items(), key=lambda item: len(item[1]), reverse=True))
+# Fill the domain index from the message store, and the search index in the background
+def load_index_from_store():
+    if STREAMING_FETCH:
+        email_index.reload()
+    else:
+        email_index.clear()
+        email_index.add_batch(message_store.all_records())
+    # Once loaded, the search index follows the store, so it is only rebuilt when they disagree
+    if len(search_index) != message_store.count():
+        accounts.spawn(rebuild_search_index)
+
+# Index every stored email for /search, a chunk at a time, with the bodies the body
+# cache holds in memory. Emails the fetch adds or an action removes meanwhile are
+# indexed or dropped by those paths as usual.
+def rebuild_search_index():
+    if not search_index.rebuild_lock.acquire(blocking=False):
+        return
+    try:
+        started = time.perf_counter()
+        search_index.clear()
+        for records in message_store.iter_records():
+            search_index.add_batch(records)
+        for message_id, email_data in body_cache.memory_items():
+            search_index.add_body(message_id, email_data['body'])
+        logger.info(f"Indexed {len(search_index)} stored emails for search in {time.perf_counter() - started:.2f}s")
+    finally:
+        search_index.rebuild_lock.release()
+
+# Persist the sync state that goes with the stored messages
+def save_store_state():
+    message_store.set_meta(
+        total_unread=fetch_status['total_emails'],
+        history_id=fetch_status['history_id'],
+        scan_complete=fetch_status['scan_complete'],
+        domain_grouping=domain_normalizer.mode
+    )
+
+# Apply the changes recorded in the mailbox history since the last sync to the domain index.
+# Raises HistoryExpired when Gmail no longer has history that far back.
+def sync_mailbox_changes(service):
+    changes, latest_history_id = list_history_changes(service, fetch_status['history_id'], scheduler)
+
+    since = email_index.version
+    removed_ids = [message_id for message_id, listed in changes.items() if not listed]
+    removed = email_index.remove(removed_ids)
+    search_index.remove(removed_ids)
+    message_store.delete(removed_ids)
+    listed_ids = [message_id for message_id, listed in changes.items() if listed]
+    known = message_store.domains_of(listed_ids)
+    added_ids = [message_id for message_id in listed_ids if message_id not in known]
+    if added_ids:
+        added = fetch_email_details(service, [{'id': message_id} for message_id in added_ids])
+        email_index.add_batch(added)
+        search_index.add_batch(added)
+        message_store.upsert_batch(added)
+
+    fetch_status['history_id'] = latest_history_id
+    fetch_status['fetched_emails'] = len(email_index)
+    fetch_status['total_emails'] = max(fetch_status['total_emails'] + len(added_ids) - removed, len(email_index))
+    fetch_status['last_fetch_time'] = datetime.now()
+    logger.info(f"History sync added {len(added_ids)} and removed {removed} emails, now at history ID {latest_history_id}")
+
+    save_store_state()
+    publish_emails(since)
+    publish_progress()
+
+# Push the current fetch progress to /fetch-events subscribers
+def publish_progress():
+    status = 'paused' if fetch_status['is_paused'] else ('fetching' if fetch_status['is_fetching'] else 'complete')
+    last_fetch_time = None
+    if fetch_status['last_fetch_time']:
+        last_fetch_time = fetch_status['last_fetch_time'].strftime('%Y-%m-%d %H:%M:%S')
+    fetch_events.publish('progress', {
+        'status': status,
+        'fetched': fetch_status['fetched_emails'],
+        'total': fetch_status['total_emails'],
+        'last_fetch_time': last_fetch_time,
+        'version': email_index.version
+    })
+
+# Push the emails added to and removed from the index after version `since` to
+# /fetch-events subscribers, with the new counts of the domains they touched
+def publish_emails(since):
+    changes = email_index.changes_since(since)
+    if changes is None:
+        # The change log no longer reaches back that far; subscribers reload the list
+        fetch_events.publish('reset', {})
+        return
+    added, removed, counts = changes
+    if not added and not removed:
+        return
+    fetch_events.publish('emails', {
+        'added': added,
+        'removed': removed,
+        'counts': counts,
+        'version': email_index.version
+    })
 
 # Background task to fetch emails
 def fetch_emails_background():
@@ -241,17 +547,16 @@ def fetch_emails_background():
         fetch_status['last_fetch_time'] = datetime.now()
         logger.info("Starting background email fetch process")
 
-        # Load existing emails from cache
-        cached_data = load_from_cache('list')
-        if cached_data and isinstance(cached_data, dict) and 'grouped' in cached_data:
-            email_data = []
-            for domain, emails in cached_data['grouped'].items():
-                email_data.extend(emails)
+        # Load existing emails from the message store
+        has_cache = is_store_usable()
+        if has_cache:
+            load_index_from_store()
+            fetch_status['history_id'] = message_store.get_meta('history_id')
+            fetch_status['scan_complete'] = message_store.get_meta('scan_complete', False)
 
             # Update fetch status with cached data
-            fetch_status['fetched_emails'] = len(email_data)
-            fetch_status['grouped_emails'] = cached_data['grouped']
-            logger.info(f"Loaded {len(email_data)} emails from cache")
+            fetch_status['fetched_emails'] = len(email_index)
+            logger.info(f"Loaded {len(email_index)} emails from cache")
 
             # Load pagination state
             pagination_state = load_pagination_state()
@@ -264,117 +569,135 @@ def fetch_emails_background():
                     fetch_status['total_emails'] = pagination_state.get('total_count', 0)
                 logger.info(f"Loaded pagination state: next_page_token={fetch_status['next_page_token']}, total_emails={fetch_status['total_emails']}")
         else:
-            email_data = []
+            email_index.clear()
+            search_index.clear()
+            message_store.clear()
+            fetch_status['history_id'] = None
+            fetch_status['scan_complete'] = False
             logger.info("No valid cache found, starting fresh fetch")
 
+        # Bring the cached emails up to date from the mailbox history
+        service = get_gmail_service()
+        if has_cache and fetch_status['history_id']:
+            try:
+                sync_mailbox_changes(service)
+            except HistoryExpired as e:
+                logger.info(f"{e}, falling back to a full scan")
+                email_index.clear()
+                search_index.clear()
+                message_store.clear()
+                fetch_status['history_id'] = None
+                fetch_status['scan_complete'] = False
+                fetch_status['next_page_token'] = None
+                fetch_status['fetched_emails'] = 0
+                fetch_status['total_emails'] = 0
+
+        if fetch_status['scan_complete']:
+            logger.info("Full scan already complete, history sync brought the cache up to date")
+            fetch_status['is_fetching'] = False
+            return
+
         # Continue fetching from where we left off
         next_page_token = fetch_status['next_page_token']
 
-        while len(email_data) < MAX_TOTAL_EMAILS:
-            # Check if fetching is paused
-            if fetch_status['is_paused']:
-                # Save current state to cache before pausing
-                if email_data:
-                    logger.info(f"Pausing fetch with {len(email_data)} emails fetched so far. Saving to cache.")
-                    df = pd.DataFrame(email_data)
-                    if not df.empty:
-                        grouped = df.groupby('domain').apply(lambda x: x.to_dict(orient='records'), include_groups=False).to_dict()
-                        sorted_grouped = sort_grouped_emails(grouped)
-                        fetch_status['grouped_emails'] = sorted_grouped
-
-                        # Save to cache
-                        cache_data = {
-                            'grouped': sorted_grouped,
-                            'total_unread': fetch_status['total_emails']
-                        }
-                        save_to_cache(cache_data, 'list')
-
-                        # Save pagination state
-                        save_pagination_state(next_page_token, len(email_data), fetch_status['total_emails'])
-
-                # Set is_fetching to false while paused
-                fetch_status['is_fetching'] = False
-                logger.info("Email fetching paused")
-
-                # Exit the fetch loop
-                break
-
-            # Fetch a batch of emails
-            logger.info(f"Fetching next batch of emails with token: {next_page_token}")
-            new_emails, next_page_token = fetch_email_batch(next_page_token)
+        # Remember where the mailbox history stands before a scan from the start,
+        # so the next sync also catches whatever changes while the scan runs
+        if not next_page_token:
+            fetch_status['history_id'] = get_mailbox_history_id(service, scheduler)
+            logger.info(f"Starting full scan at history ID {fetch_status['history_id']}")
 
+        # Called by the fetch engine for every completed list page, in page order
+        def on_page(new_emails, page_token):
             if not new_emails:
                 logger.info("No more emails to fetch")
-                break  # No more emails to fetch
+                return
+
+            FETCH_PAGES.inc(account=accounts.current().name)
+            FETCH_MESSAGES.inc(len(new_emails), account=accounts.current().name)
+            fetch_run['pages'] += 1
+            fetch_run['messages'] += len(new_emails)
 
-            # Add new emails to the list
-            email_data.extend(new_emails)
-            logger.info(f"Added {len(new_emails)} new emails. Total fetched: {len(email_data)}")
+            # Add new emails to the indexes and the message store
+            since = email_index.version
+            email_index.add_batch(new_emails)
+            search_index.add_batch(new_emails)
+            message_store.upsert_batch(new_emails)
+            publish_emails(since)
+            logger.info(f"Added {len(new_emails)} new emails. Total fetched: {len(email_index)} in {email_index.domain_count()} domains")
 
             # Update fetch status
-            fetch_status['fetched_emails'] = len(email_data)
-            fetch_status['next_page_token'] = next_page_token
+            fetch_status['fetched_emails'] = len(email_index)
+            fetch_status['next_page_token'] = page_token
             fetch_status['last_fetch_time'] = datetime.now()
 
             # If we don't have a next page token, we've fetched all emails
             # Update the total count to match what we've actually fetched
-            if not next_page_token:
-                fetch_status['total_emails'] = len(email_data)
-                logger.info(f"No more pages, setting total email count to {len(email_data)}")
+            if not page_token:
+                fetch_status['total_emails'] = len(email_index)
+                logger.info(f"No more pages, setting total email count to {len(email_index)}")
+            elif fetch_status['total_emails'] <= len(email_index):
+                # More pages are coming, so keep the estimate ahead of what we've fetched
+                fetch_status['total_emails'] = len(email_index) + scheduler.page_size.value
 
             # Save pagination state
-            save_pagination_state(next_page_token, len(email_data), fetch_status['total_emails'])
-            logger.info(f"Updated pagination state: next_page_token={next_page_token}, fetched_emails={len(email_data)}")
-
-            # Process and update grouped emails
-            df = pd.DataFrame(email_data)
-            if not df.empty:
-                grouped = df.groupby('domain').apply(lambda x: x.to_dict(orient='records'), include_groups=False).to_dict()
-                sorted_grouped = sort_grouped_emails(grouped)
-                fetch_status['grouped_emails'] = sorted_grouped
-                logger.info(f"Grouped emails by domain. Found {len(sorted_grouped)} domains.")
-
-                # Save to cache
-                cache_data = {
-                    'grouped': sorted_grouped,
-                    'total_unread': fetch_status['total_emails']
-                }
-                save_to_cache(cache_data, 'list')
-                logger.info("Saved grouped emails to cache")
-
-            # If no more pages, break
-            if not next_page_token:
-                logger.info("No next page token, fetch complete")
-                break
-
-            # If we've fetched enough emails, stop
-            if len(email_data) >= MAX_TOTAL_EMAILS:
-                logger.info(f"Reached maximum email limit ({MAX_TOTAL_EMAILS}), stopping fetch")
-                break
-
-            # Small delay to prevent API rate limiting
-            time.sleep(0.5)
+            save_pagination_state(page_token, len(email_index), fetch_status['total_emails'])
+            logger.info(f"Updated pagination state: next_page_token={page_token}, fetched_emails={len(email_index)}")
+
+            save_store_state()
+            publish_progress()
+
+        # Streaming fetches write every page to the store and keep only counts in memory,
+        # so they run to the end of the mailbox
+        remaining = None if STREAMING_FETCH else MAX_TOTAL_EMAILS - len(email_index)
+        if remaining is None or remaining > 0:
+            # List pages and fetch message details concurrently under the shared quota budget
+            # The engine calls back from threads of its own, so callbacks carry the account along
+            engine = FetchEngine(
+                accounts.bound(get_gmail_service),
+                accounts.bound(on_page),
+                accounts.current().scheduler,
+                workers=FETCH_WORKERS,
+                max_messages=remaining,
+                should_pause=accounts.bound(lambda: fetch_status['is_paused']),
+                build_record=build_email_record,
+                slots=fetch_slots,
+                fetch_metadata=accounts.bound(fetch_metadata)
+            )
+            logger.info(f"Starting fetch engine with {FETCH_WORKERS} workers from token: {next_page_token}")
+            fetch_run.update(started=time.monotonic(), finished=None, pages=0, messages=0)
+            try:
+                result = engine.run(next_page_token)
+            finally:
+                fetch_run['finished'] = time.monotonic()
+            logger.info(f"Fetch engine finished: {result}")
+            fetch_status['scan_complete'] = result in ('complete', 'limit')
+        else:
+            logger.info(f"Reached maximum email limit ({MAX_TOTAL_EMAILS}), stopping fetch")
+            fetch_status['scan_complete'] = True
+
+        # Check if fetching is paused
+        if fetch_status['is_paused']:
+            # Save current state to cache before pausing
+            if len(email_index):
+                logger.info(f"Pausing fetch with {len(email_index)} emails fetched so far. Saving state.")
+                save_store_state()
+
+                # Save pagination state
+                save_pagination_state(fetch_status['next_page_token'], len(email_index), fetch_status['total_emails'])
+
+            # Set is_fetching to false while paused
+            fetch_status['is_fetching'] = False
+            logger.info("Email fetching paused")
 
         # Final update to cache
-        if email_data and not fetch_status['is_paused']:
+        if len(email_index) and not fetch_status['is_paused']:
             logger.info("Performing final cache update")
-            df = pd.DataFrame(email_data)
-            if not df.empty:
-                grouped = df.groupby('domain').apply(lambda x: x.to_dict(orient='records'), include_groups=False).to_dict()
-                sorted_grouped = sort_grouped_emails(grouped)
-            else:
-                sorted_grouped = {}
 
             # Update total emails to match what we've actually fetched
-            fetch_status['total_emails'] = len(email_data)
-            logger.info(f"Final update: setting total email count to {len(email_data)}")
+            fetch_status['total_emails'] = len(email_index)
+            logger.info(f"Final update: setting total email count to {len(email_index)}")
 
-            cache_data = {
-                'grouped': sorted_grouped,
-                'total_unread': fetch_status['total_emails']
-            }
-            save_to_cache(cache_data, 'list')
-            fetch_status['grouped_emails'] = sorted_grouped
+            save_store_state()
 
             # Only set is_fetching to False if not paused (if paused, we already set it above)
             if not fetch_status['is_paused']:
@@ -385,6 +708,95 @@ def fetch_emails_background():
         logger.error(f"Error fetching emails: {e}", exc_info=True)
         fetch_status['error'] = str(e)
         fetch_status['is_fetching'] = False
+        fetch_events.publish('fetch-error', {'error': str(e)})
+    finally:
+        publish_progress()
+
+# Turn a format='full' message into the data shown in the preview pane
+def build_email_body(msg, service=None):
+    # Extract headers
+    headers = msg['payload']['headers']
+    sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown')
+    subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
+    date = next((h['value'] for h in headers if h['name'] == 'Date'), '')
+    to = next((h['value'] for h in headers if h['name'] == 'To'), '')
+
+    # Extract body, fetching it by attachment ID only if Gmail left it out of the payload
+    fetch_attachment = gmail_attachment_fetcher(service, msg['id'], scheduler) if service else None
+    body, mime_type, truncated = extract_body(msg['payload'], fetch_attachment, PREVIEW_MAX_BYTES)
+    if truncated:
+        logger.info(f"Email {msg['id']} body truncated to {PREVIEW_MAX_BYTES} bytes for preview")
+
+    # If body is HTML, keep it as is, otherwise escape it and add line breaks
+    if mime_type != 'text/html':
+        body = html.escape(body).replace('\n', '<br>')
+        body = f'<div style="font-family: monospace; white-space: pre-wrap;">{body}</div>'
+
+    return {
+        'id': msg['id'],
+        'sender': sender,
+        'to': to,
+        'subject': subject,
+        'date': date,
+        'body': body
+    }
+
+# Fetch and cache the bodies of a batch of emails; used by the prefetcher
+def prefetch_email_bodies(message_ids):
+    service = get_gmail_service()
+    rest_engine = accounts.current().rest_engine
+    if rest_engine is not None:
+        messages, failed = rest_engine.fetch_full_batch(message_ids)
+    else:
+        messages, failed = fetch_full_batch(service, message_ids)
+    for msg in messages:
+        email_data = build_email_body(msg, service)
+        body_cache.put(msg['id'], email_data)
+        search_index.add_body(msg['id'], email_data['body'])
+    if failed:
+        logger.debug(f"Could not prefetch {len(failed)} email bodies")
+    return len(messages)
+
+# Emails of a domain from the index, or from the store before the index is loaded
+def domain_emails(domain, offset=0, limit=None):
+    emails = email_index.emails_for(domain, offset, limit)
+    if not emails:
+        emails = message_store.emails_for(domain, offset, -1 if limit is None else limit)
+    return emails
+
+# Up to `limit` emails of a domain after `message_id`, from the index or from the store
+# before the index is loaded
+def domain_emails_after(domain, message_id, limit):
+    emails = email_index.emails_after(domain, message_id, limit)
+    if not emails:
+        emails = message_store.emails_after(domain, message_id, limit)
+    return emails
+
+# A page of (domain, count) pairs, largest first, and the total number of domains,
+# from the index or from the store before the index is loaded
+def domain_page(offset, limit):
+    ranked = email_index.ranked_domains(offset, limit)
+    if ranked:
+        return ranked, email_index.domain_count()
+    return message_store.domain_counts(offset, limit), message_store.domain_count()
+
+# What the page renders before anything is loaded on demand: the largest domains with
+# their first emails ({domain: [records]}), their full counts and the number of domains
+def initial_listing():
+    ranked, total_domains = domain_page(0, INITIAL_DOMAINS)
+    grouped = {domain: domain_emails(domain, limit=DOMAIN_EMAILS_PAGE) for domain, _ in ranked}
+    return grouped, dict(ranked), total_domains
+
+# Page size from the request, kept within 1..MAX_LISTING_LIMIT
+def listing_limit(default):
+    return min(max(request.args.get('limit', default, type=int), 1), MAX_LISTING_LIMIT)
+
+# Prefetch the first emails of the largest domains, in display order
+def prefetch_top_domains(grouped):
+    message_ids = []
+    for domain in list(grouped)[:PREFETCH_TOP_DOMAINS]:
+        message_ids.extend(email['id'] for email in grouped[domain][:PREFETCH_PER_DOMAIN])
+    body_prefetcher.schedule(message_ids, reason='for the top domains')
 
 # Fetch emails and classify
 @app.route('/')
@@ -392,30 +804,35 @@ def index():
     global fetch_status
     logger.info("Index page requested")
 
-    # Try to load from cache first
-    cached_data = load_from_cache('list')
-    initial_data = None
-
-    if cached_data and isinstance(cached_data, dict) and 'grouped' in cached_data and 'total_unread' in cached_data:
-        # Use cached data for initial render
-        initial_data = sort_grouped_emails(cached_data['grouped'])
-        total_unread = cached_data['total_unread']
-        logger.info(f"Loaded cached data with {total_unread} total unread emails across {len(initial_data)} domains")
+    # Try to load from the message store first
+    if is_store_usable():
+        total_unread = message_store.get_meta('total_unread', 0)
 
-        # Start background fetching to update cache
-        if not fetch_status['is_fetching']:
+        if fetch_status['is_fetching']:
+            # The background fetch keeps the in-memory index current
+            status_version = email_index.version
+            grouped, domain_totals, total_domains = initial_listing()
+        else:
+            # The background fetch reloads the index, so the first status poll gets a fresh listing
+            status_version = None
+            # Use stored data for initial render and start background fetching to update it
+            grouped = message_store.grouped(INITIAL_DOMAINS, DOMAIN_EMAILS_PAGE)
+            domain_totals = dict(message_store.domain_counts(limit=INITIAL_DOMAINS))
+            total_domains = message_store.domain_count()
             fetch_status['is_fetching'] = True
-            fetch_status['grouped_emails'] = initial_data
             fetch_status['total_emails'] = total_unread
-            fetch_status['fetched_emails'] = sum(len(emails) for emails in initial_data.values())
-            logger.info(f"Starting background fetch with {fetch_status['fetched_emails']} emails already cached")
+            fetch_status['fetched_emails'] = message_store.count()
+            logger.info(f"Starting background fetch with {fetch_status['fetched_emails']} emails already stored")
 
-            thread = threading.Thread(target=fetch_emails_background)
-            thread.daemon = True
-            thread.start()
+            accounts.spawn(fetch_emails_background)
 
+        logger.info(f"Loaded stored data with {total_unread} total unread emails across {total_domains} domains")
+        prefetch_top_domains(grouped)
         return render_template('index.html',
-                              grouped=initial_data,
+                              grouped=grouped,
+                              domain_totals=domain_totals,
+                              total_domains=total_domains,
+                              status_version=status_version,
                               total_unread=total_unread,
                               fetched_emails=fetch_status['fetched_emails'],
                               is_loading=fetch_status['is_fetching'])
@@ -423,51 +840,54 @@ def index():
         # If no cache, fetch first batch synchronously for immediate display
         logger.info("No valid cache found, fetching initial batch synchronously")
         try:
+            # Record the history ID before listing so a later sync picks up changes from here
+            fetch_status['history_id'] = get_mailbox_history_id(get_gmail_service(), scheduler)
+            fetch_status['scan_complete'] = False
             email_data, next_page_token = fetch_email_batch()
             fetch_status['next_page_token'] = next_page_token
 
             if email_data:
                 logger.info(f"Fetched initial batch with {len(email_data)} emails")
-                df = pd.DataFrame(email_data)
-                grouped = df.groupby('domain').apply(lambda x: x.to_dict(orient='records'), include_groups=False).to_dict()
-                initial_data = sort_grouped_emails(grouped)
-                fetch_status['grouped_emails'] = initial_data
-                fetch_status['fetched_emails'] = len(email_data)
-                logger.info(f"Grouped initial emails into {len(initial_data)} domains")
-
-                # Save to cache
-                cache_data = {
-                    'grouped': initial_data,
-                    'total_unread': fetch_status['total_emails']
-                }
-                save_to_cache(cache_data, 'list')
-                logger.info("Saved initial data to cache")
+                message_store.clear()
+                email_index.clear()
+                email_index.add_batch(email_data)
+                search_index.clear()
+                search_index.add_batch(email_data)
+                fetch_status['fetched_emails'] = len(email_index)
+                logger.info(f"Grouped initial emails into {email_index.domain_count()} domains")
+
+                # Save to the message store
+                message_store.upsert_batch(email_data)
+                save_store_state()
+                logger.info("Saved initial data to the message store")
 
                 # Save pagination state
                 save_pagination_state(next_page_token, len(email_data), fetch_status['total_emails'])
                 logger.info(f"Saved pagination state with next_page_token={next_page_token}")
             else:
-                initial_data = {}
                 logger.info("No emails found in initial fetch")
 
             total_unread = fetch_status['total_emails']
         except Exception as e:
             logger.error(f"Error fetching initial emails: {e}", exc_info=True)
-            initial_data = {}
             total_unread = 0
 
     # Start background fetching if not already running
     if not fetch_status['is_fetching']:
         fetch_status['is_fetching'] = True
         logger.info("Starting background fetch process")
-        thread = threading.Thread(target=fetch_emails_background)
-        thread.daemon = True
-        thread.start()
+        accounts.spawn(fetch_emails_background)
 
     # Render the template with whatever data we have
-    logger.info(f"Rendering index template with {total_unread} total emails, {len(initial_data or {})} domains")
+    logger.info(f"Rendering index template with {total_unread} total emails, {email_index.domain_count()} domains")
+    status_version = email_index.version
+    grouped, domain_totals, total_domains = initial_listing()
+    prefetch_top_domains(grouped)
     return render_template('index.html',
-                          grouped=initial_data or {},
+                          grouped=grouped,
+                          domain_totals=domain_totals,
+                          total_domains=total_domains,
+                          status_version=status_version,
                           total_unread=total_unread,
                           fetched_emails=fetch_status['fetched_emails'],
                           is_loading=fetch_status['is_fetching'])
@@ -492,13 +912,85 @@ def check_fetch_status():
         if fetch_status['last_fetch_time']:
             last_fetch_time = fetch_status['last_fetch_time'].strftime('%Y-%m-%d %H:%M:%S')
 
-        return jsonify({
+        # Nothing changed since the client's last poll
+        version = email_index.version
+        etag = f"{version}-{status}-{fetch_status['fetched_emails']}-{fetch_status['total_emails']}-{last_fetch_time}"
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+
+        data = {
             'status': status,
             'fetched': fetch_status['fetched_emails'],
             'total': fetch_status['total_emails'],
-            'grouped': fetch_status['grouped_emails'],
-            'last_fetch_time': last_fetch_time
-        })
+            'last_fetch_time': last_fetch_time,
+            'version': version
+        }
+
+        # With ?since=<version>, send only the emails added and removed after that version.
+        # Otherwise the client starts over from the same first screen the page renders.
+        since = request.args.get('since', type=int)
+        changes = email_index.changes_since(since) if since is not None else None
+        if changes is not None:
+            data['added'], data['removed'], data['counts'] = changes
+            data['full'] = False
+        else:
+            data['grouped'], data['counts'], data['total_domains'] = initial_listing()
+            data['full'] = True
+
+        response = jsonify(data)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+# Domains with their email counts, largest first, a page at a time. With ?emails=N
+# each domain also carries its first N emails, so a page can be rendered in one request.
+@app.route('/domains')
+def list_domains():
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = listing_limit(INITIAL_DOMAINS)
+    per_domain = min(max(request.args.get('emails', 0, type=int), 0), MAX_LISTING_LIMIT)
+    ranked, total_domains = domain_page(offset, limit)
+
+    domains = []
+    for domain, count in ranked:
+        entry = {'domain': domain, 'count': count}
+        if per_domain:
+            entry['emails'] = domain_emails(domain, limit=per_domain)
+        domains.append(entry)
+
+    next_offset = offset + len(ranked)
+    return jsonify({
+        'domains': domains,
+        'total_domains': total_domains,
+        'offset': offset,
+        'next_offset': next_offset if ranked and next_offset < total_domains else None
+    })
+
+# Emails of one domain in arrival order, a page at a time. The cursor is the offset of
+# the next email; clients pass the number of emails of the domain they already hold.
+@app.route('/domains/<domain>/emails')
+def list_domain_emails(domain):
+    cursor = max(request.args.get('cursor', 0, type=int), 0)
+    limit = listing_limit(DOMAIN_EMAILS_PAGE)
+    emails = domain_emails(domain, cursor, limit)
+    return jsonify({
+        'domain': domain,
+        'emails': emails,
+        'next_cursor': cursor + len(emails) if len(emails) == limit else None
+    })
+
+# Stream fetch progress, new emails, pause/resume state and errors as Server-Sent Events
+@app.route('/fetch-events')
+def fetch_events_stream():
+    # EventSource sends Last-Event-ID by itself when it reconnects
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    logger.info(f"Event stream opened (Last-Event-ID: {last_event_id})")
+    response = app.response_class(fetch_events.stream(last_event_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 # Add a route for incremental fetching
 @app.route('/fetch-more', methods=['GET'])
@@ -511,38 +1003,30 @@ def fetch_more():
 
     # Fetch the next page of messages
     logger.info("Fetching next page of messages")
-    results = service.users().messages().list(
+    results = scheduler.execute('messages.list', service.users().messages().list(
         userId='me',
         q='is:unread',
-        maxResults=MAX_EMAILS_PER_PAGE,
+        maxResults=scheduler.page_size.value,
         pageToken=page_token
-    ).execute()
+    ))
 
     messages = results.get('messages', [])
     logger.info(f"Fetched {len(messages)} messages in this batch")
-    email_data = []
-
-    for msg in messages:
-        logger.debug(f"Fetching details for message ID: {msg['id']}")
-        msg_detail = service.users().messages().get(userId='me', id=msg['id']).execute()
-        headers = msg_detail['payload']['headers']
-        sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown')
-        subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
-        date = next((h['value'] for h in headers if h['name'] == 'Date'), '')
-        domain = extract_domain(sender)
-        email_data.append({
-            'id': msg['id'],
-            'sender': sender,
-            'subject': subject,
-            'date': date,
-            'domain': domain
-        })
+    email_data = fetch_email_details(service, messages)
 
     # Process the new data
-    df = pd.DataFrame(email_data)
-    if not df.empty:
-        grouped = df.groupby('domain').apply(lambda x: x.to_dict(orient='records'), include_groups=False).to_dict()
+    if email_data:
+        grouped = DomainIndex(email_data).grouped()
         logger.info(f"Grouped {len(email_data)} emails into {len(grouped)} domains")
+
+        # Keep the shared index and the store in step so /fetch-status and actions see these emails
+        since = email_index.version
+        email_index.add_batch(email_data)
+        search_index.add_batch(email_data)
+        message_store.upsert_batch(email_data)
+        fetch_status['fetched_emails'] = len(email_index)
+        publish_emails(since)
+        publish_progress()
     else:
         grouped = {}
         logger.info("No emails to group in this batch")
@@ -567,210 +1051,214 @@ def fetch_more():
 def get_email(email_id):
     logger.info(f"Fetching email content for ID: {email_id}")
     # Try to load from cache first
-    cache_file = os.path.join(CACHE_DIR, f'email_{email_id}.pkl')
-    if is_cache_valid(cache_file):
-        try:
+    try:
+        email_data = body_cache.get(email_id)
+        if email_data is not None:
             logger.info(f"Loading email {email_id} from cache")
-            with open(cache_file, 'rb') as f:
-                return jsonify(pickle.load(f))
-        except Exception as e:
-            logger.error(f"Error loading email cache: {e}", exc_info=True)
+            return jsonify(email_data)
+    except Exception as e:
+        logger.error(f"Error loading email cache: {e}", exc_info=True)
 
     # If no valid cache, fetch from Gmail API
     logger.info(f"Fetching email {email_id} from Gmail API")
     service = get_gmail_service()
-    msg = service.users().messages().get(userId='me', id=email_id, format='full').execute()
+    msg = scheduler.execute('messages.get', service.users().messages().get(userId='me', id=email_id, format='full'))
     logger.info(f"Successfully fetched email {email_id} from API")
 
-    # Extract headers
-    headers = msg['payload']['headers']
-    sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown')
-    subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
-    date = next((h['value'] for h in headers if h['name'] == 'Date'), '')
-    to = next((h['value'] for h in headers if h['name'] == 'To'), '')
-
-    # Extract body
-    body = ""
-    if 'parts' in msg['payload']:
-        for part in msg['payload']['parts']:
-            if part['mimeType'] == 'text/plain' or part['mimeType'] == 'text/html':
-                if 'data' in part['body']:
-                    body_data = part['body']['data']
-                    body = base64.urlsafe_b64decode(body_data).decode('utf-8')
-                    break
-    elif 'body' in msg['payload'] and 'data' in msg['payload']['body']:
-        body_data = msg['payload']['body']['data']
-        body = base64.urlsafe_b64decode(body_data).decode('utf-8')
-
-    # If body is HTML, keep it as is, otherwise escape it and add line breaks
-    if not body.strip().startswith('<'):
-        body = html.escape(body).replace('\n', '<br>')
-        body = f'<div style="font-family: monospace; white-space: pre-wrap;">{body}</div>'
-
-    email_data = {
-        'id': email_id,
-        'sender': sender,
-        'to': to,
-        'subject': subject,
-        'date': date,
-        'body': body
-    }
+    email_data = build_email_body(msg, service)
 
     # Save to cache
     logger.info(f"Saving email {email_id} to cache")
-    with open(cache_file, 'wb') as f:
-        pickle.dump(email_data, f)
+    body_cache.put(email_id, email_data)
+    search_index.add_body(email_id, email_data['body'])
 
     return jsonify(email_data)
 
-# Handle actions
-@app.route('/action', methods=['POST'])
-def action():
-    service = get_gmail_service()
-    email_ids = request.form.getlist('email_ids')
-    action_type = request.form['action_type']
-
-    logger.info(f"Performing {action_type} action on {len(email_ids)} emails")
+# Emails whose sender, subject or cached body contain every word of ?q=, best match
+# first. Words match as prefixes, so results come in as the user types; ?limit= caps them.
+@app.route('/search')
+def search():
+    query = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', SEARCH_RESULTS_LIMIT, type=int), 1), MAX_LISTING_LIMIT)
+    started = time.perf_counter()
+    hits = search_index.search(query, limit)
+    records = message_store.get_many(message_id for message_id, _ in hits)
+    results = [dict(records[message_id], score=score) for message_id, score in hits if message_id in records]
+    return jsonify({
+        'query': query,
+        'results': results,
+        'indexed': len(search_index),
+        'took_ms': round((time.perf_counter() - started) * 1000, 2)
+    })
 
-    # Track which emails were successfully processed
-    processed_emails = []
+# Prefetch the bodies of a domain the user is browsing, starting after the email they opened
+@app.route('/prefetch', methods=['POST'])
+def prefetch():
+    domain = request.form.get('domain', '')
+    after = request.form.get('after')
+    message_ids = [email['id'] for email in domain_emails_after(domain, after, PREFETCH_PER_DOMAIN)]
+    body_prefetcher.schedule(message_ids, reason=f'for {domain}')
+    return jsonify({'status': 'scheduled', 'domain': domain, 'count': len(message_ids)})
+
+# Record the outcome of an action on `requested` emails and drop the processed ones
+# from the caches, the domain index and the message store
+def finish_action(action_type, requested, processed_emails, chunk_reports, **details):
+    for report in chunk_reports:
+        if report['error']:
+            logger.error(f"{action_type} chunk {report['chunk']} failed for {len(report['failed_ids'])} of {report['size']} emails: {report['error']}")
+    last_action.clear()
+    last_action.update({
+        'action_type': action_type,
+        'requested': requested,
+        'processed': len(processed_emails),
+        'chunks': chunk_reports,
+        'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        **details
+    })
 
-    for email_id in email_ids:
-        try:
-            if action_type == 'read':
-                logger.info(f"Marking email {email_id} as read")
-                result = service.users().messages().modify(
-                    userId='me',
-                    id=email_id,
-                    body={'removeLabelIds': ['UNREAD']}
-                ).execute()
-                logger.info(f"Successfully marked email {email_id} as read. Result: {result}")
-                processed_emails.append(email_id)
-
-            elif action_type == 'delete':
-                logger.info(f"Moving email {email_id} to trash")
-                # First get the email details for logging purposes
-                try:
-                    email_details = service.users().messages().get(
-                        userId='me',
-                        id=email_id,
-                        format='metadata',
-                        metadataHeaders=['Subject', 'From']
-                    ).execute()
-
-                    headers = email_details.get('payload', {}).get('headers', [])
-                    subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
-                    sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown')
-                    logger.info(f"About to move email to trash - ID: {email_id}, Subject: {subject}, From: {sender}")
-                except Exception as e:
-                    logger.warning(f"Could not fetch email details before moving to trash: {e}")
-
-                # Move the email to trash instead of permanently deleting it
-                result = service.users().messages().trash(userId='me', id=email_id).execute()
-                logger.info(f"Successfully moved email {email_id} to trash. Result: {result}")
-                processed_emails.append(email_id)
-
-                # Remove from email content cache if moved to trash
-                cache_file = os.path.join(CACHE_DIR, f'email_{email_id}.pkl')
-                if os.path.exists(cache_file):
-                    os.remove(cache_file)
-                    logger.info(f"Removed email {email_id} from content cache")
-
-            elif action_type == 'archive':
-                logger.info(f"Archiving email {email_id}")
-                result = service.users().messages().modify(
-                    userId='me',
-                    id=email_id,
-                    body={'removeLabelIds': ['INBOX']}
-                ).execute()
-                logger.info(f"Successfully archived email {email_id}. Result: {result}")
-                processed_emails.append(email_id)
-        except Exception as e:
-            logger.error(f"Error performing {action_type} action on email {email_id}: {e}", exc_info=True)
+    if action_type == 'delete':
+        # Remove trashed emails from the email content cache
+        body_cache.delete(processed_emails)
+        logger.info(f"Removed {len(processed_emails)} emails from content cache")
 
-    # Update the list cache to reflect the changes instead of just clearing it
+    # Remove the processed emails from the domain index and the message store. Both are
+    # keyed by message ID, so only the affected domains are touched, and the new counts
+    # are written in the same transaction as the deletes.
     if processed_emails:
-        # Load the current cache
-        cached_data = load_from_cache('list')
-        if cached_data and isinstance(cached_data, dict) and 'grouped' in cached_data:
-            updated = False
-            # Remove processed emails from each domain group
-            for domain, emails in cached_data['grouped'].items():
-                # Filter out the processed emails
-                original_length = len(emails)
-                emails_filtered = [email for email in emails if email['id'] not in processed_emails]
-                if len(emails_filtered) < original_length:
-                    cached_data['grouped'][domain] = emails_filtered
-                    updated = True
-
-            # Remove empty domains
-            domains_to_remove = []
-            for domain, emails in cached_data['grouped'].items():
-                if not emails:
-                    domains_to_remove.append(domain)
-
-            for domain in domains_to_remove:
-                del cached_data['grouped'][domain]
-                updated = True
-
-            if updated:
-                # Update the total count
-                total_emails = sum(len(emails) for emails in cached_data['grouped'].values())
-                cached_data['total_unread'] = total_emails
-
-                # Save the updated cache
-                save_to_cache(cached_data, 'list')
-                logger.info(f"Updated list cache after {action_type} action on {len(processed_emails)} emails")
-
-                # Update fetch status if it's being used
-                global fetch_status
-                if fetch_status['grouped_emails']:
-                    # Update the grouped emails in fetch status
-                    for domain, emails in fetch_status['grouped_emails'].items():
-                        fetch_status['grouped_emails'][domain] = [
-                            email for email in emails if email['id'] not in processed_emails
-                        ]
-
-                    # Remove empty domains
-                    domains_to_remove = []
-                    for domain, emails in fetch_status['grouped_emails'].items():
-                        if not emails:
-                            domains_to_remove.append(domain)
-
-                    for domain in domains_to_remove:
-                        del fetch_status['grouped_emails'][domain]
-
-                    # Update the total and fetched counts
-                    fetch_status['fetched_emails'] -= len(processed_emails)
-                    if fetch_status['fetched_emails'] < 0:
-                        fetch_status['fetched_emails'] = 0
-
-                    fetch_status['total_emails'] -= len(processed_emails)
-                    if fetch_status['total_emails'] < 0:
-                        fetch_status['total_emails'] = 0
-
-                    logger.info(f"Updated fetch status after {action_type} action. New counts: fetched={fetch_status['fetched_emails']}, total={fetch_status['total_emails']}")
-            else:
-                # If no updates were made, just clear the cache
-                list_cache = os.path.join(CACHE_DIR, 'list_cache.pkl')
-                if os.path.exists(list_cache):
-                    os.remove(list_cache)
-                    logger.info("Cleared list cache after performing actions (no updates made)")
-        else:
-            # If cache doesn't exist or is invalid, just clear it
-            list_cache = os.path.join(CACHE_DIR, 'list_cache.pkl')
-            if os.path.exists(list_cache):
-                os.remove(list_cache)
-                logger.info("Cleared list cache after performing actions (invalid cache)")
+        since = email_index.version
+        removed = email_index.remove(processed_emails)
+        search_index.remove(processed_emails)
+        total = fetch_status['total_emails'] or message_store.get_meta('total_unread', 0)
+        total = max(total - len(processed_emails), 0)
+        deleted = message_store.delete(
+            processed_emails,
+            total_unread=total,
+            history_id=fetch_status['history_id'],
+            scan_complete=fetch_status['scan_complete']
+        )
+        fetch_status['fetched_emails'] = message_store.count()
+        fetch_status['total_emails'] = max(total, fetch_status['fetched_emails'])
+        publish_emails(since)
+        publish_progress()
+        logger.info(f"Updated message store after {action_type} action on {len(processed_emails)} emails ({removed} were loaded, {deleted} were stored). New counts: fetched={fetch_status['fetched_emails']}, total={fetch_status['total_emails']}")
 
     # Clear pagination state
-    pagination_file = os.path.join(CACHE_DIR, 'pagination_state.json')
+    pagination_file = pagination_state_file()
     if os.path.exists(pagination_file):
         os.remove(pagination_file)
         logger.info("Cleared pagination state after performing actions")
 
+# Handle actions
+@app.route('/action', methods=['POST'])
+def action():
+    email_ids = request.form.getlist('email_ids')
+    action_type = request.form['action_type']
+
+    logger.info(f"Performing {action_type} action on {len(email_ids)} emails")
+
+    if action_type == 'delete':
+        # Log what is about to be trashed from the local cache rather than asking Gmail again
+        for email_id in email_ids:
+            email = email_index.get(email_id) or message_store.get(email_id)
+            if email:
+                logger.info(f"About to move email to trash - ID: {email_id}, Subject: {email['subject']}, From: {email['sender']}")
+
+    if action_type not in ACTION_TYPES:
+        logger.error(f"Unknown action: {action_type}")
+        if wants_json():
+            return jsonify({'status': 'error', 'message': f'Unknown action: {action_type}'}), 400
+        return redirect('/')
+
+    # Bulk modify / batched trash run in the background; the page follows the job's progress
+    job = action_jobs.submit(action_type, email_ids)
+    if wants_json():
+        return jsonify({'status': 'queued', 'job': job.summary()}), 202
     return redirect('/')
 
+# IDs the domain index holds for a bulk rule's domain or sender
+def local_rule_ids(selector, value):
+    if selector == 'domain':
+        return [record['id'] for record in email_index.emails_for(value)]
+    if selector == 'sender':
+        return [record['id'] for record in email_index.emails_for(extract_domain(value)) if record['sender'] == value]
+    return []
+
+# The message IDs a bulk rule selects: those Gmail finds for its query, read from
+# ID-only messages.list pages so emails that were not fetched yet are included, joined
+# with the ones the index holds for the rule's domain or sender
+def resolve_rule(rule):
+    started = time.perf_counter()
+    query = rule['query']
+    matched = list_message_ids(get_gmail_service(), query, scheduler=scheduler, limit=BULK_RULE_MAX_MESSAGES) if query else []
+    message_ids = list(dict.fromkeys(matched + local_rule_ids(rule['selector'], rule['value'])))[:BULK_RULE_MAX_MESSAGES]
+    logger.info(f"Bulk rule {rule['selector']}={rule['value']!r} (query {query!r}) matched {len(message_ids)} emails, {len(matched)} from Gmail, in {time.perf_counter() - started:.2f}s")
+    return message_ids
+
+# Apply a job's action to one chunk of its emails; called on the account's job worker.
+# Bulk rules trash through batchModify, 1000 messages per call.
+def run_action_chunk(job, message_ids):
+    processed_emails, chunk_reports = apply_action(
+        get_gmail_service(), job.action_type, message_ids, scheduler=scheduler, trash_with_modify=job.rule is not None
+    )
+    finish_action(job.action_type, len(message_ids), processed_emails, chunk_reports, job=job.id, rule=job.rule)
+    errors = {}
+    for report in chunk_reports:
+        if report['error']:
+            errors.update((message_id, report['error']) for message_id in report['failed_ids'])
+    return processed_emails, errors
+
+# Whether the client asked for JSON (the page's scripts) rather than a page (a plain form post)
+def wants_json():
+    return request.accept_mimetypes.best == 'application/json'
+
+# Apply an action to every email a rule selects: one of `domain`, `sender` or a Gmail
+# `query` such as "from:@foo.com is:unread". The rule is queued as a job that resolves
+# the matching IDs, applies the action in chunks of up to 1000 with batchModify (trash
+# included) and drops the emails from the index and store like /action does. With
+# `dry_run` set the matches are only counted.
+@app.route('/bulk-action', methods=['POST'])
+def bulk_action():
+    action_type = request.form.get('action_type', '')
+    selector = next((name for name in RULE_SELECTORS if request.form.get(name, '').strip()), None)
+    if action_type not in ACTION_TYPES or selector is None:
+        return jsonify({'status': 'error', 'message': f"action_type and one of {', '.join(RULE_SELECTORS)} are required"}), 400
+    value = request.form[selector].strip()
+    rule = {'selector': selector, 'value': value, 'query': rule_query(selector, value, registrable=domain_normalizer.registrable)}
+
+    if request.form.get('dry_run'):
+        try:
+            message_ids = resolve_rule(rule)
+        except Exception as e:
+            logger.error(f"Could not resolve bulk rule {selector}={value!r}: {e}")
+            return jsonify({'status': 'error', 'message': str(e)}), 502
+        return jsonify({'status': 'ok', 'query': rule['query'], 'matched': len(message_ids)})
+
+    job = action_jobs.submit(action_type, rule=rule)
+    return jsonify({'status': 'queued', 'query': rule['query'], 'job': job.summary()}), 202
+
+# Action jobs of the current account, newest first
+@app.route('/jobs')
+def list_jobs():
+    return jsonify({'jobs': [job.summary() for job in action_jobs.list()]})
+
+# Progress of one action job, with the IDs that failed and why
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = action_jobs.get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': f'Unknown job: {job_id}'}), 404
+    return jsonify(job.summary(failed_ids=True))
+
+# Stop a queued or running action job; a running one finishes its current chunk first
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = action_jobs.get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': f'Unknown job: {job_id}'}), 404
+    if not action_jobs.cancel(job_id):
+        return jsonify({'status': 'error', 'message': f'Job {job_id} is already {job.state}'}), 409
+    return jsonify({'status': 'cancelled', 'job': job.summary()})
+
 # Pause email fetching
 @app.route('/pause-fetch', methods=['POST'])
 def pause_fetch():
@@ -778,6 +1266,7 @@ def pause_fetch():
 
     fetch_status['is_paused'] = True
     logger.info("Pausing email fetch process via API endpoint")
+    publish_progress()
 
     return jsonify({
         'status': 'paused',
@@ -794,10 +1283,9 @@ def resume_fetch():
         fetch_status['is_paused'] = False
         fetch_status['is_fetching'] = True
         logger.info("Resuming email fetch process via API endpoint")
+        publish_progress()
 
-        thread = threading.Thread(target=fetch_emails_background)
-        thread.daemon = True
-        thread.start()
+        accounts.spawn(fetch_emails_background)
 
         return jsonify({
             'status': 'fetching',
@@ -823,6 +1311,7 @@ def fetch_logs():
 
     # Create a safe copy of the logs data
     logs = {
+        'account': accounts.current().name,
         'status': status,
         'fetched': fetch_status['fetched_emails'],
         'total': fetch_status['total_emails'],
@@ -830,10 +1319,43 @@ def fetch_logs():
         'error': error_message
     }
 
+    # Time saved by reusing Gmail clients instead of rebuilding them for each request
+    logs['client_pool'] = client_pool.report()
+
+    # Hit/miss/eviction counters of the email body cache
+    logs['body_cache'] = body_cache.stats()
+
+    # Quota spent per method, adaptive page size and batch width, and throttle headroom
+    logs['quota'] = scheduler.report()
+
+    # Requests and connection reuse of the asyncio REST engine
+    if accounts.current().rest_engine is not None:
+        logs['rest_engine'] = accounts.current().rest_engine.report()
+
+    # Background prefetching of email bodies
+    logs['prefetch'] = body_prefetcher.report()
+
+    # What the domain index holds in memory
+    logs['index'] = {
+        'mode': 'streaming' if STREAMING_FETCH else 'memory',
+        'emails': len(email_index),
+        'domains': email_index.domain_count(),
+        'change_log': len(email_index.change_log),
+    }
+
+    # Grouping mode and memo hits of sender domain extraction
+    logs['domain_normalizer'] = domain_normalizer.stats()
+
+    # Per-chunk outcome of the last bulk action
+    if last_action:
+        logs['last_action'] = dict(last_action)
+    logs['jobs'] = action_jobs.report()
+    logs['search_index'] = search_index.stats()
+
     try:
         # Add domain count information if available
-        if fetch_status['grouped_emails']:
-            logs['domain_count'] = len(fetch_status['grouped_emails'])
+        if len(email_index):
+            logs['domain_count'] = email_index.domain_count()
     except (KeyError, TypeError) as e:
         # If there's an error accessing the domain information, log it
         logger.error(f"Error accessing domain information: {e}", exc_info=True)
@@ -843,13 +1365,65 @@ def fetch_logs():
     logger.info(f"Fetch logs requested: {logs}")
     return jsonify(logs)
 
+# The known accounts and where each one's fetch stands
+@app.route('/accounts')
+def list_accounts():
+    current = accounts.current().name
+    listing = []
+    for name in accounts.names():
+        entry = {'name': name, 'current': name == current, 'open': name in accounts.opened}
+        if entry['open']:
+            status = accounts.get(name).fetch_status
+            entry.update(
+                is_fetching=status['is_fetching'],
+                is_paused=status['is_paused'],
+                fetched=status['fetched_emails'],
+                total=status['total_emails']
+            )
+        listing.append(entry)
+    return jsonify({'accounts': listing})
+
+# Show another account, or with create=1 add a new one (its Gmail sign-in happens on the
+# first page load). Accounts stay open once used, so switching back needs no refetch.
+@app.route('/switch-account', methods=['POST'])
+def switch_account():
+    name = request.form.get('account', '').strip()
+    try:
+        if request.form.get('create'):
+            account = accounts.add(name)
+            logger.info(f"Added account {name}")
+        else:
+            account = accounts.get(name)
+    except (KeyError, ValueError) as e:
+        logger.warning(f"Could not switch to account {name!r}: {e}")
+        return jsonify({'status': 'error', 'message': f'Unknown or invalid account: {name}'}), 400
+
+    logger.info(f"Switching to account {account.name}")
+    response = redirect('/')
+    response.set_cookie(ACCOUNT_COOKIE, account.name, max_age=365 * 24 * 3600, samesite='Lax')
+    return response
+
+# Prometheus text exposition of the app's metrics
+@app.route('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 # Clear cache route
 @app.route('/clear-cache', methods=['GET'])
 def clear_cache():
-    logger.info("Clearing all cache files")
+    logger.info(f"Clearing all cache files of account {accounts.current().name}")
+    # The message store and body cache stay open, so empty them rather than deleting their files
+    message_store.clear()
+    body_cache.clear()
+    search_index.clear()
+    account = accounts.current()
     count = 0
-    for file in os.listdir(CACHE_DIR):
-        file_path = os.path.join(CACHE_DIR, file)
+    for file in os.listdir(account.cache_dir):
+        file_path = os.path.join(account.cache_dir, file)
+        if file.startswith(MESSAGE_STORE_FILE) or file.startswith(BODY_CACHE_FILE):
+            continue
+        if file_path == account.token_file or not os.path.isfile(file_path):
+            continue
         try:
             os.remove(file_path)
             count += 1
@@ -863,6 +1437,9 @@ if __name__ == '__main__':
     logger.info("=== Gmail Organizer starting up ===")
     logger.info(f"Cache directory: {CACHE_DIR}")
     logger.info(f"Max emails per page: {MAX_EMAILS_PER_PAGE}")
-    logger.info(f"Max total emails: {MAX_TOTAL_EMAILS}")
+    logger.info(f"Streaming fetch: {STREAMING_FETCH}" + ("" if STREAMING_FETCH else f", max total emails: {MAX_TOTAL_EMAILS}"))
+    logger.info(f"Accounts: {', '.join(accounts.names())}")
+    logger.info(f"Fetch workers: {FETCH_WORKERS} per account, {GLOBAL_FETCH_WORKERS} in total")
+    logger.info(f"Quota budget: {FETCH_QUOTA_UNITS_PER_SECOND} units/s per account, {GLOBAL_QUOTA_UNITS_PER_SECOND} units/s in total")
     logger.info(f"Cache expiry: {CACHE_EXPIRY} hours")
     app.run(debug=True)
@@ -0,0 +1,271 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import resource
+import tempfile
+import subprocess
+from collections import Counter
+
+# Offline benchmark of the main request paths against a generated fake mailbox.
+#
+#     python bench_app.py                           # 1k, 10k and 100k messages
+#     python bench_app.py --sizes 5000 --latency 0.02 --error-rate 0.01
+#     python bench_app.py --sizes 10000 --json results.json
+#     python bench_app.py --sizes 10000 --latency 0.02 --rest
+#
+# Every mailbox size runs in a fresh subprocess with its own temporary working
+# directory, so the message store starts empty and peak RSS is per size. The
+# Gmail service is replaced by fake_gmail.generate_mailbox(); quota throttling is
+# off unless --quota is given, so the numbers measure the app rather than the
+# rate budget. For each path the report shows throughput, p50/p99 latency and the
+# Gmail API calls made while it ran. With --rest, message metadata and bodies are
+# fetched by the asyncio REST engine from a gmail_stub_server in front of the same
+# fake mailbox instead of through batch requests.
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError):
+        return None
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+# Collects timings and API call counts for one path
+class Phase:
+    def __init__(self, name, service):
+        self.name = name
+        self.service = service
+        self.latencies = []
+        self.items = 0
+
+    def __enter__(self):
+        self.calls_before = Counter(self.service.calls)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+        self.calls = dict(Counter(self.service.calls) - self.calls_before)
+        return False
+
+    # Time one call of `fn`; `items` is what the call processed (requests by default)
+    def measure(self, fn, items=1):
+        start = time.perf_counter()
+        result = fn()
+        self.latencies.append(time.perf_counter() - start)
+        self.items += items
+        return result
+
+    def result(self):
+        p50 = percentile(self.latencies, 50)
+        p99 = percentile(self.latencies, 99)
+        return {
+            'path': self.name,
+            'samples': len(self.latencies),
+            'items_per_second': round(self.items / self.elapsed, 1) if self.elapsed else None,
+            'p50_ms': round(p50 * 1000, 2) if p50 is not None else None,
+            'p99_ms': round(p99 * 1000, 2) if p99 is not None else None,
+            'api_calls': self.calls,
+        }
+
+def wait_for_fetch(app, timeout):
+    deadline = time.monotonic() + timeout
+    while app.fetch_status['is_fetching']:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Fetch did not finish within {timeout}s")
+        time.sleep(0.01)
+
+# Submit an /action job and wait until its worker has applied it
+def run_action(app, client, data, timeout):
+    job_id = client.post('/action', data=data, headers={'Accept': 'application/json'}).get_json()['job']['id']
+    deadline = time.monotonic() + timeout
+    while app.action_jobs.get(job_id).state in ('queued', 'running'):
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Action job {job_id} did not finish within {timeout}s")
+        time.sleep(0.005)
+
+# Run every path for one mailbox size; called in the child process
+def run_size(args):
+    from fake_gmail import generate_mailbox
+    service = generate_mailbox(
+        args.size,
+        domains=args.domains,
+        skew=args.skew,
+        body_bytes=args.body_bytes,
+        seed=args.seed,
+        latency=args.latency,
+        error_rate=args.error_rate
+    )
+    mailbox_rss = current_rss_mb()
+
+    import app
+    logging.getLogger('gmail_organizer').setLevel(getattr(logging, args.log_level))
+    app.get_gmail_service = lambda: service
+    if args.rest:
+        from gmail_stub_server import GmailStubServer
+        server = GmailStubServer(service).start()
+        app.REST_FETCH = True
+        app.GMAIL_REST_URL = server.url
+        app.rest_access_token = lambda account: None
+    app.MAX_TOTAL_EMAILS = max(app.MAX_TOTAL_EMAILS, args.size)
+    if not args.quota:
+        for bucket in app.quota_bucket.buckets:
+            bucket.rate = bucket.capacity = bucket.tokens = 1e12
+    if not args.prefetch:
+        app.prefetch_top_domains = lambda grouped: None
+    client = app.app.test_client()
+    results = []
+
+    # Cold start: the first page is fetched synchronously, the rest in the background
+    with Phase('index_cold', service) as cold:
+        cold.measure(lambda: client.get('/'))
+    with Phase('full_fetch', service) as fetch:
+        fetch.measure(lambda: wait_for_fetch(app, args.timeout), items=args.size)
+    fetch.calls = dict(Counter(fetch.calls) + Counter(cold.calls))
+    fetch.elapsed += cold.elapsed
+    results += [cold.result(), fetch.result()]
+    fetched = app.fetch_status['fetched_emails']
+
+    # Warm start from the message store; each request also starts a history sync
+    with Phase('index_warm', service) as phase:
+        for _ in range(args.repeats):
+            phase.measure(lambda: client.get('/'))
+            wait_for_fetch(app, args.timeout)
+    results.append(phase.result())
+
+    with Phase('fetch_status_full', service) as phase:
+        for _ in range(args.repeats):
+            phase.measure(lambda: client.get('/fetch-status'))
+    results.append(phase.result())
+
+    version = app.email_index.version
+    with Phase('fetch_status_delta', service) as phase:
+        for _ in range(args.repeats):
+            phase.measure(lambda: client.get(f'/fetch-status?since={version}'))
+    results.append(phase.result())
+
+    # Pages of the domain list and of the largest domain, as the page loads them on demand
+    ranked = app.email_index.ranked_domains()
+    with Phase('domains_page', service) as phase:
+        for page in range(args.repeats):
+            phase.measure(lambda: client.get(f'/domains?offset={page * 20 % len(ranked)}&limit=20&emails=50'))
+    results.append(phase.result())
+    with Phase('domain_emails_page', service) as phase:
+        for page in range(args.repeats):
+            phase.measure(lambda: client.get(f'/domains/{ranked[0][0]}/emails?cursor={page * 50 % ranked[0][1]}&limit=50'))
+    results.append(phase.result())
+
+    preview_ids = [email['id'] for email in app.email_index.emails_for(ranked[0][0])[:args.repeats]]
+    with Phase('email_cold', service) as phase:
+        for email_id in preview_ids:
+            phase.measure(lambda: client.get(f'/email/{email_id}'))
+    results.append(phase.result())
+    with Phase('email_warm', service) as phase:
+        for email_id in preview_ids:
+            phase.measure(lambda: client.get(f'/email/{email_id}'))
+    results.append(phase.result())
+
+    # Searches as they are typed: a sender name, a domain prefix, a subject number prefix
+    # and a word of the bodies previewed above, alone and combined
+    queries = ['sender 5', ranked[0][0][:4], 'subject 12', 'body variant', f'{ranked[1][0].split(".")[0]} subj']
+    with Phase('search', service) as phase:
+        for number in range(args.repeats):
+            query = queries[number % len(queries)]
+            phase.measure(lambda: client.get('/search', query_string={'q': query, 'limit': 20}))
+    results.append(phase.result())
+
+    # Bulk "mark as read" of whole chunks of the largest domains
+    with Phase('action_read', service) as phase:
+        for domain, _ in ranked[:args.repeats]:
+            ids = [email['id'] for email in app.email_index.emails_for(domain)[:args.action_size]]
+            if ids:
+                phase.measure(lambda: run_action(app, client, {'action_type': 'read', 'email_ids': ids}, args.timeout), items=len(ids))
+    results.append(phase.result())
+
+    return {
+        'size': args.size,
+        'fetched': fetched,
+        'mailbox_rss_mb': round(mailbox_rss, 1) if mailbox_rss is not None else None,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'paths': results,
+    }
+
+def child_main(args):
+    workdir = tempfile.mkdtemp(prefix='gmail-bench-')
+    sys.path.insert(0, REPO_DIR)
+    os.chdir(workdir)
+    try:
+        result = run_size(args)
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+    # The parent reads the last line of output
+    print(json.dumps(result))
+
+def format_calls(calls):
+    return ' '.join(f'{method}={count}' for method, count in sorted(calls.items())) or '-'
+
+def print_report(results):
+    for result in results:
+        print(f"\n== {result['size']} messages (fetched {result['fetched']}), "
+              f"peak RSS {result['peak_rss_mb']} MB, fake mailbox {result['mailbox_rss_mb']} MB ==")
+        print(f"{'path':<20} {'n':>4} {'items/s':>10} {'p50 ms':>9} {'p99 ms':>9}  api calls")
+        for path in result['paths']:
+            print(f"{path['path']:<20} {path['samples']:>4} {path['items_per_second'] or 0:>10} "
+                  f"{path['p50_ms'] or 0:>9} {path['p99_ms'] or 0:>9}  {format_calls(path['api_calls'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Gmail organizer against a fake mailbox')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='comma separated mailbox sizes')
+    parser.add_argument('--domains', type=int, default=200, help='number of sender domains')
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of the domain distribution')
+    parser.add_argument('--body-bytes', type=int, default=2000, help='size of generated email bodies')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every Gmail round trip')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of message requests failing with 429')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=20, help='requests per measured path')
+    parser.add_argument('--action-size', type=int, default=500, help='emails per /action job')
+    parser.add_argument('--quota', action='store_true', help='keep the Gmail quota token bucket in force')
+    parser.add_argument('--prefetch', action='store_true', help='leave body prefetching on')
+    parser.add_argument('--rest', action='store_true', help='fetch messages with the asyncio REST engine from a local stub server')
+    parser.add_argument('--timeout', type=float, default=1800, help='seconds to wait for a fetch to finish')
+    parser.add_argument('--log-level', default='WARNING', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args, _ = parser.parse_known_args()
+
+    if args.child:
+        child_main(args)
+        return
+
+    results = []
+    for size in [int(size) for size in args.sizes.split(',') if size]:
+        command = [sys.executable, os.path.abspath(__file__), '--child', '--size', str(size)] + sys.argv[1:]
+        print(f"Running {size} messages...", file=sys.stderr)
+        output = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
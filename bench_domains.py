@@ -0,0 +1,129 @@
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import tempfile
+from sender_domains import DomainNormalizer, load_suffix_trie, SENDER_CACHE_SIZE
+from message_store import MessageStore
+from domain_index import StoredDomainIndex
+
+# Benchmark and sanity check for sender domain extraction.
+#
+#     python bench_domains.py                       # 100k emails from 3k distinct senders
+#     python bench_domains.py -n 500000 --senders 20000 --cache-size 5000
+#
+# Emails are drawn with a Zipf-like skew from a pool of From headers spread over
+# subdomains of a few hundred organisations, as in a real mailbox. Each mode is timed
+# cold (empty memo) and warm, next to the per-email regex searches app.py used before.
+# A table of known senders is checked first, and so are the domain counts of a stored
+# index after a removal; a wrong result makes the script exit non-zero.
+
+# (From header, host grouping, registrable grouping)
+CASES = [
+    ('Alice <alice@example.com>', 'example.com', 'example.com'),
+    ('"News" <news@mail.Example.com>', 'mail.example.com', 'example.com'),
+    ('updates@news.bbc.co.uk', 'news.bbc.co.uk', 'bbc.co.uk'),
+    ('Shop <noreply@shop.acme.com.au>', 'shop.acme.com.au', 'acme.com.au'),
+    ('Visit store.widgets.com today', 'store.widgets.com', 'widgets.com'),
+    ('bob@localhost', 'localhost', 'localhost'),
+    ('Mailer Daemon', 'Other', 'Other'),
+]
+
+SUBDOMAINS = ['', 'mail.', 'news.', 'email.', 'info.', 'e.', 'notifications.', 'marketing.']
+SUFFIXES = ['com', 'org', 'net', 'io', 'co.uk', 'com.au', 'de', 'co.jp']
+
+# The extraction app.py used before sender_domains, kept here as the baseline
+def legacy_extract(email):
+    match = re.search(r'[\w\.-]+@([\w\.-]+)', email)
+    if match:
+        return match.group(1)
+    match = re.search(r'([\w\.-]+\.(com|org|net|edu|io|co|gov))\b', email)
+    if match:
+        return match.group(1)
+    return "Other"
+
+def generate_senders(count, senders, organisations, skew, seed):
+    rng = random.Random(seed)
+    pool = []
+    for number in range(senders):
+        organisation = f'org{number % organisations}.{SUFFIXES[number % len(SUFFIXES)]}'
+        host = rng.choice(SUBDOMAINS) + organisation
+        pool.append(f'Sender {number} <user{number % 17}@{host}>')
+    weights = [1 / rank ** skew for rank in range(1, senders + 1)]
+    return rng.choices(pool, weights=weights, k=count)
+
+def check(normalizer):
+    failures = 0
+    for sender, host, registrable in CASES:
+        expected = registrable if normalizer.registrable else host
+        got = normalizer.domain(sender)
+        if got != expected:
+            print(f"FAIL {normalizer.mode}: {sender!r} -> {got!r}, expected {expected!r}")
+            failures += 1
+    return failures
+
+# A stored index opened over a filled message store counts what the store holds, so
+# removing emails before anything reloads it (an action right after a restart) keeps
+# every domain count at what the store says, never below zero
+def check_stored_index():
+    with tempfile.TemporaryDirectory() as directory:
+        store = MessageStore(os.path.join(directory, 'messages.db'))
+        store.upsert_batch([
+            {'id': f'm{number}', 'domain': f'd{number % 3}.com', 'sender': f'a@d{number % 3}.com', 'subject': '', 'date': ''}
+            for number in range(30)
+        ])
+        index = StoredDomainIndex(store)
+        removed = [f'm{number}' for number in range(5)]
+        index.remove(removed)
+        store.delete(removed)
+        expected = dict(store.domain_counts())
+        store.connection.close()
+    if index.total != sum(expected.values()) or index.totals != expected or min(index.totals.values()) < 0:
+        print(f"FAIL stored index: counts {index.totals} (total {index.total}), store has {expected}")
+        return 1
+    return 0
+
+def timed(fn, emails):
+    start = time.perf_counter()
+    domains = [fn(email) for email in emails]
+    elapsed = time.perf_counter() - start
+    return elapsed / len(emails) * 1e6, len(set(domains))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark sender domain extraction')
+    parser.add_argument('-n', '--emails', type=int, default=100000, help='emails to extract domains from')
+    parser.add_argument('--senders', type=int, default=3000, help='distinct From headers')
+    parser.add_argument('--organisations', type=int, default=400, help='distinct registrable domains')
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of the sender distribution')
+    parser.add_argument('--cache-size', type=int, default=SENDER_CACHE_SIZE, help='memo entries per normalizer')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    suffixes = load_suffix_trie()
+    print(f"Loaded {suffixes.rules} suffix rules in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    emails = generate_senders(args.emails, args.senders, args.organisations, args.skew, args.seed)
+    failures = check_stored_index()
+
+    print(f"{'mode':<22} {'us/email':>9} {'emails/s':>12} {'groups':>7} {'hit ratio':>10}")
+    legacy_us, legacy_groups = timed(legacy_extract, emails)
+    print(f"{'legacy':<22} {legacy_us:>9.2f} {1e6 / legacy_us:>12,.0f} {legacy_groups:>7} {'-':>10}")
+
+    for registrable in (False, True):
+        normalizer = DomainNormalizer(registrable=registrable, suffixes=suffixes, cache_size=args.cache_size)
+        failures += check(normalizer)
+        normalizer.domain.cache_clear()
+        for run in ('cold', 'warm'):
+            us, groups = timed(normalizer.domain, emails)
+            hit_ratio = normalizer.stats()['hit_ratio']
+            print(f"{normalizer.mode + ' ' + run:<22} {us:>9.2f} {1e6 / us:>12,.0f} {groups:>7} {hit_ratio:>10}")
+
+    if failures:
+        print(f"{failures} checks failed")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
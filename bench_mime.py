@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+from mime_extract import extract_body, PREVIEW_MAX_BYTES
+
+# Benchmark and sanity check for mime_extract against the payloads in mime_samples/.
+#
+#     python bench_mime.py                # every sample, 2000 runs each
+#     python bench_mime.py -n 200 --max-bytes 65536
+#
+# Each sample records the body type and a snippet the extractor must find; a sample
+# that comes out wrong is reported and makes the script exit non-zero. The timings
+# are compared with the old one-level, decode-everything extraction.
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mime_samples')
+
+# The extraction get_email used before mime_extract, kept here as the baseline
+def legacy_extract(payload):
+    body = ''
+    if 'parts' in payload:
+        for part in payload['parts']:
+            if part['mimeType'] in ('text/plain', 'text/html') and 'data' in part['body']:
+                data = part['body']['data']
+                body = base64.urlsafe_b64decode(data + '=' * (-len(data) % 4)).decode('utf-8', errors='replace')
+                break
+    elif 'data' in payload.get('body', {}):
+        data = payload['body']['data']
+        body = base64.urlsafe_b64decode(data + '=' * (-len(data) % 4)).decode('utf-8', errors='replace')
+    return body
+
+def load_samples():
+    samples = {}
+    for name in sorted(os.listdir(SAMPLES_DIR)):
+        if name.endswith('.json'):
+            with open(os.path.join(SAMPLES_DIR, name), encoding='utf-8') as f:
+                samples[name[:-5]] = json.load(f)
+    return samples
+
+# A single-part HTML message of about `size` bytes, for measuring the decode cap
+def large_sample(size):
+    html = ('<p>' + 'x' * 96 + '</p>') * (size // 103)
+    data = base64.urlsafe_b64encode(html.encode('utf-8')).decode('ascii')
+    return {
+        'payload': {'mimeType': 'text/html', 'headers': [], 'body': {'size': len(html), 'data': data}},
+        'attachments': {},
+        'expected': {'mime_type': 'text/html', 'contains': '<p>'},
+    }
+
+def check(name, sample, max_bytes):
+    fetched = []
+
+    def fetch_attachment(attachment_id):
+        fetched.append(attachment_id)
+        return sample['attachments'][attachment_id]
+
+    body, mime_type, truncated = extract_body(sample['payload'], fetch_attachment, max_bytes)
+    expected = sample['expected']
+    ok = mime_type == expected['mime_type'] and expected['contains'] in body
+    if not ok:
+        print(f"FAIL {name}: got {mime_type!r}, {body[:60]!r}")
+    return ok, len(fetched), truncated
+
+def bench(fn, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) / runs * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark MIME body extraction')
+    parser.add_argument('-n', '--runs', type=int, default=2000, help='extractions per sample')
+    parser.add_argument('--max-bytes', type=int, default=PREVIEW_MAX_BYTES, help='decode cap for previews')
+    parser.add_argument('--large-mb', type=float, default=5, help='size of the generated large HTML sample')
+    args = parser.parse_args()
+
+    samples = load_samples()
+    samples['generated_large'] = large_sample(int(args.large_mb * 1024 * 1024))
+
+    failures = 0
+    print(f"{'sample':<24} {'ok':>3} {'fetches':>7} {'trunc':>5} {'extract us':>11} {'legacy us':>10}")
+    for name, sample in samples.items():
+        ok, fetches, truncated = check(name, sample, args.max_bytes)
+        failures += not ok
+        attachments = sample['attachments']
+        runs = max(1, args.runs // 100) if name == 'generated_large' else args.runs
+        extract_us = bench(lambda: extract_body(sample['payload'], attachments.get, args.max_bytes), runs)
+        legacy_us = bench(lambda: legacy_extract(sample['payload']), runs)
+        print(f"{name:<24} {'yes' if ok else 'NO':>3} {fetches:>7} {'yes' if truncated else '':>5} {extract_us:>11.1f} {legacy_us:>10.1f}")
+
+    if failures:
+        print(f"{failures} samples extracted incorrectly")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
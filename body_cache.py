@@ -0,0 +1,227 @@
+import json
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from metrics import CACHE_SECONDS, CACHE_BYTES
+
+logger = logging.getLogger('gmail_organizer')
+
+MEMORY_BUDGET_BYTES = 32 * 1024 * 1024  # Decoded bodies kept in process
+DISK_BUDGET_BYTES = 512 * 1024 * 1024  # Compressed bodies kept on disk
+DISK_EVICT_TARGET = 0.9  # When over budget, evict down to this fraction of it
+TTL_SECONDS = 24 * 3600  # Entries older than this are refetched
+COMPRESSION_LEVEL = 6
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS bodies (
+    id TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_bodies_accessed ON bodies(accessed_at);
+'''
+
+# In-process LRU of decoded emails, bounded by the size of their encoded form
+class MemoryLRU:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # message_id -> (email, size, created_at)
+        self.bytes = 0
+        self.evictions = 0
+
+    def get(self, message_id):
+        entry = self.entries.get(message_id)
+        if entry is not None:
+            self.entries.move_to_end(message_id)
+        return entry
+
+    def put(self, message_id, email, size, created_at):
+        self.pop(message_id)
+        if size > self.max_bytes:
+            return
+        self.entries[message_id] = (email, size, created_at)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self.entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def pop(self, message_id):
+        entry = self.entries.pop(message_id, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+        return entry
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+# Two-tier cache for the email bodies shown by /email/<id>.
+#
+# Lookups go to an in-process LRU first and then to a SQLite file of zlib-compressed
+# JSON. Both tiers have a byte budget: the memory tier drops its least recently used
+# entries as soon as it is over, the disk tier evicts by last access down to
+# DISK_EVICT_TARGET of its budget. Entries older than the TTL count as misses.
+class BodyCache:
+    def __init__(self, path, memory_bytes=MEMORY_BUDGET_BYTES, disk_bytes=DISK_BUDGET_BYTES, ttl=TTL_SECONDS):
+        self.path = path
+        self.disk_bytes = disk_bytes
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self.memory = MemoryLRU(memory_bytes)
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+        self.stored_bytes = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM bodies').fetchone()[0]
+        self.stats_counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'disk_evictions': 0,
+            'writes': 0,
+        }
+        logger.debug(f"Opened body cache at {path} ({self.stored_bytes} bytes stored)")
+
+    def _expired(self, created_at, now):
+        return self.ttl is not None and now - created_at > self.ttl
+
+    # The cached email dict, or None on a miss
+    def get(self, message_id):
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(message_id)
+            if entry is not None:
+                email, _, created_at = entry
+                if not self._expired(created_at, now):
+                    self.stats_counters['memory_hits'] += 1
+                    return email
+                self.memory.pop(message_id)
+
+            with CACHE_SECONDS.time(cache='bodies', op='read'):
+                row = self.connection.execute(
+                    'SELECT data, created_at FROM bodies WHERE id = ?', (message_id,)
+                ).fetchone()
+            if row is None:
+                self.stats_counters['misses'] += 1
+                return None
+            data, created_at = row
+            if self._expired(created_at, now):
+                self.stats_counters['expired'] += 1
+                self.stats_counters['misses'] += 1
+                self._delete_rows([message_id])
+                return None
+
+            CACHE_BYTES.inc(len(data), cache='bodies', op='read')
+            encoded = zlib.decompress(data)
+            email = json.loads(encoded)
+            self.connection.execute('UPDATE bodies SET accessed_at = ? WHERE id = ?', (now, message_id))
+            self.memory.put(message_id, email, len(encoded), created_at)
+            self.stats_counters['disk_hits'] += 1
+            return email
+
+    # Whether a fresh entry exists, without touching the counters or the LRU order
+    def __contains__(self, message_id):
+        now = time.time()
+        with self.lock:
+            entry = self.memory.entries.get(message_id)
+            if entry is not None and not self._expired(entry[2], now):
+                return True
+            row = self.connection.execute('SELECT created_at FROM bodies WHERE id = ?', (message_id,)).fetchone()
+            return row is not None and not self._expired(row[0], now)
+
+    # (message_id, email) of the bodies held in memory, least recently used first
+    def memory_items(self):
+        with self.lock:
+            return [(message_id, entry[0]) for message_id, entry in self.memory.entries.items()]
+
+    def put(self, message_id, email):
+        now = time.time()
+        encoded = json.dumps(email).encode('utf-8')
+        data = zlib.compress(encoded, COMPRESSION_LEVEL)
+        with self.lock:
+            self.memory.put(message_id, email, len(encoded), now)
+            with CACHE_SECONDS.time(cache='bodies', op='write'):
+                old = self.connection.execute('SELECT size FROM bodies WHERE id = ?', (message_id,)).fetchone()
+                self.connection.execute(
+                    'INSERT INTO bodies (id, data, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT(id) DO UPDATE SET data=excluded.data, size=excluded.size, '
+                    'created_at=excluded.created_at, accessed_at=excluded.accessed_at',
+                    (message_id, data, len(data), now, now)
+                )
+            CACHE_BYTES.inc(len(data), cache='bodies', op='write')
+            self.stored_bytes += len(data) - (old[0] if old else 0)
+            self.stats_counters['writes'] += 1
+            if self.stored_bytes > self.disk_bytes:
+                self._evict(now)
+
+    # Drop expired entries, then the least recently used ones until under the target size
+    def _evict(self, now):
+        if self.ttl is not None:
+            expired = self.connection.execute(
+                'SELECT id FROM bodies WHERE created_at < ?', (now - self.ttl,)
+            ).fetchall()
+            self._delete_rows([row[0] for row in expired])
+            self.stats_counters['expired'] += len(expired)
+
+        target = self.disk_bytes * DISK_EVICT_TARGET
+        if self.stored_bytes <= target:
+            return
+        victims = []
+        freed = 0
+        for message_id, size in self.connection.execute('SELECT id, size FROM bodies ORDER BY accessed_at').fetchall():
+            victims.append(message_id)
+            freed += size
+            if self.stored_bytes - freed <= target:
+                break
+        self._delete_rows(victims)
+        self.stats_counters['disk_evictions'] += len(victims)
+        logger.info(f"Evicted {len(victims)} email bodies from the disk cache ({freed} bytes)")
+
+    def _delete_rows(self, message_ids):
+        if not message_ids:
+            return
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            for message_id in message_ids:
+                row = self.connection.execute('SELECT size FROM bodies WHERE id = ?', (message_id,)).fetchone()
+                if row is not None:
+                    self.connection.execute('DELETE FROM bodies WHERE id = ?', (message_id,))
+                    self.stored_bytes -= row[0]
+            self.connection.execute('COMMIT')
+        except Exception:
+            self.connection.execute('ROLLBACK')
+            raise
+
+    # Forget messages that were trashed or otherwise went away
+    def delete(self, message_ids):
+        with self.lock:
+            for message_id in message_ids:
+                self.memory.pop(message_id)
+            self._delete_rows(list(message_ids))
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            self.connection.execute('DELETE FROM bodies')
+            self.stored_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.stats_counters)
+            hits = counters['memory_hits'] + counters['disk_hits']
+            lookups = hits + counters['misses']
+            counters.update({
+                'hit_ratio': round(hits / lookups, 3) if lookups else None,
+                'memory_evictions': self.memory.evictions,
+                'memory_entries': len(self.memory.entries),
+                'memory_bytes': self.memory.bytes,
+                'disk_bytes': self.stored_bytes,
+            })
+            return counters
@@ -0,0 +1,102 @@
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger('gmail_organizer')
+
+PREFETCH_QUEUE_SIZE = 100  # Most message IDs waiting to be prefetched at any time
+PREFETCH_BATCH_SIZE = 10  # Bodies fetched per Gmail batch request
+PREFETCH_PER_DOMAIN = 10  # Emails warmed for each domain that is scheduled
+
+# Background warming of the email body cache.
+#
+# schedule() replaces whatever was queued with the emails the user is most likely to
+# open next, so switching domains cancels the old work: the queue is cleared, and a
+# batch already in flight counts as cancelled when it comes back (its bodies are cached
+# all the same, the quota is spent by then). The worker spends quota through the
+# account's RequestScheduler like every other Gmail call, so prefetching never pushes the
+# app over its rate budget; it only uses what the fetch leaves over.
+#
+# `fetch_bodies(message_ids)` fetches and caches a batch of bodies, and
+# `is_cached(message_id)` says whether one is cached already.
+class BodyPrefetcher:
+    def __init__(self, fetch_bodies, is_cached, scheduler=None,
+                 queue_size=PREFETCH_QUEUE_SIZE, batch_size=PREFETCH_BATCH_SIZE):
+        self.fetch_bodies = fetch_bodies
+        self.is_cached = is_cached
+        self.scheduler = scheduler
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.queue = deque()
+        self.generation = 0  # Bumped on every schedule() so stale work can be recognised
+        self.condition = threading.Condition()
+        self.worker = None
+        self.stats = {
+            'scheduled': 0,
+            'fetched': 0,
+            'already_cached': 0,
+            'cancelled': 0,
+            'errors': 0,
+        }
+
+    # Replace the queue with `message_ids` (most likely first), cancelling earlier work
+    def schedule(self, message_ids, reason=''):
+        with self.condition:
+            self.generation += 1
+            self.stats['cancelled'] += len(self.queue)
+            self.queue.clear()
+            seen = set()
+            for message_id in message_ids:
+                if len(self.queue) >= self.queue_size:
+                    break
+                if message_id in seen:
+                    continue
+                seen.add(message_id)
+                self.queue.append(message_id)
+            self.stats['scheduled'] += len(self.queue)
+            if self.worker is None:
+                self.worker = threading.Thread(target=self._run, daemon=True)
+                self.worker.start()
+            self.condition.notify_all()
+        logger.debug(f"Scheduled {len(self.queue)} email bodies for prefetch {reason}".rstrip())
+
+    def _next_batch(self):
+        with self.condition:
+            self.condition.wait_for(lambda: self.queue)
+            batch = []
+            while self.queue and len(batch) < self.batch_size:
+                message_id = self.queue.popleft()
+                if self.is_cached(message_id):
+                    self.stats['already_cached'] += 1
+                else:
+                    batch.append(message_id)
+            return batch, self.generation
+
+    def _run(self):
+        while True:
+            batch, generation = self._next_batch()
+            if not batch:
+                continue
+            if self.scheduler:
+                self.scheduler.charge('messages.get', len(batch))
+            with self.condition:
+                if generation != self.generation:
+                    # The user moved on while we waited for quota
+                    self.stats['cancelled'] += len(batch)
+                    continue
+            try:
+                fetched = self.fetch_bodies(batch)
+                with self.condition:
+                    if generation != self.generation:
+                        # The user moved on while the batch was in flight
+                        self.stats['cancelled'] += len(batch)
+                    else:
+                        self.stats['fetched'] += fetched
+            except Exception as e:
+                with self.condition:
+                    self.stats['errors'] += 1
+                logger.warning(f"Error prefetching {len(batch)} email bodies: {e}")
+
+    def report(self):
+        with self.condition:
+            return dict(self.stats, queued=len(self.queue))
@@ -0,0 +1,323 @@
+import bisect
+import threading
+from itertools import islice
+from collections import deque
+from metrics import Histogram
+
+CHANGE_LOG_SIZE = 50000  # Number of per-message changes kept for answering delta requests
+STORED_CHANGE_LOG_SIZE = 10000  # Change log length of a StoredDomainIndex, whose memory use is meant to stay flat
+
+GROUPING_SECONDS = Histogram('domain_index_duration_seconds', 'Time spent grouping emails by domain', ['op'])
+
+# Incrementally maintained grouping of email records by domain.
+#
+# Records are kept per domain in insertion order, with a message ID -> domain map
+# so that adding a batch costs O(batch) and removing a message is O(1).
+# Domains are bucketed by their email count and the distinct counts are kept in a
+# sorted list, so largest-first iteration never needs a full sort of the domains.
+#
+# Every mutation bumps a monotonically increasing `version` and is recorded in a
+# bounded change log, so callers holding an older version can ask for just the
+# emails added and removed since then (see changes_since).
+#
+# Domains and emails can also be read a page at a time (ranked_domains and
+# emails_for take an offset and a limit), so callers never have to materialize
+# the whole grouping to show its first screen.
+class DomainIndex:
+    def __init__(self, records=None, change_log_size=CHANGE_LOG_SIZE):
+        self.lock = threading.RLock()
+        self.version = 0
+        self.change_log = deque()  # (version, message_id, domain, record or None when removed)
+        self.change_log_size = change_log_size
+        self.log_start = 0  # Oldest version the change log can answer from
+        self._reset()
+        if records:
+            self.add_batch(records)
+
+    def _reset(self):
+        self.groups = {}  # domain -> {message_id: record}
+        self.locations = {}  # message_id -> domain
+        self.buckets = {}  # email count -> {domain: None}, in insertion order
+        self.counts = []  # distinct email counts, ascending
+
+    # Empty the index; clients holding an older version need a full reload afterwards
+    def clear(self):
+        with self.lock:
+            self._reset()
+            self.version += 1
+            self.change_log.clear()
+            self.log_start = self.version
+
+    def _log_change(self, message_id, domain, record):
+        if len(self.change_log) >= self.change_log_size:
+            # Changes at the evicted version may now be incomplete
+            self.log_start = self.change_log.popleft()[0]
+        self.change_log.append((self.version, message_id, domain, record))
+
+    def __len__(self):
+        return len(self.locations)
+
+    def __contains__(self, message_id):
+        return message_id in self.locations
+
+    def domain_count(self):
+        return len(self.groups)
+
+    def get(self, message_id):
+        with self.lock:
+            domain = self.locations.get(message_id)
+            if domain is None:
+                return None
+            return self.groups[domain][message_id]
+
+    # Move a domain from the bucket for `old_count` to the bucket for `new_count`
+    def _rebucket(self, domain, old_count, new_count):
+        if old_count:
+            bucket = self.buckets[old_count]
+            del bucket[domain]
+            if not bucket:
+                del self.buckets[old_count]
+                del self.counts[bisect.bisect_left(self.counts, old_count)]
+        if new_count:
+            bucket = self.buckets.get(new_count)
+            if bucket is None:
+                bucket = self.buckets[new_count] = {}
+                bisect.insort(self.counts, new_count)
+            bucket[domain] = None
+
+    # Add a batch of email records; records already in the index are replaced
+    def add_batch(self, records):
+        with self.lock, GROUPING_SECONDS.time(op='add'):
+            if not records:
+                return
+            self.version += 1
+            before = {}
+            for record in records:
+                message_id = record['id']
+                if message_id in self.locations:
+                    self._discard(message_id, before)
+                domain = record['domain']
+                group = self.groups.get(domain)
+                if group is None:
+                    group = self.groups[domain] = {}
+                if domain not in before:
+                    before[domain] = len(group)
+                group[message_id] = record
+                self.locations[message_id] = domain
+                self._log_change(message_id, domain, record)
+
+            for domain, old_count in before.items():
+                new_count = len(self.groups.get(domain, ()))
+                if new_count != old_count:
+                    self._rebucket(domain, old_count, new_count)
+                if not new_count:
+                    self.groups.pop(domain, None)
+
+    def _discard(self, message_id, before):
+        domain = self.locations.pop(message_id)
+        group = self.groups[domain]
+        if domain not in before:
+            before[domain] = len(group)
+        del group[message_id]
+        return domain
+
+    # Remove messages by ID; returns the number of messages that were in the index
+    def remove(self, message_ids):
+        with self.lock, GROUPING_SECONDS.time(op='remove'):
+            before = {}
+            removed = 0
+            for message_id in message_ids:
+                if message_id in self.locations:
+                    if not removed:
+                        self.version += 1
+                    domain = self._discard(message_id, before)
+                    self._log_change(message_id, domain, None)
+                    removed += 1
+
+            for domain, old_count in before.items():
+                new_count = len(self.groups[domain])
+                self._rebucket(domain, old_count, new_count)
+                if not new_count:
+                    del self.groups[domain]
+            return removed
+
+    # Emails added ({domain: [records]}) and message IDs removed after version `since`,
+    # with the current email count of every domain they touched ({domain: count}).
+    # Returns None when the change log no longer reaches back that far.
+    def changes_since(self, since):
+        with self.lock:
+            if since < self.log_start or since > self.version:
+                return None
+            latest = {}
+            touched = {}
+            for version, message_id, domain, record in reversed(self.change_log):
+                if version <= since:
+                    break
+                latest.setdefault(message_id, record)
+                touched[domain] = None
+
+            added = {}
+            removed = []
+            # The log was walked newest first, so flip it back to arrival order
+            for message_id, record in reversed(list(latest.items())):
+                if record is None:
+                    removed.append(message_id)
+                else:
+                    added.setdefault(record['domain'], []).append(record)
+            return added, removed, self.counts_for(touched)
+
+    # Current email counts of the given domains; 0 for domains that are gone
+    def counts_for(self, domains):
+        with self.lock:
+            return {domain: len(self.groups.get(domain, ())) for domain in domains}
+
+    # Domains with their email counts, largest first; `limit` of None means all
+    def ranked_domains(self, offset=0, limit=None):
+        with self.lock:
+            ranked = []
+            skip = offset
+            for count in reversed(self.counts):
+                bucket = self.buckets[count]
+                if skip >= len(bucket):
+                    # Whole buckets before the page are skipped without walking them
+                    skip -= len(bucket)
+                    continue
+                for domain in islice(bucket, skip, None):
+                    if limit is not None and len(ranked) >= limit:
+                        return ranked
+                    ranked.append((domain, count))
+                skip = 0
+            return ranked
+
+    # Emails of a domain in arrival order; `limit` of None means all
+    def emails_for(self, domain, offset=0, limit=None):
+        with self.lock:
+            group = self.groups.get(domain, {})
+            stop = None if limit is None else offset + limit
+            return list(islice(group.values(), offset, stop))
+
+    # Up to `limit` emails of a domain that arrived after `message_id`, or its first
+    # `limit` emails if `message_id` is not one of them
+    def emails_after(self, domain, message_id, limit):
+        with self.lock:
+            group = self.groups.get(domain, {})
+            if message_id not in group:
+                return list(islice(group.values(), limit))
+            items = iter(group.items())
+            for key, _ in items:
+                if key == message_id:
+                    break
+            return [record for _, record in islice(items, limit)]
+
+    def all_records(self):
+        with self.lock:
+            return [record for group in self.groups.values() for record in group.values()]
+
+    # Materialize the {domain: [records]} dict, ordered by email count; the limits keep
+    # it to the largest `max_domains` domains and their first `per_domain` emails
+    def grouped(self, max_domains=None, per_domain=None):
+        with self.lock, GROUPING_SECONDS.time(op='grouped'):
+            return {
+                domain: self.emails_for(domain, limit=per_domain)
+                for domain, _ in self.ranked_domains(limit=max_domains)
+            }
+
+# DomainIndex for mailboxes too large to hold in memory.
+#
+# Only the email count of every domain, the ranking buckets and the bounded change
+# log live in memory; records are read from the MessageStore. Callers add records to
+# the index before writing them to the store and remove them from the index before
+# deleting them from the store, so the index can tell new messages from known ones
+# (and find the domain of a removed one) by asking the store. The counts are taken
+# from the store when the index is created, so a removal can never take a domain
+# below zero. Memory use grows with the number of domains, not the number of emails.
+class StoredDomainIndex(DomainIndex):
+    def __init__(self, store, change_log_size=STORED_CHANGE_LOG_SIZE):
+        self.store = store
+        super().__init__(change_log_size=change_log_size)
+        self.reload()
+
+    def _reset(self):
+        self.totals = {}  # domain -> email count
+        self.total = 0
+        self.buckets = {}  # email count -> {domain: None}, in insertion order
+        self.counts = []  # distinct email counts, ascending
+
+    # Take the domain counts from the store, e.g. after it was loaded from disk
+    def reload(self):
+        with self.lock:
+            self.clear()
+            for domain, count in self.store.domain_counts():
+                self.totals[domain] = count
+                self.total += count
+                self._rebucket(domain, 0, count)
+
+    def __len__(self):
+        return self.total
+
+    def __contains__(self, message_id):
+        return bool(self.store.domains_of([message_id]))
+
+    def domain_count(self):
+        return len(self.totals)
+
+    def get(self, message_id):
+        return self.store.get(message_id)
+
+    # Apply {domain: change in email count} to the totals and buckets
+    def _apply(self, deltas):
+        for domain, delta in deltas.items():
+            if not delta:
+                continue
+            old_count = self.totals.get(domain, 0)
+            new_count = old_count + delta
+            self._rebucket(domain, old_count, new_count)
+            if new_count:
+                self.totals[domain] = new_count
+            else:
+                del self.totals[domain]
+            self.total += delta
+
+    def add_batch(self, records):
+        with self.lock, GROUPING_SECONDS.time(op='add'):
+            if not records:
+                return
+            self.version += 1
+            known = self.store.domains_of([record['id'] for record in records])
+            deltas = {}
+            for record in records:
+                message_id = record['id']
+                domain = record['domain']
+                previous = known.get(message_id)
+                if previous is not None:
+                    deltas[previous] = deltas.get(previous, 0) - 1
+                known[message_id] = domain
+                deltas[domain] = deltas.get(domain, 0) + 1
+                self._log_change(message_id, domain, record)
+            self._apply(deltas)
+
+    def remove(self, message_ids):
+        with self.lock, GROUPING_SECONDS.time(op='remove'):
+            known = self.store.domains_of(message_ids)
+            if not known:
+                return 0
+            self.version += 1
+            deltas = {}
+            for message_id, domain in known.items():
+                deltas[domain] = deltas.get(domain, 0) - 1
+                self._log_change(message_id, domain, None)
+            self._apply(deltas)
+            return len(known)
+
+    def counts_for(self, domains):
+        with self.lock:
+            return {domain: self.totals.get(domain, 0) for domain in domains}
+
+    def emails_for(self, domain, offset=0, limit=None):
+        return self.store.emails_for(domain, offset, -1 if limit is None else limit)
+
+    def emails_after(self, domain, message_id, limit):
+        return self.store.emails_after(domain, message_id, limit)
+
+    def all_records(self):
+        return self.store.all_records()
@@ -0,0 +1,371 @@
+import time
+import base64
+import random
+import threading
+from collections import Counter
+import httplib2
+from googleapiclient.errors import HttpError
+
+# A small in-memory stand-in for the object returned by get_gmail_service().
+# It mimics the parts of the googleapiclient Gmail resource the app uses so that
+# fetching, batching and failure handling can be exercised without a network:
+#
+#     service = FakeGmailService([make_message('m1', 'Alice <a@foo.com>', 'Hi')])
+#     service.fail('m1', status=429, times=2)  # first two fetches of m1 fail
+#     fetch_metadata_batch(service, ['m1'])
+#
+# generate_mailbox() builds large deterministic mailboxes for benchmarks, and the
+# service can add latency to every HTTP round trip and fail a share of requests.
+
+# history().list historyTypes values and the record keys they produce
+HISTORY_KEYS = {
+    'messageAdded': 'messagesAdded',
+    'messageDeleted': 'messagesDeleted',
+    'labelAdded': 'labelsAdded',
+    'labelRemoved': 'labelsRemoved',
+}
+
+# Build a Gmail message resource with the given headers and a text/plain body
+def make_message(message_id, sender, subject='No Subject', date='', body='', label_ids=None, to=''):
+    headers = [
+        {'name': 'From', 'value': sender},
+        {'name': 'To', 'value': to},
+        {'name': 'Subject', 'value': subject},
+        {'name': 'Date', 'value': date},
+    ]
+    data = base64.urlsafe_b64encode(body.encode('utf-8')).decode('ascii')
+    return {
+        'id': message_id,
+        'threadId': message_id,
+        'labelIds': list(label_ids if label_ids is not None else ['INBOX', 'UNREAD']),
+        'snippet': body[:100],
+        'payload': {
+            'mimeType': 'text/plain',
+            'headers': headers,
+            'body': {'size': len(body), 'data': data},
+        },
+    }
+
+# Create an HttpError carrying the given HTTP status, like googleapiclient raises
+def make_http_error(status, reason='Injected error'):
+    resp = httplib2.Response({'status': status})
+    resp.reason = reason
+    return HttpError(resp, reason.encode('utf-8'))
+
+class FakeRequest:
+    def __init__(self, service, method, fn):
+        self.service = service
+        self.method = method
+        self.fn = fn
+
+    def execute(self):
+        self.service.round_trip()
+        return self.run()
+
+    # Run without a round trip of its own, as part of a batch
+    def run(self):
+        self.service.record_call(self.method)
+        return self.fn()
+
+class FakeBatchHttpRequest:
+    def __init__(self, service, callback=None):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        if request_id is None:
+            request_id = str(len(self.requests) + 1)
+        self.requests.append((request_id, request, callback or self.callback))
+
+    def execute(self):
+        self.service.round_trip()
+        self.service.record_batch(len(self.requests))
+        for request_id, request, callback in self.requests:
+            try:
+                response, exception = request.run(), None
+            except HttpError as e:
+                response, exception = None, e
+            if callback:
+                callback(request_id, response, exception)
+
+class FakeMessagesResource:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, userId='me', q=None, maxResults=100, pageToken=None, **kwargs):
+        def run():
+            matching = self.service.matching_messages(q)
+            start = int(pageToken) if pageToken else 0
+            page = matching[start:start + maxResults]
+            result = {
+                'messages': [{'id': m['id'], 'threadId': m['threadId']} for m in page],
+                'resultSizeEstimate': len(matching),
+            }
+            if start + maxResults < len(matching):
+                result['nextPageToken'] = str(start + maxResults)
+            return result
+        return FakeRequest(self.service, 'messages.list', run)
+
+    def attachments(self):
+        return FakeAttachmentsResource(self.service)
+
+    def get(self, userId='me', id=None, format='full', metadataHeaders=None, **kwargs):
+        def run():
+            self.service.maybe_fail(id)
+            message = self.service.messages.get(id)
+            if message is None:
+                raise make_http_error(404, 'Requested entity was not found.')
+            result = dict(message)
+            if format == 'metadata':
+                payload = message['payload']
+                headers = payload['headers']
+                if metadataHeaders:
+                    wanted = {name.lower() for name in metadataHeaders}
+                    headers = [h for h in headers if h['name'].lower() in wanted]
+                result['payload'] = {'mimeType': payload['mimeType'], 'headers': headers}
+            elif format == 'minimal':
+                result.pop('payload', None)
+            return result
+        return FakeRequest(self.service, 'messages.get', run)
+
+    def modify(self, userId='me', id=None, body=None, **kwargs):
+        def run():
+            self.service.maybe_fail(id)
+            if id not in self.service.messages:
+                raise make_http_error(404, 'Requested entity was not found.')
+            labels = body or {}
+            self.service.change_labels(id, labels.get('addLabelIds', []), labels.get('removeLabelIds', []))
+            return self.service._message_ref(self.service.messages[id])
+        return FakeRequest(self.service, 'messages.modify', run)
+
+    def batchModify(self, userId='me', body=None, **kwargs):
+        def run():
+            ids = body.get('ids', [])
+            if len(ids) > 1000:
+                raise make_http_error(400, 'Too many ids')
+            # All or nothing, like Gmail: check every ID before changing anything
+            self.service.maybe_fail(None)
+            for message_id in ids:
+                self.service.maybe_fail(message_id, inject=False)
+            for message_id in ids:
+                if message_id in self.service.messages:
+                    self.service.change_labels(message_id, body.get('addLabelIds', []), body.get('removeLabelIds', []))
+            return ''
+        return FakeRequest(self.service, 'messages.batchModify', run)
+
+    def trash(self, userId='me', id=None, **kwargs):
+        def run():
+            self.service.maybe_fail(id)
+            if id not in self.service.messages:
+                raise make_http_error(404, 'Requested entity was not found.')
+            self.service.change_labels(id, add=['TRASH'])
+            return self.service._message_ref(self.service.messages[id])
+        return FakeRequest(self.service, 'messages.trash', run)
+
+class FakeAttachmentsResource:
+    def __init__(self, service):
+        self.service = service
+
+    def get(self, userId='me', messageId=None, id=None, **kwargs):
+        def run():
+            data = self.service.attachments.get((messageId, id))
+            if data is None:
+                raise make_http_error(404, 'Requested entity was not found.')
+            return {'attachmentId': id, 'size': len(data), 'data': data}
+        return FakeRequest(self.service, 'messages.attachments.get', run)
+
+class FakeHistoryResource:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, userId='me', startHistoryId=None, historyTypes=None, maxResults=100, pageToken=None, **kwargs):
+        def run():
+            start = int(startHistoryId)
+            if start < self.service.oldest_history_id:
+                raise make_http_error(404, 'Requested entity was not found.')
+            records = [r for r in self.service.history if int(r['id']) > start]
+            if historyTypes:
+                wanted = {HISTORY_KEYS[t] for t in historyTypes}
+                records = [r for r in records if wanted & set(r)]
+            offset = int(pageToken) if pageToken else 0
+            page = records[offset:offset + maxResults]
+            result = {'historyId': str(self.service.history_id)}
+            if page:
+                result['history'] = page
+            if offset + maxResults < len(records):
+                result['nextPageToken'] = str(offset + maxResults)
+            return result
+        return FakeRequest(self.service, 'history.list', run)
+
+class FakeUsersResource:
+    def __init__(self, service):
+        self.service = service
+
+    def messages(self):
+        return FakeMessagesResource(self.service)
+
+    def history(self):
+        return FakeHistoryResource(self.service)
+
+    def getProfile(self, userId='me'):
+        def run():
+            return {
+                'emailAddress': 'me@example.com',
+                'messagesTotal': len(self.service.messages),
+                'historyId': str(self.service.history_id),
+            }
+        return FakeRequest(self.service, 'getProfile', run)
+
+class FakeGmailService:
+    # `latency` is added to every HTTP round trip (a call or a whole batch), and
+    # `error_rate` of message requests fail with `error_status`, chosen by a seeded RNG
+    def __init__(self, messages=None, latency=0.0, error_rate=0.0, error_status=429, seed=0):
+        self.messages = {}
+        for message in messages or []:
+            self.messages[message['id']] = message
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.version = 0  # Bumped on every mailbox change, for caching list results
+        self.list_cache = {}
+        self.failures = {}
+        self.attachments = {}  # (message_id, attachment_id) -> base64url data
+        self.calls = Counter()
+        self.batches = []
+        self.lock = threading.Lock()
+        self.history = []
+        self.history_id = 1000
+        self.oldest_history_id = self.history_id
+
+    def users(self):
+        return FakeUsersResource(self)
+
+    def _record_history(self, key, entry):
+        self.version += 1
+        self.history_id += 1
+        self.history.append({'id': str(self.history_id), key: [entry]})
+
+    def _message_ref(self, message):
+        return {'id': message['id'], 'threadId': message['threadId'], 'labelIds': list(message['labelIds'])}
+
+    # Mailbox changes that show up in history().list
+    def add_message(self, message):
+        with self.lock:
+            self.messages[message['id']] = message
+            self._record_history('messagesAdded', {'message': self._message_ref(message)})
+
+    def delete_message(self, message_id):
+        with self.lock:
+            message = self.messages.pop(message_id)
+            self._record_history('messagesDeleted', {'message': self._message_ref(message)})
+
+    def change_labels(self, message_id, add=(), remove=()):
+        with self.lock:
+            message = self.messages[message_id]
+            added = [label for label in add if label not in message['labelIds']]
+            removed = [label for label in remove if label in message['labelIds']]
+            message['labelIds'] = [label for label in message['labelIds'] if label not in removed] + added
+            if added:
+                self._record_history('labelsAdded', {'message': self._message_ref(message), 'labelIds': added})
+            if removed:
+                self._record_history('labelsRemoved', {'message': self._message_ref(message), 'labelIds': removed})
+
+    # Forget all history so far, as Gmail does after about a week
+    def expire_history(self):
+        with self.lock:
+            self.history = []
+            self.oldest_history_id = self.history_id + 1
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatchHttpRequest(self, callback=callback)
+
+    # Make the next `times` fetches of a message fail with the given status
+    def fail(self, message_id, status=500, times=1):
+        self.failures[message_id] = [status, times]
+
+    # Raise the scripted failure for a message, or an injected one (once per request)
+    def maybe_fail(self, message_id, inject=True):
+        with self.lock:
+            if inject and self.error_rate and self.random.random() < self.error_rate:
+                self.calls[f'injected_{self.error_status}'] += 1
+                raise make_http_error(self.error_status, 'Injected rate limit')
+            failure = self.failures.get(message_id)
+            if not failure or failure[1] <= 0:
+                return
+            failure[1] -= 1
+        raise make_http_error(failure[0])
+
+    def round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def record_call(self, method):
+        with self.lock:
+            self.calls[method] += 1
+
+    def record_batch(self, size):
+        with self.lock:
+            self.calls['batch'] += 1
+            self.batches.append(size)
+
+    def ordered_messages(self):
+        return list(self.messages.values())
+
+    # Messages matching a query, cached until the mailbox changes
+    def matching_messages(self, query):
+        key = (query, self.version, len(self.messages))
+        with self.lock:
+            matching = self.list_cache.get(key)
+        if matching is None:
+            matching = [m for m in self.ordered_messages() if self.matches(m, query)]
+            with self.lock:
+                self.list_cache = {key: matching}
+        return matching
+
+    def sender_of(self, message):
+        for header in message['payload']['headers']:
+            if header['name'] == 'From':
+                return header['value']
+        return ''
+
+    # Minimal support for the search operators the app uses
+    def matches(self, message, query):
+        for term in (query or '').split():
+            if term == 'is:unread' and 'UNREAD' not in message['labelIds']:
+                return False
+            if term.startswith('from:') and term[5:].lower() not in self.sender_of(message).lower():
+                return False
+        # Like Gmail, searches skip trash and spam
+        return not {'TRASH', 'SPAM'} & set(message['labelIds'])
+
+# Build a deterministic FakeGmailService with `size` unread messages for benchmarks.
+#
+# Senders come from `domains` domains with a Zipf-like skew (the domain of rank r
+# gets weight 1 / r**skew), so a few domains hold most of the mail as in real
+# inboxes. Bodies are `body_bytes` long; a handful of them are shared between
+# messages so a large mailbox doesn't spend its memory on fake bodies.
+def generate_mailbox(size, domains=200, skew=1.1, body_bytes=2000, seed=0, **service_options):
+    rng = random.Random(seed)
+    names = [f'sender{rank}.example.com' for rank in range(1, domains + 1)]
+    weights = [1 / rank ** skew for rank in range(1, domains + 1)]
+    chosen = rng.choices(names, weights=weights, k=size)
+
+    bodies = []
+    for variant in range(16):
+        text = f'Message body variant {variant}. ' + ''.join(rng.choice('abcdefghij klmnopqrstuvwxyz\n') for _ in range(body_bytes))
+        text = text[:body_bytes]
+        bodies.append({'size': len(text), 'data': base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')})
+
+    messages = []
+    for number, domain in enumerate(chosen):
+        message = make_message(
+            f'msg{number:07d}',
+            f'Sender {number % 97} <user{number % 13}@{domain}>',
+            f'Subject {number}',
+            f'Mon, {number % 28 + 1} Sep 2026 10:{number % 60:02d}:00 +0000'
+        )
+        message['payload']['body'] = bodies[number % len(bodies)]
+        messages.append(message)
+    return FakeGmailService(messages, seed=seed, **service_options)
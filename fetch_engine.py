@@ -0,0 +1,226 @@
+import time
+import queue
+import logging
+import contextlib
+import threading
+from gmail_batch import fetch_metadata_batch
+
+logger = logging.getLogger('gmail_organizer')
+
+# Gmail API quota units charged per call (https://developers.google.com/gmail/api/reference/quota)
+QUOTA_UNITS = {
+    'messages.list': 5,
+    'messages.get': 5,
+    'messages.attachments.get': 5,
+    'messages.batchModify': 50,
+    'messages.trash': 5,
+    'history.list': 2,
+    'getProfile': 1,
+}
+GMAIL_USER_QUOTA_PER_SECOND = 250  # Per-user limit enforced by Gmail
+
+# Thread-safe token bucket metering Gmail quota units.
+# Requests larger than the bucket wait for a full bucket and then go into debt,
+# so a 50-message batch (250 units) still works with a smaller capacity.
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.condition = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    # Block until `units` can be spent; returns the number of seconds spent waiting
+    def acquire(self, units):
+        needed = min(float(units), self.capacity)
+        waited = 0.0
+        with self.condition:
+            self._refill()
+            while self.tokens < needed:
+                delay = (needed - self.tokens) / self.rate
+                self.condition.wait(delay)
+                waited += delay
+                self._refill()
+            self.tokens -= units
+        return waited
+
+    # Units currently available without waiting
+    def available(self):
+        with self.condition:
+            self._refill()
+            return max(0.0, self.tokens)
+
+# Spends units from several token buckets together, e.g. an account's own per-user
+# quota and the budget shared by every account
+class CompositeBucket:
+    def __init__(self, *buckets):
+        self.buckets = buckets
+
+    def acquire(self, units):
+        return sum(bucket.acquire(units) for bucket in self.buckets)
+
+    def available(self):
+        return min(bucket.available() for bucket in self.buckets)
+
+# Fetches unread messages with one lister thread and a pool of detail fetchers.
+#
+# The lister walks messages.list pages and hands message IDs to the workers in
+# chunks. Every call goes through the RequestScheduler, which spends quota, retries
+# rate-limit and transient errors, and sets the page size and chunk width it sees fit.
+# Completed pages are delivered to `on_page(records, next_page_token)` strictly in
+# list order, so the token passed along is always a safe place to resume from.
+# Engines of different accounts can share a `slots` semaphore that caps the Gmail
+# calls they have in flight together. `fetch_metadata(service, message_ids, stats)`
+# replaces the batch requests of gmail_batch, e.g. with the asyncio REST engine.
+class FetchEngine:
+    def __init__(self, service_factory, on_page, scheduler,
+                 workers=4, query='is:unread', max_messages=None, should_pause=None,
+                 build_record=None, slots=None, fetch_metadata=None):
+        self.service_factory = service_factory
+        self.on_page = on_page
+        self.scheduler = scheduler
+        self.workers = max(1, workers)
+        self.query = query
+        self.max_messages = max_messages
+        self.should_pause = should_pause or (lambda: False)
+        self.build_record = build_record or (lambda msg: msg)
+        self.slots = slots or contextlib.nullcontext()
+        self.fetch_metadata = fetch_metadata or (
+            lambda service, message_ids, stats: fetch_metadata_batch(service, message_ids, batch_size=len(message_ids), stats=stats)
+        )
+
+        self.work_queue = queue.Queue(maxsize=self.workers * 2)
+        self.lock = threading.Lock()
+        self.pages = {}
+        self.next_page_to_deliver = 0
+        self.error = None
+        self.stopped = threading.Event()
+
+    # Run until the mailbox is exhausted, the message limit is hit, the fetch is
+    # paused or an error occurs. Returns 'complete', 'limit' or 'paused'.
+    def run(self, page_token=None):
+        threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            reason = self._list_pages(page_token)
+        except Exception as e:
+            self._fail(e)
+            reason = 'error'
+        finally:
+            # Let the workers drain what was already listed, then shut them down
+            for _ in threads:
+                self.work_queue.put(None)
+            for thread in threads:
+                thread.join()
+
+        if self.error:
+            raise self.error
+        return reason
+
+    def _list_pages(self, page_token):
+        service = self.service_factory()
+        listed = 0
+        page_number = 0
+
+        while not self.stopped.is_set():
+            if self.should_pause():
+                logger.info("Fetch engine paused; finishing messages already listed")
+                return 'paused'
+
+            request = service.users().messages().list(
+                userId='me',
+                q=self.query,
+                maxResults=self.scheduler.page_size.value,
+                pageToken=page_token
+            )
+            with self.slots:
+                results = self.scheduler.execute('messages.list', request)
+
+            message_ids = [msg['id'] for msg in results.get('messages', [])]
+            page_token = results.get('nextPageToken')
+            listed += len(message_ids)
+            logger.info(f"Listed page {page_number} with {len(message_ids)} messages, next page token: {page_token}")
+
+            width = self.scheduler.batch_width.value
+            chunks = [message_ids[i:i + width] for i in range(0, len(message_ids), width)]
+            with self.lock:
+                self.pages[page_number] = {
+                    'remaining': len(chunks),
+                    'records': {},
+                    'order': message_ids,
+                    'next_page_token': page_token,
+                }
+            if not chunks:
+                self._deliver_completed_pages()
+            for chunk in chunks:
+                self.work_queue.put((page_number, chunk))
+            page_number += 1
+
+            if not page_token or not message_ids:
+                return 'complete'
+            if self.max_messages is not None and listed >= self.max_messages:
+                logger.info(f"Fetch engine reached the limit of {self.max_messages} messages")
+                return 'limit'
+
+        return 'error'
+
+    def _worker(self):
+        service = None
+        while True:
+            item = self.work_queue.get()
+            if item is None:
+                return
+            if self.stopped.is_set():
+                continue
+
+            page_number, chunk = item
+            try:
+                if service is None:
+                    service = self.service_factory()
+                self.scheduler.charge('messages.get', len(chunk))
+                stats = {}
+                with self.slots:
+                    details, failed_ids = self.fetch_metadata(service, chunk, stats)
+                self.scheduler.record_batch('messages.get', len(chunk), stats)
+                if failed_ids:
+                    logger.warning(f"Skipping {len(failed_ids)} messages whose metadata could not be fetched")
+                records = [self.build_record(msg_detail) for msg_detail in details]
+            except Exception as e:
+                self._fail(e)
+                continue
+
+            with self.lock:
+                page = self.pages[page_number]
+                for record in records:
+                    page['records'][record['id']] = record
+                page['remaining'] -= 1
+            self._deliver_completed_pages()
+
+    # Hand every finished page at the head of the line to on_page, in list order
+    def _deliver_completed_pages(self):
+        with self.lock:
+            while not self.stopped.is_set():
+                page = self.pages.get(self.next_page_to_deliver)
+                if page is None or page['remaining'] > 0:
+                    return
+                del self.pages[self.next_page_to_deliver]
+                self.next_page_to_deliver += 1
+                records = [page['records'][message_id] for message_id in page['order'] if message_id in page['records']]
+                try:
+                    self.on_page(records, page['next_page_token'])
+                except Exception as e:
+                    self.error = self.error or e
+                    self.stopped.set()
+
+    def _fail(self, exception):
+        logger.error(f"Fetch engine stopping after error: {exception}", exc_info=True)
+        with self.lock:
+            self.error = self.error or exception
+        self.stopped.set()
@@ -0,0 +1,61 @@
+import json
+import threading
+from collections import deque
+
+EVENT_BUFFER_SIZE = 1000  # Events kept for clients reconnecting with Last-Event-ID
+KEEPALIVE_SECONDS = 15  # Send a comment line this often so dead connections get noticed
+
+# In-process publisher for Server-Sent Events.
+#
+# Producers call publish(); every /fetch-events connection waits on the condition
+# for events with an ID above the last one it sent. The last EVENT_BUFFER_SIZE events
+# are kept, so a client that reconnects with Last-Event-ID after a short drop gets
+# exactly what it missed; one that was gone longer is told to reload with 'reset'.
+class EventBroadcaster:
+    def __init__(self, buffer_size=EVENT_BUFFER_SIZE):
+        self.events = deque(maxlen=buffer_size)  # (event_id, event_type, payload)
+        self.last_id = 0
+        self.condition = threading.Condition()
+
+    def publish(self, event_type, data):
+        payload = json.dumps(data)
+        with self.condition:
+            self.last_id += 1
+            self.events.append((self.last_id, event_type, payload))
+            self.condition.notify_all()
+        return self.last_id
+
+    # Events after `last_event_id`, or None if some of them have already been dropped
+    def events_since(self, last_event_id):
+        with self.condition:
+            if last_event_id > self.last_id:
+                return None
+            if self.events and last_event_id < self.events[0][0] - 1:
+                return None
+            return [event for event in self.events if event[0] > last_event_id]
+
+    # Block until there are events after `last_event_id` or the timeout runs out
+    def wait(self, last_event_id, timeout=KEEPALIVE_SECONDS):
+        with self.condition:
+            self.condition.wait_for(lambda: self.last_id != last_event_id, timeout=timeout)
+        return self.events_since(last_event_id)
+
+    # Generator of SSE-formatted chunks for one client connection
+    def stream(self, last_event_id=None):
+        if last_event_id is None:
+            # New connections start from now; the page already has the current state
+            last_event_id = self.last_id
+        yield 'retry: 3000\n\n'
+        while True:
+            events = self.wait(last_event_id)
+            if events is None:
+                # The client missed events we no longer have (or the server restarted)
+                last_event_id = self.last_id
+                yield f'id: {last_event_id}\nevent: reset\ndata: {{}}\n\n'
+                continue
+            if not events:
+                yield ': keepalive\n\n'
+                continue
+            for event_id, event_type, payload in events:
+                yield f'id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n'
+                last_event_id = event_id
@@ -0,0 +1,199 @@
+import time
+import logging
+from email.utils import parseaddr
+from gmail_batch import is_retryable, retry_after_seconds, backoff_delay
+
+logger = logging.getLogger('gmail_organizer')
+
+BATCH_MODIFY_LIMIT = 1000  # Most IDs users.messages.batchModify accepts in one call
+TRASH_BATCH_SIZE = 50  # Trash calls per batch HTTP request; Gmail recommends at most 50
+ACTION_MAX_RETRIES = 3  # Extra attempts for a chunk that failed with a retryable error
+ACTION_RETRY_DELAY = 1.0  # Base delay in seconds between attempts (doubled each time, with jitter)
+LIST_IDS_PAGE_SIZE = 500  # Largest maxResults messages.list accepts
+RULE_SCOPE = 'is:unread'  # Search the listing is built from; domain and sender rules stay within it
+
+# Label changes behind the actions that map onto batchModify
+MODIFY_ACTIONS = {
+    'read': {'removeLabelIds': ['UNREAD']},
+    'archive': {'removeLabelIds': ['INBOX']},
+}
+TRASH_ACTION = 'delete'
+ACTION_TYPES = tuple(MODIFY_ACTIONS) + (TRASH_ACTION,)
+# Label change that moves messages to the trash like messages.trash does, for bulk rules
+TRASH_MODIFY = {'addLabelIds': ['TRASH']}
+RULE_SELECTORS = ('domain', 'sender', 'query')
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+# Gmail search for a bulk rule. A domain matches its senders' addresses (and, with
+# registrable grouping, those of its subdomains), a sender matches its address, and a
+# query is used as given. Domain and sender rules are limited to `scope`. Returns None
+# for selectors Gmail cannot search for, such as the catch-all "Other" domain.
+def rule_query(selector, value, scope=RULE_SCOPE, registrable=False):
+    value = (value or '').strip()
+    if selector == 'query':
+        return value or None
+    if selector == 'domain':
+        if '.' not in value or ' ' in value:
+            return None
+        term = f'from:{value}' if registrable else f'from:@{value}'
+    elif selector == 'sender':
+        address = parseaddr(value)[1]
+        if '@' not in address or ' ' in address:
+            return None
+        term = f'from:{address}'
+    else:
+        raise ValueError(f"Unknown selector: {selector}")
+    return f'{term} {scope}' if scope else term
+
+# IDs of the messages matching the Gmail search `query`, newest first, read from
+# messages.list pages that only carry IDs. Stops after `limit` IDs when given.
+def list_message_ids(service, query, scheduler=None, page_size=LIST_IDS_PAGE_SIZE, limit=None):
+    message_ids = []
+    page_token = None
+    while limit is None or len(message_ids) < limit:
+        request = service.users().messages().list(
+            userId='me',
+            q=query,
+            maxResults=page_size,
+            pageToken=page_token,
+            fields='messages/id,nextPageToken'
+        )
+        response = scheduler.execute('messages.list', request) if scheduler else request.execute()
+        message_ids.extend(message['id'] for message in response.get('messages', []))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+    return message_ids if limit is None else message_ids[:limit]
+
+# Run `attempt_fn` until it reports nothing left to retry or the retries run out.
+# attempt_fn(pending) returns the IDs to retry and the Retry-After Gmail sent, if any.
+def _with_retries(attempt_fn, pending, max_retries, retry_delay, description):
+    attempt = 0
+    retry_after = None
+    while pending:
+        if attempt > 0:
+            if attempt > max_retries:
+                break
+            delay = backoff_delay(attempt, retry_delay, retry_after)
+            logger.info(f"Retrying {description} for {len(pending)} messages in {delay:.1f}s (attempt {attempt})")
+            time.sleep(delay)
+        pending, retry_after = attempt_fn(pending)
+        attempt += 1
+    return pending
+
+# Apply a label change to up to BATCH_MODIFY_LIMIT messages with one batchModify call.
+# batchModify is all-or-nothing, so the chunk either succeeds or fails as a whole.
+def _modify_chunk(service, message_ids, body, scheduler, max_retries, retry_delay, report):
+    def attempt(pending):
+        if scheduler:
+            scheduler.charge('messages.batchModify')
+        try:
+            service.users().messages().batchModify(userId='me', body=dict(body, ids=pending)).execute()
+            report['error'] = None
+            return [], None
+        except Exception as e:
+            report['error'] = str(e)
+            if not is_retryable(e):
+                logger.error(f"batchModify failed for {len(pending)} messages: {e}")
+                return [], None
+            logger.warning(f"batchModify failed for {len(pending)} messages, will retry: {e}")
+            if scheduler:
+                scheduler.record_error('messages.batchModify', e)
+            return pending, retry_after_seconds(e)
+
+    _with_retries(attempt, list(message_ids), max_retries, retry_delay, 'batchModify')
+    return [] if report['error'] else list(message_ids)
+
+# Move up to TRASH_BATCH_SIZE messages to the trash with one batch HTTP request.
+# Each sub-request succeeds or fails on its own; retryable failures are tried again.
+def _trash_chunk(service, message_ids, scheduler, max_retries, retry_delay, report):
+    trashed = []
+    errors = {}
+
+    def attempt(pending):
+        retry_ids = []
+        retry_after = []
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                trashed.append(request_id)
+                errors.pop(request_id, None)
+            else:
+                errors[request_id] = str(exception)
+                if is_retryable(exception):
+                    retry_ids.append(request_id)
+                    retry_after.append(retry_after_seconds(exception) or 0.0)
+                    if scheduler:
+                        scheduler.record_error('messages.trash', exception)
+                else:
+                    logger.warning(f"Could not move message {request_id} to trash: {exception}")
+
+        if scheduler:
+            scheduler.charge('messages.trash', len(pending))
+        batch = service.new_batch_http_request(callback=callback)
+        messages = service.users().messages()
+        for message_id in pending:
+            batch.add(messages.trash(userId='me', id=message_id), request_id=message_id)
+        try:
+            batch.execute()
+        except Exception as e:
+            logger.warning(f"Batch trash request for {len(pending)} messages failed: {e}")
+            done = set(trashed)
+            for message_id in pending:
+                if message_id not in done:
+                    errors[message_id] = str(e)
+            if not is_retryable(e):
+                return [], None
+            if scheduler:
+                scheduler.record_error('messages.trash', e)
+            return [message_id for message_id in pending if message_id not in done], retry_after_seconds(e)
+        return retry_ids, max(retry_after, default=None)
+
+    _with_retries(attempt, list(message_ids), max_retries, retry_delay, 'trash')
+    if errors:
+        report['error'] = f"{len(errors)} of {len(message_ids)} messages failed: {next(iter(errors.values()))}"
+        report['failed_ids'] = list(errors)
+    return trashed
+
+# Apply an action from the /action form to many messages at once.
+#
+# 'read' and 'archive' go through users.messages.batchModify in chunks of
+# BATCH_MODIFY_LIMIT IDs; 'delete' moves messages to the trash with batched
+# messages.trash calls, or with batchModify adding the TRASH label when
+# `trash_with_modify` is set (50 quota units per 1000 messages instead of 5 per
+# message, which is what makes bulk rules over whole domains fast). Returns
+# (processed_ids, chunk_reports), where every chunk report says how many messages it
+# covered, how many succeeded and the last error. Quota is spent through `scheduler`,
+# which also hears about rate-limit errors.
+def apply_action(service, action_type, message_ids, scheduler=None,
+                 max_retries=ACTION_MAX_RETRIES, retry_delay=ACTION_RETRY_DELAY, trash_with_modify=False):
+    message_ids = list(dict.fromkeys(message_ids))
+    if action_type in MODIFY_ACTIONS:
+        body = MODIFY_ACTIONS[action_type]
+    elif action_type == TRASH_ACTION:
+        body = TRASH_MODIFY if trash_with_modify else None
+    else:
+        raise ValueError(f"Unknown action: {action_type}")
+
+    processed = []
+    reports = []
+    chunk_size = TRASH_BATCH_SIZE if body is None else BATCH_MODIFY_LIMIT
+    for number, chunk in enumerate(_chunks(message_ids, chunk_size)):
+        report = {'chunk': number, 'size': len(chunk), 'succeeded': 0, 'error': None}
+        if body is None:
+            done = _trash_chunk(service, chunk, scheduler, max_retries, retry_delay, report)
+        else:
+            done = _modify_chunk(service, chunk, body, scheduler, max_retries, retry_delay, report)
+        report['succeeded'] = len(done)
+        if report['error'] and 'failed_ids' not in report:
+            succeeded = set(done)
+            report['failed_ids'] = [message_id for message_id in chunk if message_id not in succeeded]
+        processed.extend(done)
+        reports.append(report)
+
+    failed_chunks = sum(1 for report in reports if report['error'])
+    logger.info(f"{action_type} applied to {len(processed)} of {len(message_ids)} messages in {len(reports)} chunks ({failed_chunks} with errors)")
+    return processed, reports
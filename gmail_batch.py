@@ -0,0 +1,157 @@
+import time
+import random
+import logging
+from email.utils import parsedate_to_datetime
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger('gmail_organizer')
+
+METADATA_HEADERS = ['From', 'Subject', 'Date']
+METADATA_BATCH_SIZE = 50  # Gmail allows 100 calls per batch, but recommends staying at or below 50
+METADATA_MAX_RETRIES = 3  # Number of extra rounds for sub-requests that failed
+METADATA_RETRY_DELAY = 1.0  # Base delay in seconds between retry rounds (doubled each round, with jitter)
+BACKOFF_MAX_DELAY = 60.0  # Longest backoff between attempts, unless Gmail asks for more with Retry-After
+FULL_BATCH_SIZE = 10  # Full messages are large, so keep batch responses small
+
+# Status codes worth retrying; anything else (e.g. 404 for a deleted message) is final.
+# A 403 is retried only when it is a rate limit (see is_throttled); other 403s, such as
+# a missing permission, fail at once.
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# Error reasons of a 403 that mean Gmail is throttling rather than refusing the request
+RATE_LIMIT_REASONS = (b'ratelimitexceeded', b'userratelimitexceeded')
+
+# Decide whether a failed sub-request should be retried
+def is_retryable(exception):
+    if isinstance(exception, HttpError):
+        return exception.resp.status in RETRYABLE_STATUSES or is_throttled(exception)
+    # Transport level errors (timeouts, connection resets) are worth another try
+    return True
+
+# Whether Gmail turned the request down for going over a rate limit
+def is_throttled(exception):
+    if not isinstance(exception, HttpError):
+        return False
+    if exception.resp.status == 429:
+        return True
+    content = (exception.content or b'').lower()
+    return exception.resp.status == 403 and any(reason in content for reason in RATE_LIMIT_REASONS)
+
+# Seconds to wait according to the Retry-After header of an error response, or None
+def retry_after_seconds(exception):
+    if not isinstance(exception, HttpError):
+        return None
+    value = exception.resp.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+# Delay before retry number `attempt` (1 for the first retry): exponential with jitter,
+# so workers that failed together do not retry together, and never shorter than a
+# Retry-After the server sent
+def backoff_delay(attempt, base, retry_after=None, cap=BACKOFF_MAX_DELAY):
+    ceiling = min(cap, base * (2 ** (attempt - 1)))
+    delay = ceiling / 2 + random.uniform(0, ceiling / 2)
+    return max(delay, retry_after or 0.0)
+
+METADATA_REQUEST = {'format': 'metadata', 'metadataHeaders': METADATA_HEADERS}
+FULL_REQUEST = {'format': 'full'}
+
+# Record a failed (sub-)request in the `stats` of fetch_metadata_batch
+def count_error(stats, exception):
+    stats['errors'] += 1
+    if is_throttled(exception):
+        stats['throttled'] += 1
+    retry_after = retry_after_seconds(exception)
+    if retry_after is not None:
+        stats['retry_after'] = max(stats['retry_after'] or 0.0, retry_after)
+
+# Execute one Gmail batch HTTP request for a chunk of message IDs.
+# Successful responses are stored in `results`; the IDs that should be retried are returned.
+def _execute_metadata_chunk(service, message_ids, results, request_kwargs, stats):
+    retry_ids = []
+
+    def callback(request_id, response, exception):
+        if exception is None:
+            results[request_id] = response
+            return
+        count_error(stats, exception)
+        if is_retryable(exception):
+            logger.debug(f"Retryable error fetching message {request_id}: {exception}")
+            retry_ids.append(request_id)
+        else:
+            logger.warning(f"Giving up on message {request_id}: {exception}")
+
+    batch = service.new_batch_http_request(callback=callback)
+    messages = service.users().messages()
+    for message_id in message_ids:
+        batch.add(messages.get(userId='me', id=message_id, **request_kwargs), request_id=message_id)
+
+    start = time.perf_counter()
+    try:
+        batch.execute()
+    except Exception as e:
+        # The whole batch failed to go out, so every message that has no answer yet gets retried
+        logger.warning(f"Batch request for {len(message_ids)} messages failed: {e}")
+        count_error(stats, e)
+        retry_ids = [message_id for message_id in message_ids if message_id not in results]
+    finally:
+        stats['requests'] += 1
+        stats['request_seconds'] += time.perf_counter() - start
+
+    return retry_ids
+
+# Fetch metadata (From/Subject/Date) for a list of message IDs using Gmail batch requests.
+# Returns the message resources in the same order as `message_ids` together with the IDs
+# that could not be fetched (permanent errors or retries exhausted). If a `stats` dict is
+# given it is filled with the batch requests made, the seconds they took, the errors and
+# rate-limit errors among their sub-requests, and the longest Retry-After seen.
+def fetch_metadata_batch(service, message_ids,
+                         batch_size=METADATA_BATCH_SIZE,
+                         max_retries=METADATA_MAX_RETRIES,
+                         retry_delay=METADATA_RETRY_DELAY,
+                         request_kwargs=METADATA_REQUEST,
+                         stats=None):
+    results = {}
+    pending = list(dict.fromkeys(message_ids))
+    attempt = 0
+    if stats is None:
+        stats = {}
+    stats.update(requests=0, request_seconds=0.0, errors=0, throttled=0, retry_after=None)
+
+    while pending:
+        if attempt > 0:
+            if attempt > max_retries:
+                break
+            delay = backoff_delay(attempt, retry_delay, stats['retry_after'])
+            logger.info(f"Retrying metadata fetch for {len(pending)} messages in {delay:.1f}s (attempt {attempt})")
+            time.sleep(delay)
+
+        failed = []
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            failed.extend(_execute_metadata_chunk(service, chunk, results, request_kwargs, stats))
+
+        logger.debug(f"Metadata batch round {attempt}: {len(pending) - len(failed)} fetched, {len(failed)} to retry")
+        pending = failed
+        attempt += 1
+
+    if pending:
+        logger.error(f"Could not fetch metadata for {len(pending)} messages after {max_retries} retries")
+
+    unique_ids = list(dict.fromkeys(message_ids))
+    fetched = [results[message_id] for message_id in unique_ids if message_id in results]
+    failed = [message_id for message_id in unique_ids if message_id not in results]
+    return fetched, failed
+
+# Fetch complete messages (headers and body parts) the same way, in smaller batches
+def fetch_full_batch(service, message_ids, batch_size=FULL_BATCH_SIZE,
+                     max_retries=METADATA_MAX_RETRIES, retry_delay=METADATA_RETRY_DELAY):
+    return fetch_metadata_batch(service, message_ids, batch_size, max_retries, retry_delay, FULL_REQUEST)
@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import logging
+import weakref
+import threading
+from datetime import datetime, timezone
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+from metrics import Counter, Histogram
+
+logger = logging.getLogger('gmail_organizer')
+
+REFRESH_MARGIN = 300  # Refresh the access token this many seconds before it expires
+REFRESH_CHECK_INTERVAL = 60  # How often the refresher wakes up when there is nothing to do
+
+API_CALLS = Counter('gmail_api_calls_total', 'Gmail API calls by method and HTTP status', ['method', 'status'])
+API_LATENCY = Histogram('gmail_api_request_duration_seconds', 'Gmail API HTTP round trips; batches count once as method="batch"', ['method'])
+
+# 'gmail.users.messages.list' -> 'messages.list', matching the QUOTA_UNITS keys
+def api_method_name(request):
+    method_id = getattr(request, 'methodId', None) or 'unknown'
+    return method_id[len('gmail.users.'):] if method_id.startswith('gmail.users.') else method_id
+
+def api_status(exception):
+    if exception is None:
+        return '200'
+    if isinstance(exception, HttpError):
+        return str(exception.resp.status)
+    return 'error'
+
+# HttpRequest that records its method, status and latency
+class InstrumentedHttpRequest(HttpRequest):
+    def execute(self, http=None, num_retries=0):
+        method = api_method_name(self)
+        start = time.perf_counter()
+        exception = None
+        try:
+            return super().execute(http=http, num_retries=num_retries)
+        except Exception as e:
+            exception = e
+            raise
+        finally:
+            API_LATENCY.observe(time.perf_counter() - start, method=method)
+            API_CALLS.inc(method=method, status=api_status(exception))
+
+# Wraps a BatchHttpRequest so every sub-request is counted with its own status
+class InstrumentedBatch:
+    def __init__(self, batch, callback=None):
+        self.batch = batch
+        self.callback = callback
+
+    def add(self, request, callback=None, request_id=None):
+        target = callback or self.callback
+        method = api_method_name(request)
+
+        def record(request_id, response, exception):
+            API_CALLS.inc(method=method, status=api_status(exception))
+            if target is not None:
+                target(request_id, response, exception)
+
+        self.batch.add(request, callback=record, request_id=request_id)
+
+    def execute(self, http=None):
+        with API_LATENCY.time(method='batch'):
+            return self.batch.execute(http=http)
+
+def instrument_batches(service):
+    new_batch = service.new_batch_http_request
+    service.new_batch_http_request = lambda callback=None: InstrumentedBatch(new_batch(), callback)
+    return service
+
+# Releases a service back to the pool when the thread that leased it goes away
+class _Lease:
+    def __init__(self, pool, service):
+        self.service = service
+        weakref.finalize(self, pool._release, service)
+
+# Per-thread pool of Gmail API clients sharing one set of credentials.
+#
+# googleapiclient service objects are not thread-safe, so every thread gets a client of
+# its own. When a thread exits (as Flask request threads do) its client goes back on an
+# idle list for the next thread instead of being thrown away. The discovery document is
+# parsed once, and a background thread refreshes the access token before it expires so
+# no request waits on discovery or on an OAuth refresh.
+class GmailClientPool:
+    def __init__(self, token_file, client_secrets_file, scopes):
+        self.token_file = token_file
+        self.client_secrets_file = client_secrets_file
+        self.scopes = scopes
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.idle = []
+        self.credentials = None
+        self.discovery_doc = None
+        self.refresher = None
+        self.stats = {
+            'builds': 0,
+            'reuses': 0,
+            'build_seconds': 0.0,
+            'setup_seconds': 0.0,
+            'refreshes': 0,
+            'refresh_errors': 0,
+        }
+
+    # Load credentials from the token file, refreshing or re-authorizing as needed
+    def _load_credentials(self):
+        logger.info("Authenticating with Google")
+        creds = None
+        if os.path.exists(self.token_file):
+            logger.info(f"Found existing {self.token_file} file")
+            start = time.perf_counter()
+            creds = Credentials.from_authorized_user_file(self.token_file, self.scopes)
+            self.stats['setup_seconds'] += time.perf_counter() - start
+        if creds and not creds.valid and creds.refresh_token:
+            try:
+                creds.refresh(Request())
+                self._save_credentials(creds)
+            except Exception as e:
+                logger.warning(f"Could not refresh stored credentials: {e}")
+        if not creds or not creds.valid:
+            logger.info("No valid credentials found, initiating OAuth flow")
+            flow = InstalledAppFlow.from_client_secrets_file(self.client_secrets_file, self.scopes)
+            # Request offline access and force approval prompt to get refresh token
+            creds = flow.run_local_server(port=0, access_type='offline')
+            self._save_credentials(creds)
+            logger.info(f"New credentials obtained and saved to {self.token_file}")
+        return creds
+
+    def _save_credentials(self, creds):
+        with open(self.token_file, 'w') as token:
+            token.write(creds.to_json())
+
+    def _ensure_ready(self):
+        with self.lock:
+            if self.credentials is None:
+                self.credentials = self._load_credentials()
+            if self.discovery_doc is None:
+                # Parse the bundled discovery document once instead of on every build
+                start = time.perf_counter()
+                self.discovery_doc = json.loads(get_static_doc('gmail', 'v1'))
+                self.stats['setup_seconds'] += time.perf_counter() - start
+            if self.refresher is None:
+                self.refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+                self.refresher.start()
+
+    def _build(self):
+        start = time.perf_counter()
+        service = build_from_document(
+            self.discovery_doc,
+            credentials=self.credentials,
+            requestBuilder=InstrumentedHttpRequest
+        )
+        instrument_batches(service)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.stats['builds'] += 1
+            self.stats['build_seconds'] += elapsed
+        logger.info(f"Built Gmail API client in {elapsed * 1000:.1f}ms")
+        return service
+
+    def _release(self, service):
+        with self.lock:
+            self.idle.append(service)
+
+    # The Gmail client for the calling thread
+    def get_service(self):
+        lease = getattr(self.local, 'lease', None)
+        if lease is not None:
+            with self.lock:
+                self.stats['reuses'] += 1
+            return lease.service
+
+        self._ensure_ready()
+        with self.lock:
+            service = self.idle.pop() if self.idle else None
+            if service is not None:
+                self.stats['reuses'] += 1
+        if service is None:
+            service = self._build()
+        self.local.lease = _Lease(self, service)
+        return service
+
+    # The current OAuth access token, for clients that call the REST API themselves
+    def access_token(self):
+        self._ensure_ready()
+        return self.credentials.token
+
+    # Refresh the shared credentials shortly before they expire
+    def _refresh_loop(self):
+        while True:
+            creds = self.credentials
+            delay = REFRESH_CHECK_INTERVAL
+            if creds is not None and creds.expiry is not None and creds.refresh_token:
+                # google-auth keeps expiry as a naive UTC datetime
+                now = datetime.now(timezone.utc).replace(tzinfo=None)
+                remaining = (creds.expiry - now).total_seconds()
+                if remaining <= REFRESH_MARGIN:
+                    try:
+                        creds.refresh(Request())
+                        self._save_credentials(creds)
+                        with self.lock:
+                            self.stats['refreshes'] += 1
+                        logger.info(f"Refreshed Gmail access token, valid until {creds.expiry}")
+                        continue
+                    except Exception as e:
+                        with self.lock:
+                            self.stats['refresh_errors'] += 1
+                        logger.error(f"Error refreshing Gmail access token: {e}", exc_info=True)
+                else:
+                    delay = min(delay, remaining - REFRESH_MARGIN)
+            time.sleep(max(delay, 1))
+
+    # Counters plus an estimate of the time saved by reusing clients. Without the pool every
+    # call paid for reading the token file, parsing discovery and building a client.
+    def report(self):
+        with self.lock:
+            stats = dict(self.stats)
+            idle = len(self.idle)
+        average_build = stats['build_seconds'] / stats['builds'] if stats['builds'] else 0.0
+        saved_per_request = stats['setup_seconds'] + average_build
+        return {
+            'builds': stats['builds'],
+            'reuses': stats['reuses'],
+            'idle_clients': idle,
+            'avg_build_ms': round(average_build * 1000, 2),
+            'setup_ms': round(stats['setup_seconds'] * 1000, 2),
+            'saved_ms_per_request': round(saved_per_request * 1000, 2),
+            'total_saved_ms': round(saved_per_request * stats['reuses'] * 1000, 2),
+            'token_refreshes': stats['refreshes'],
+            'token_refresh_errors': stats['refresh_errors'],
+        }
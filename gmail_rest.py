@@ -0,0 +1,273 @@
+import ssl
+import json
+import time
+import zlib
+import asyncio
+import logging
+import threading
+from urllib.parse import urlsplit, urlencode, quote
+import httplib2
+from googleapiclient.errors import HttpError
+from gmail_batch import (
+    is_retryable, backoff_delay, count_error,
+    METADATA_HEADERS, METADATA_MAX_RETRIES, METADATA_RETRY_DELAY
+)
+from gmail_client import API_CALLS, API_LATENCY
+
+logger = logging.getLogger('gmail_organizer')
+
+GMAIL_API_URL = 'https://gmail.googleapis.com'  # Where the REST endpoints live; a stub server elsewhere for tests
+GMAIL_API_PATH = '/gmail/v1/users/me'  # Resource path every endpoint the app calls sits under
+REST_MAX_IN_FLIGHT = 100  # Requests on the wire at once; also the most keep-alive connections kept open
+REST_TIMEOUT = 30  # Seconds a connect or a request may take before it counts as a transport error
+
+METADATA_PARAMS = {'format': 'metadata', 'metadataHeaders': METADATA_HEADERS}
+FULL_PARAMS = {'format': 'full'}
+
+# One HTTP/1.1 keep-alive connection; it carries one request at a time
+class RestConnection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.reusable = True
+
+    # Send a request and read the whole response: (status, {lowercase header: value}, body)
+    async def request(self, method, target, headers):
+        lines = [f'{method} {target} HTTP/1.1'] + [f'{name}: {value}' for name, value in headers.items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed before a response arrived')
+        version, status = status_line.decode('latin-1').split(' ', 2)[:2]
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = await self._read_chunked()
+        elif 'content-length' in response_headers:
+            body = await self.reader.readexactly(int(response_headers['content-length']))
+        else:
+            # The body ends with the connection
+            body = await self.reader.read()
+            self.reusable = False
+        if version == 'HTTP/1.0' or response_headers.get('connection', '').lower() == 'close':
+            self.reusable = False
+        if response_headers.get('content-encoding', '').lower() == 'gzip':
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        return int(status), response_headers, body
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                # Skip the trailers, up to the blank line
+                while await self.reader.readline() not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readexactly(2)
+
+    def close(self):
+        self.reusable = False
+        self.writer.close()
+
+# Gmail REST client for one event loop, speaking HTTP/1.1 over a pool of keep-alive
+# connections (the standard library has no HTTP/2).
+#
+# Any number of coroutines can call get() at once; at most `max_in_flight` requests are
+# on the wire and the rest wait for a connection to come free, so thousands of message
+# fetches can be started together without opening thousands of sockets. Error statuses
+# raise googleapiclient's HttpError, so the retry and rate-limit helpers of gmail_batch
+# treat them exactly like errors of the client library.
+class AsyncGmailClient:
+    def __init__(self, base_url=GMAIL_API_URL, max_in_flight=REST_MAX_IN_FLIGHT, timeout=REST_TIMEOUT):
+        parts = urlsplit(base_url)
+        self.secure = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.secure else 80)
+        self.host_header = self.host if parts.port is None else f'{self.host}:{self.port}'
+        self.prefix = parts.path.rstrip('/') + GMAIL_API_PATH
+        self.ssl = ssl.create_default_context() if self.secure else None
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self.idle = []  # Connections ready for another request, most recently used last
+        self.stats = {
+            'requests': 0,
+            'errors': 0,
+            'in_flight': 0,
+            'connections_opened': 0,
+            'connections_reused': 0,
+        }
+
+    async def _connect(self):
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=self.ssl), self.timeout
+        )
+        self.stats['connections_opened'] += 1
+        return RestConnection(reader, writer)
+
+    # Send a GET on an idle connection, or on a new one. A pooled connection the server
+    # closed while it sat idle fails without an answer; as GETs are safe to repeat, the
+    # request then moves on to the next idle connection or a fresh one.
+    async def _exchange(self, target, headers):
+        while True:
+            connection = self.idle.pop() if self.idle else None
+            reused = connection is not None
+            if connection is None:
+                connection = await self._connect()
+            try:
+                response = await asyncio.wait_for(connection.request('GET', target, headers), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                connection.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                connection.close()
+                raise
+            if reused:
+                self.stats['connections_reused'] += 1
+            if connection.reusable:
+                self.idle.append(connection)
+            else:
+                connection.close()
+            return response
+
+    # GET `path` below users/me with query `params` and return the decoded JSON. `method`
+    # names the call in metrics; the request count and time on the wire are added to
+    # `stats` when given.
+    async def get(self, path, params=None, token=None, method='unknown', stats=None):
+        target = self.prefix + path + ('?' + urlencode(params, doseq=True) if params else '')
+        headers = {
+            'Host': self.host_header,
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip',
+            'Connection': 'keep-alive',
+        }
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        async with self.slots:
+            self.stats['in_flight'] += 1
+            start = time.perf_counter()
+            status = 'error'
+            try:
+                status, response_headers, body = await self._exchange(target, headers)
+            finally:
+                elapsed = time.perf_counter() - start
+                self.stats['in_flight'] -= 1
+                self.stats['requests'] += 1
+                API_LATENCY.observe(elapsed, method=method)
+                API_CALLS.inc(method=method, status=str(status))
+                if stats is not None:
+                    stats['requests'] += 1
+                    stats['request_seconds'] += elapsed
+        if status >= 400:
+            self.stats['errors'] += 1
+            raise HttpError(httplib2.Response(dict(response_headers, status=status)), body, uri=target)
+        return json.loads(body)
+
+    async def close(self):
+        while self.idle:
+            self.idle.pop().close()
+
+# Fetch message resources for a list of message IDs, every message a GET of its own,
+# all of them started at once and throttled by the client's in-flight limit. Retries,
+# results and `stats` work as in gmail_batch.fetch_metadata_batch: the resources come
+# back in the order of `message_ids` together with the IDs that could not be fetched.
+async def fetch_messages(client, message_ids, token=None,
+                         max_retries=METADATA_MAX_RETRIES,
+                         retry_delay=METADATA_RETRY_DELAY,
+                         params=METADATA_PARAMS,
+                         stats=None):
+    results = {}
+    pending = list(dict.fromkeys(message_ids))
+    attempt = 0
+    if stats is None:
+        stats = {}
+    stats.update(requests=0, request_seconds=0.0, errors=0, throttled=0, retry_after=None)
+
+    # Returns the ID again if it should be retried
+    async def fetch(message_id):
+        try:
+            results[message_id] = await client.get(
+                f'/messages/{quote(message_id, safe="")}', params, token, 'messages.get', stats
+            )
+        except Exception as e:
+            count_error(stats, e)
+            if is_retryable(e):
+                logger.debug(f"Retryable error fetching message {message_id}: {e}")
+                return message_id
+            logger.warning(f"Giving up on message {message_id}: {e}")
+        return None
+
+    while pending:
+        if attempt > 0:
+            if attempt > max_retries:
+                break
+            delay = backoff_delay(attempt, retry_delay, stats['retry_after'])
+            logger.info(f"Retrying REST fetch of {len(pending)} messages in {delay:.1f}s (attempt {attempt})")
+            await asyncio.sleep(delay)
+
+        outcomes = await asyncio.gather(*(fetch(message_id) for message_id in pending))
+        failed = [message_id for message_id in outcomes if message_id is not None]
+        logger.debug(f"REST fetch round {attempt}: {len(pending) - len(failed)} fetched, {len(failed)} to retry")
+        pending = failed
+        attempt += 1
+
+    if pending:
+        logger.error(f"Could not fetch {len(pending)} messages over REST after {max_retries} retries")
+
+    unique_ids = list(dict.fromkeys(message_ids))
+    fetched = [results[message_id] for message_id in unique_ids if message_id in results]
+    failed = [message_id for message_id in unique_ids if message_id not in results]
+    return fetched, failed
+
+# Runs an AsyncGmailClient on an event loop thread of its own, so the app's threads
+# (fetch workers, request handlers) share one connection pool: every call blocks its
+# thread while the loop interleaves the requests of all callers. `token()` returns
+# the OAuth access token to send; it is called on the calling thread, never the loop.
+class AsyncGmailEngine:
+    def __init__(self, token, base_url=GMAIL_API_URL, max_in_flight=REST_MAX_IN_FLIGHT, timeout=REST_TIMEOUT):
+        self.token = token
+        self.base_url = base_url
+        self.loop = asyncio.new_event_loop()
+        self.client = AsyncGmailClient(base_url, max_in_flight, timeout)
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    # Drop-in for gmail_batch.fetch_metadata_batch, without the service and batch size
+    def fetch_metadata_batch(self, message_ids, max_retries=METADATA_MAX_RETRIES,
+                             retry_delay=METADATA_RETRY_DELAY, params=METADATA_PARAMS, stats=None):
+        return self.run(fetch_messages(self.client, message_ids, self.token(), max_retries, retry_delay, params, stats))
+
+    # Drop-in for gmail_batch.fetch_full_batch
+    def fetch_full_batch(self, message_ids, max_retries=METADATA_MAX_RETRIES, retry_delay=METADATA_RETRY_DELAY):
+        return self.fetch_metadata_batch(message_ids, max_retries, retry_delay, FULL_PARAMS)
+
+    # Close the pooled connections and stop the loop; calling it again does nothing
+    def close(self):
+        if not self.thread.is_alive():
+            return
+        self.run(self.client.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def report(self):
+        return dict(
+            self.client.stats,
+            base_url=self.base_url,
+            max_in_flight=self.client.max_in_flight,
+            idle_connections=len(self.client.idle),
+        )
@@ -0,0 +1,164 @@
+import json
+import socket
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from googleapiclient.errors import HttpError
+from gmail_rest import GMAIL_API_PATH
+
+# Serves a fake_gmail.FakeGmailService over HTTP at the Gmail REST paths, so the asyncio
+# REST engine (gmail_rest.py) can be exercised without a network:
+#
+#     server = GmailStubServer(generate_mailbox(10000, latency=0.02)).start()
+#     engine = AsyncGmailEngine(lambda: None, base_url=server.url)
+#     details, failed = engine.fetch_metadata_batch(['msg0000001', 'msg0000002'])
+#     server.stop()
+#
+# Every request is one call of the fake service, so its latency, injected errors,
+# scripted failures and call counts apply as they do to batch requests. Responses
+# keep the connection open (HTTP/1.1), and the server counts the connections it
+# accepted, which shows whether a client reuses them.
+#
+#     python gmail_stub_server.py --size 10000 --port 8089
+
+# The first value of a query parameter
+def first(params, name, default=None):
+    return params.get(name, [default])[0]
+
+# Gmail's JSON error body for an HttpError raised by the fake service
+def error_body(exception):
+    message = exception.content.decode('utf-8', 'replace') if exception.content else exception.resp.reason
+    return {'error': {'code': exception.resp.status, 'message': message, 'errors': [{'message': message}]}}
+
+class GmailStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # Headers and body go out in two writes; don't hold the body back
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+            self.server.open_sockets.add(self.connection)
+
+    def finish(self):
+        super().finish()
+        with self.server.lock:
+            self.server.open_sockets.discard(self.connection)
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        params = parse_qs(parts.query)
+        token = self.server.token
+        if token and self.headers.get('Authorization') != f'Bearer {token}':
+            self.send_json(401, {'error': {'code': 401, 'message': 'Request had invalid authentication credentials.'}})
+            return
+        if not parts.path.startswith(GMAIL_API_PATH + '/'):
+            self.send_json(404, {'error': {'code': 404, 'message': 'Not found'}})
+            return
+        resource = parts.path[len(GMAIL_API_PATH) + 1:].split('/')
+        messages = self.server.service.users().messages()
+
+        if resource == ['messages']:
+            request = messages.list(
+                userId='me',
+                q=first(params, 'q'),
+                maxResults=int(first(params, 'maxResults', 100)),
+                pageToken=first(params, 'pageToken')
+            )
+        elif len(resource) == 2 and resource[0] == 'messages':
+            request = messages.get(
+                userId='me',
+                id=unquote(resource[1]),
+                format=first(params, 'format', 'full'),
+                metadataHeaders=params.get('metadataHeaders')
+            )
+        elif resource == ['profile']:
+            request = self.server.service.users().getProfile(userId='me')
+        else:
+            self.send_json(404, {'error': {'code': 404, 'message': 'Not found'}})
+            return
+
+        try:
+            response = request.execute()
+        except HttpError as e:
+            headers = {}
+            if e.resp.status == 429 and self.server.retry_after is not None:
+                headers['Retry-After'] = str(self.server.retry_after)
+            self.send_json(e.resp.status, error_body(e), headers)
+            return
+        self.send_json(200, response)
+
+# A threaded HTTP server in front of `service`. With a `token`, requests must carry it
+# as a bearer token; `retry_after` is sent along with 429 responses when set.
+class GmailStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # Clients open their whole connection pool at once
+
+    def __init__(self, service, host='127.0.0.1', port=0, token=None, retry_after=None):
+        super().__init__((host, port), GmailStubHandler)
+        self.service = service
+        self.token = token
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.connections = 0  # Connections accepted so far
+        self.open_sockets = set()
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    # Serve from a background thread
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    # Stop serving and drop the connections clients keep open
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        with self.lock:
+            for sock in self.open_sockets:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+def main():
+    from fake_gmail import generate_mailbox
+    parser = argparse.ArgumentParser(description='Serve a generated fake mailbox at the Gmail REST paths')
+    parser.add_argument('--size', type=int, default=1000, help='messages in the mailbox')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of message requests failing with 429')
+    parser.add_argument('--token', help='bearer token requests must carry')
+    args = parser.parse_args()
+
+    service = generate_mailbox(args.size, latency=args.latency, error_rate=args.error_rate)
+    server = GmailStubServer(service, port=args.port, token=args.token)
+    print(f"Serving {args.size} messages at {server.url}{GMAIL_API_PATH}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import logging
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger('gmail_organizer')
+
+HISTORY_TYPES = ['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved']
+HISTORY_PAGE_SIZE = 500
+
+# Labels that hide a message from an `is:unread` search
+HIDDEN_LABELS = {'TRASH', 'SPAM'}
+
+# Raised when Gmail no longer has history for the requested start ID
+class HistoryExpired(Exception):
+    pass
+
+# Whether a message with these labels shows up in the `is:unread` listing
+def is_listed(label_ids):
+    labels = set(label_ids or [])
+    return 'UNREAD' in labels and not labels & HIDDEN_LABELS
+
+# Current history ID of the mailbox; record it before a full scan so a later sync can start there
+def get_mailbox_history_id(service, scheduler=None):
+    request = service.users().getProfile(userId='me')
+    profile = scheduler.execute('getProfile', request) if scheduler else request.execute()
+    return profile['historyId']
+
+# Page through users.history.list from `start_history_id` and reduce the records to the
+# final state of every touched message. Returns ({message_id: listed}, latest_history_id),
+# where `listed` says whether the message now belongs in the unread listing.
+# Requests go through `scheduler` when given, which spends quota and retries rate limits.
+def list_history_changes(service, start_history_id, scheduler=None):
+    changes = {}
+    latest_history_id = start_history_id
+    page_token = None
+    pages = 0
+
+    while True:
+        request = service.users().history().list(
+            userId='me',
+            startHistoryId=start_history_id,
+            historyTypes=HISTORY_TYPES,
+            maxResults=HISTORY_PAGE_SIZE,
+            pageToken=page_token
+        )
+        try:
+            results = scheduler.execute('history.list', request) if scheduler else request.execute()
+        except HttpError as e:
+            if e.resp.status == 404:
+                raise HistoryExpired(f"History ID {start_history_id} is no longer available") from e
+            raise
+        pages += 1
+
+        # Records come oldest first, so later entries overwrite earlier ones
+        for record in results.get('history', []):
+            for added in record.get('messagesAdded', []):
+                message = added['message']
+                changes[message['id']] = is_listed(message.get('labelIds'))
+            for deleted in record.get('messagesDeleted', []):
+                changes[deleted['message']['id']] = False
+            for labelled in record.get('labelsAdded', []) + record.get('labelsRemoved', []):
+                message = labelled['message']
+                changes[message['id']] = is_listed(message.get('labelIds'))
+
+        latest_history_id = results.get('historyId', latest_history_id)
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            break
+
+    logger.info(f"History sync from {start_history_id} to {latest_history_id}: {len(changes)} changed messages in {pages} pages")
+    return changes, latest_history_id
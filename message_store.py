@@ -0,0 +1,308 @@
+import json
+import time
+import sqlite3
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from metrics import CACHE_SECONDS, CACHE_BYTES
+
+logger = logging.getLogger('gmail_organizer')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS messages (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    domain TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    date TEXT NOT NULL,
+    date_ts INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_messages_domain ON messages(domain, seq);
+CREATE INDEX IF NOT EXISTS idx_messages_sender ON messages(sender);
+CREATE INDEX IF NOT EXISTS idx_messages_date ON messages(date_ts);
+CREATE TABLE IF NOT EXISTS domains (
+    domain TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    first_seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_domains_count ON domains(count DESC, first_seq);
+CREATE TRIGGER IF NOT EXISTS messages_domain_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO domains (domain, count, first_seq) VALUES (new.domain, 1, new.seq)
+        ON CONFLICT(domain) DO UPDATE SET count = count + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS messages_domain_delete AFTER DELETE ON messages BEGIN
+    UPDATE domains SET count = count - 1 WHERE domain = old.domain;
+    DELETE FROM domains WHERE domain = old.domain AND count <= 0;
+END;
+CREATE TRIGGER IF NOT EXISTS messages_domain_update AFTER UPDATE OF domain ON messages
+WHEN new.domain != old.domain BEGIN
+    UPDATE domains SET count = count - 1 WHERE domain = old.domain;
+    DELETE FROM domains WHERE domain = old.domain AND count <= 0;
+    INSERT INTO domains (domain, count, first_seq) VALUES (new.domain, 1, new.seq)
+        ON CONFLICT(domain) DO UPDATE SET count = count + 1;
+END;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+'''
+
+# Full-text index of the stored messages for search (rowid = messages.seq). Triggers
+# keep the sender and subject in step with the messages table; bodies are added by
+# index_body once they are fetched. Kept apart from SCHEMA because FTS5 is an
+# optional part of SQLite: without it the store works as before, minus search.
+SEARCH_SCHEMA = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5(sender, subject, body, prefix='2 3');
+CREATE TRIGGER IF NOT EXISTS messages_search_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO search (rowid, sender, subject, body) VALUES (new.seq, new.sender, new.subject, '');
+END;
+CREATE TRIGGER IF NOT EXISTS messages_search_delete AFTER DELETE ON messages BEGIN
+    DELETE FROM search WHERE rowid = old.seq;
+END;
+CREATE TRIGGER IF NOT EXISTS messages_search_update AFTER UPDATE OF sender, subject ON messages BEGIN
+    UPDATE search SET sender = new.sender, subject = new.subject WHERE rowid = new.seq;
+END;
+'''
+
+RECORD_COLUMNS = 'id, domain, sender, subject, date'
+LOOKUP_CHUNK_SIZE = 500  # Message IDs per query, below SQLite's limit on bound parameters
+SCAN_CHUNK_SIZE = 5000  # Records read per query when walking the whole store
+
+# Parse a Date header into a unix timestamp for the date index; None if unparseable
+def parse_date_header(value):
+    try:
+        return int(parsedate_to_datetime(value).timestamp())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+def row_to_record(row):
+    return {'id': row[0], 'domain': row[1], 'sender': row[2], 'subject': row[3], 'date': row[4]}
+
+# SQLite-backed store for fetched message metadata and the sync state that goes with it.
+#
+# The database runs in WAL mode and every write is a single transaction, so a crash
+# mid-write leaves the previous state intact. Writes are per batch (upsert/delete)
+# rather than rewriting the whole mailbox, and grouped views come from indexed queries.
+# Per-domain counts live in a summary table kept current by triggers, so removing
+# messages only touches the rows of the affected domains.
+class MessageStore:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+        self._backfill_domains()
+        self.searchable = self._create_search()
+        logger.debug(f"Opened message store at {path}")
+
+    # Stores written before the domains table existed need their counts built once
+    def _backfill_domains(self):
+        if self._query('SELECT 1 FROM domains LIMIT 1') or not self._query('SELECT 1 FROM messages LIMIT 1'):
+            return
+        logger.info("Building domain counts for existing message store")
+        self._write('INSERT INTO domains (domain, count, first_seq) SELECT domain, COUNT(*), MIN(seq) FROM messages GROUP BY domain')
+
+    # Create the full-text index, filling it once for stores written before it existed.
+    # Returns False when this SQLite has no FTS5.
+    def _create_search(self):
+        try:
+            self.connection.executescript(SEARCH_SCHEMA)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite has no full-text search ({e}), stored emails are searched in memory")
+            return False
+        if not self._query('SELECT 1 FROM search LIMIT 1') and self._query('SELECT 1 FROM messages LIMIT 1'):
+            logger.info("Building full-text index for existing message store")
+            self._write("INSERT INTO search (rowid, sender, subject, body) SELECT seq, sender, subject, '' FROM messages")
+        return True
+
+    # Run one or more (sql, rows) steps in a single transaction; returns the first step's row count
+    def _write(self, sql, rows=None, *steps):
+        with self.lock, CACHE_SECONDS.time(cache='messages', op='write'):
+            cursor = self.connection.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                rowcount = None
+                for step_sql, step_rows in ((sql, rows),) + steps:
+                    if step_rows is None:
+                        cursor.execute(step_sql)
+                    else:
+                        cursor.executemany(step_sql, step_rows)
+                    if rowcount is None:
+                        rowcount = cursor.rowcount
+                cursor.execute('COMMIT')
+            except Exception:
+                cursor.execute('ROLLBACK')
+                raise
+            return rowcount
+
+    def _meta_step(self, values):
+        return (
+            'INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value',
+            [(key, json.dumps(value)) for key, value in values.items()]
+        )
+
+    def _query(self, sql, params=()):
+        with self.lock, CACHE_SECONDS.time(cache='messages', op='read'):
+            return self.connection.execute(sql, params).fetchall()
+
+    # Insert or update a batch of email records in one transaction
+    def upsert_batch(self, records):
+        if not records:
+            return
+        rows = [
+            (r['id'], r['domain'], r['sender'], r['subject'], r['date'], parse_date_header(r['date']))
+            for r in records
+        ]
+        CACHE_BYTES.inc(sum(len(r[0]) + len(r[1]) + len(r[2]) + len(r[3]) + len(r[4]) for r in rows), cache='messages', op='write')
+        self._write(
+            'INSERT INTO messages (id, domain, sender, subject, date, date_ts) VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT(id) DO UPDATE SET domain=excluded.domain, sender=excluded.sender, '
+            'subject=excluded.subject, date=excluded.date, date_ts=excluded.date_ts',
+            rows,
+            self._meta_step({'updated_at': time.time()})
+        )
+
+    # Delete messages by ID, updating any given metadata keys in the same transaction.
+    # Returns the number of messages that were in the store.
+    def delete(self, message_ids, **meta):
+        message_ids = list(message_ids)
+        if not message_ids:
+            return 0
+        return self._write(
+            'DELETE FROM messages WHERE id = ?', [(message_id,) for message_id in message_ids],
+            self._meta_step(dict(meta, updated_at=time.time()))
+        )
+
+    # Recompute the domain of every message from its sender with `domain_of`, recording the
+    # name of the grouping in the same transaction. Returns the number of messages moved.
+    def regroup(self, domain_of, grouping):
+        moved = []
+        for message_id, domain, sender in self._query('SELECT id, domain, sender FROM messages'):
+            new_domain = domain_of(sender)
+            if new_domain != domain:
+                moved.append((new_domain, message_id))
+        self._write('UPDATE messages SET domain = ? WHERE id = ?', moved, self._meta_step({'domain_grouping': grouping}))
+        return len(moved)
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.execute('DELETE FROM messages')
+            self.connection.execute('DELETE FROM domains')
+            self.connection.execute('DELETE FROM meta')
+            self.connection.execute('COMMIT')
+
+    def count(self):
+        return self._query('SELECT COALESCE(SUM(count), 0) FROM domains')[0][0]
+
+    def get(self, message_id):
+        rows = self._query(f'SELECT {RECORD_COLUMNS} FROM messages WHERE id = ?', (message_id,))
+        return row_to_record(rows[0]) if rows else None
+
+    # {message_id: domain} for the given messages that are in the store
+    def domains_of(self, message_ids):
+        message_ids = list(message_ids)
+        domains = {}
+        for start in range(0, len(message_ids), LOOKUP_CHUNK_SIZE):
+            chunk = message_ids[start:start + LOOKUP_CHUNK_SIZE]
+            placeholders = ', '.join('?' * len(chunk))
+            domains.update(self._query(f'SELECT id, domain FROM messages WHERE id IN ({placeholders})', chunk))
+        return domains
+
+    # {message_id: record} for the given messages that are in the store
+    def get_many(self, message_ids):
+        message_ids = list(message_ids)
+        records = {}
+        for start in range(0, len(message_ids), LOOKUP_CHUNK_SIZE):
+            chunk = message_ids[start:start + LOOKUP_CHUNK_SIZE]
+            placeholders = ', '.join('?' * len(chunk))
+            for row in self._query(f'SELECT {RECORD_COLUMNS} FROM messages WHERE id IN ({placeholders})', chunk):
+                records[row[0]] = row_to_record(row)
+        return records
+
+    # Index the text of a stored message's body for search_messages; returns False for
+    # messages not in the store
+    def index_body(self, message_id, text):
+        return self._write(
+            'UPDATE search SET body = ? WHERE rowid = (SELECT seq FROM messages WHERE id = ?)',
+            [(text, message_id)]
+        ) > 0
+
+    # [(message_id, score)] of the `limit` best messages matching the FTS5 query `match`,
+    # ranked by bm25 with the given sender, subject and body weights, then fetch order
+    def search_messages(self, match, limit, weights):
+        return self._query(
+            'SELECT messages.id, -bm25(search, ?, ?, ?) AS score FROM search '
+            'JOIN messages ON messages.seq = search.rowid '
+            'WHERE search MATCH ? ORDER BY score DESC, messages.seq LIMIT ?',
+            (*weights, match, limit)
+        )
+
+    # Messages with an indexed body
+    def indexed_bodies(self):
+        return self._query("SELECT COUNT(*) FROM search WHERE body != ''")[0][0]
+
+    # Every record in fetch order, read SCAN_CHUNK_SIZE at a time so the whole store is
+    # never in memory at once
+    def iter_records(self, chunk_size=SCAN_CHUNK_SIZE):
+        last_seq = 0
+        while True:
+            rows = self._query(
+                f'SELECT seq, {RECORD_COLUMNS} FROM messages WHERE seq > ? ORDER BY seq LIMIT ?',
+                (last_seq, chunk_size)
+            )
+            if not rows:
+                return
+            last_seq = rows[-1][0]
+            yield [row_to_record(row[1:]) for row in rows]
+
+    def all_records(self):
+        return [row_to_record(row) for row in self._query(f'SELECT {RECORD_COLUMNS} FROM messages ORDER BY seq')]
+
+    # Domains with their email counts, largest first
+    def domain_counts(self, offset=0, limit=-1):
+        return self._query(
+            'SELECT domain, count FROM domains ORDER BY count DESC, first_seq LIMIT ? OFFSET ?',
+            (limit, offset)
+        )
+
+    def emails_for(self, domain, offset=0, limit=-1):
+        rows = self._query(
+            f'SELECT {RECORD_COLUMNS} FROM messages WHERE domain = ? ORDER BY seq LIMIT ? OFFSET ?',
+            (domain, limit, offset)
+        )
+        return [row_to_record(row) for row in rows]
+
+    # Up to `limit` emails of a domain stored after `message_id`, or its first `limit`
+    # emails if `message_id` is not one of them
+    def emails_after(self, domain, message_id, limit):
+        rows = self._query(
+            f'SELECT {RECORD_COLUMNS} FROM messages WHERE domain = ? '
+            'AND seq > COALESCE((SELECT seq FROM messages WHERE id = ? AND domain = ?), 0) '
+            'ORDER BY seq LIMIT ?',
+            (domain, message_id, domain, limit)
+        )
+        return [row_to_record(row) for row in rows]
+
+    # {domain: [records]} ordered by email count, read with one indexed query per domain
+    def grouped(self, max_domains=-1, per_domain=-1):
+        return {domain: self.emails_for(domain, limit=per_domain) for domain, _ in self.domain_counts(limit=max_domains)}
+
+    def domain_count(self):
+        return self._query('SELECT COUNT(*) FROM domains')[0][0]
+
+    def get_meta(self, key, default=None):
+        rows = self._query('SELECT value FROM meta WHERE key = ?', (key,))
+        return json.loads(rows[0][0]) if rows else default
+
+    # Update several metadata keys in one transaction
+    def set_meta(self, **values):
+        self._write(*self._meta_step(values))
+
+    # Seconds since the store was last written, or None if it was never written
+    def age(self):
+        updated_at = self.get_meta('updated_at')
+        return None if updated_at is None else time.time() - updated_at
@@ -0,0 +1,119 @@
+import base64
+import binascii
+import logging
+from functools import lru_cache
+from email.message import Message
+
+logger = logging.getLogger('gmail_organizer')
+
+PREVIEW_MAX_BYTES = 512 * 1024  # Decoded bytes of a body shown in the preview pane
+BODY_TYPES = ('text/html', 'text/plain')  # In order of preference
+DEFAULT_CHARSET = 'utf-8'
+
+def _header(headers, name):
+    name = name.lower()
+    return next((h['value'] for h in headers or [] if h['name'].lower() == name), '')
+
+# Charset named in a Content-Type header value; the same few values repeat across mail
+@lru_cache(maxsize=256)
+def _content_type_charset(content_type):
+    message = Message()
+    message['Content-Type'] = content_type
+    return message.get_content_charset() or DEFAULT_CHARSET
+
+# Charset from a part's Content-Type header, or the default
+def part_charset(part):
+    content_type = _header(part.get('headers'), 'Content-Type')
+    return _content_type_charset(content_type) if content_type else DEFAULT_CHARSET
+
+# Parts with a filename or an attachment disposition are attachments, not the body
+def is_attachment(part):
+    if part.get('filename'):
+        return True
+    return _header(part.get('headers'), 'Content-Disposition').lower().startswith('attachment')
+
+# Depth-first walk over a Gmail message payload; yields leaf parts lazily
+def iter_leaf_parts(payload):
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        children = part.get('parts')
+        if children:
+            stack.extend(reversed(children))
+        else:
+            yield part
+
+# The part to show: the first text/html leaf, else the first text/plain one.
+# The walk stops as soon as an HTML part turns up.
+def find_body_part(payload):
+    fallback = None
+    for part in iter_leaf_parts(payload):
+        mime_type = part.get('mimeType', '').lower()
+        if mime_type not in BODY_TYPES or is_attachment(part):
+            continue
+        if mime_type == 'text/html':
+            return part
+        if fallback is None:
+            fallback = part
+    return fallback
+
+# Decode base64url data, or only enough of it for the first `max_bytes` bytes.
+# Returns (bytes, truncated).
+def decode_base64url(data, max_bytes=None):
+    truncated = False
+    if max_bytes is not None:
+        # Every 4 characters of base64 carry 3 bytes
+        needed_chars = -(-max_bytes // 3) * 4
+        if len(data) > needed_chars:
+            data = data[:needed_chars]
+            truncated = True
+    data = data + '=' * (-len(data) % 4)
+    try:
+        decoded = base64.urlsafe_b64decode(data)
+    except (binascii.Error, ValueError) as e:
+        logger.warning(f"Could not decode message body: {e}")
+        return b'', False
+    if max_bytes is not None and len(decoded) > max_bytes:
+        decoded = decoded[:max_bytes]
+        truncated = True
+    return decoded, truncated
+
+def decode_text(raw, charset):
+    try:
+        return raw.decode(charset, errors='replace')
+    except LookupError:
+        logger.debug(f"Unknown charset {charset}, decoding as {DEFAULT_CHARSET}")
+        return raw.decode(DEFAULT_CHARSET, errors='replace')
+
+# Extract the preview body from a Gmail message payload.
+#
+# Returns (text, mime_type, truncated); mime_type is None when the message has no
+# text part. Bodies that Gmail only references by attachmentId (large parts) are
+# fetched through `fetch_attachment(attachment_id)`, which returns the base64url
+# data; without it such bodies come back empty.
+def extract_body(payload, fetch_attachment=None, max_bytes=PREVIEW_MAX_BYTES):
+    part = find_body_part(payload)
+    if part is None:
+        return '', None, False
+
+    body = part.get('body', {})
+    data = body.get('data')
+    if data is None and body.get('attachmentId') and fetch_attachment is not None:
+        data = fetch_attachment(body['attachmentId'])
+    if not data:
+        return '', part['mimeType'].lower(), False
+
+    raw, truncated = decode_base64url(data, max_bytes)
+    return decode_text(raw, part_charset(part)), part['mimeType'].lower(), truncated
+
+# fetch_attachment callback that loads attachment data of a message from Gmail, spending
+# quota through `scheduler` (which also retries throttled requests) when given
+def gmail_attachment_fetcher(service, message_id, scheduler=None):
+    def fetch(attachment_id):
+        logger.info(f"Fetching attachment {attachment_id} of message {message_id}")
+        request = service.users().messages().attachments().get(
+            userId='me', messageId=message_id, id=attachment_id
+        )
+        result = scheduler.execute('messages.attachments.get', request) if scheduler else request.execute()
+        return result.get('data', '')
+    return fetch
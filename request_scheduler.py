@@ -0,0 +1,221 @@
+import time
+import logging
+import threading
+from collections import deque
+from fetch_engine import QUOTA_UNITS, GMAIL_USER_QUOTA_PER_SECOND
+from gmail_batch import (
+    is_retryable, is_throttled, retry_after_seconds, backoff_delay,
+    METADATA_BATCH_SIZE, BACKOFF_MAX_DELAY
+)
+
+logger = logging.getLogger('gmail_organizer')
+
+SCHEDULER_MAX_RETRIES = 5  # Extra attempts for a request that failed with a retryable error
+SCHEDULER_RETRY_DELAY = 1.0  # Base backoff in seconds, doubled with every attempt
+QUOTA_WINDOW_SECONDS = 60  # Window the headroom report measures recent quota use over
+PAGE_SIZE_RANGE = (25, 500, 25)  # Smallest, largest and growth step of the messages.list page size
+BATCH_WIDTH_RANGE = (5, METADATA_BATCH_SIZE, 5)  # The same for messages per metadata batch request
+LIST_LATENCY_TARGET = 1.5  # Seconds; slower list pages shrink the page size
+BATCH_LATENCY_TARGET = 3.0  # Seconds; slower batch requests shrink the batch width
+ERROR_RATE_TARGET = 0.05  # Share of failed calls (smoothed) above which the batch width shrinks
+GROW_AFTER = 5  # Healthy calls in a row before a limit grows by one step
+SMOOTHING = 0.2  # Weight of the newest sample in the latency and error rate averages
+
+# A size that grows by `step` after a run of healthy calls and halves on trouble,
+# staying within [minimum, maximum]
+class AdaptiveLimit:
+    def __init__(self, initial, minimum, maximum, step):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.step = step
+        self.value = min(max(initial, minimum), maximum)
+        self.healthy = 0
+
+    def healthy_call(self):
+        self.healthy += 1
+        if self.healthy >= GROW_AFTER:
+            self.healthy = 0
+            self.value = min(self.maximum, self.value + self.step)
+
+    def shrink(self):
+        self.healthy = 0
+        self.value = max(self.minimum, self.value // 2)
+
+# Quota units spent per API method, in total and over the last QUOTA_WINDOW_SECONDS
+class QuotaLedger:
+    def __init__(self, window=QUOTA_WINDOW_SECONDS):
+        self.window = window
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.recent = deque()  # (monotonic time, method, units)
+
+    def charge(self, method, units):
+        now = time.monotonic()
+        with self.lock:
+            self.totals[method] = self.totals.get(method, 0) + units
+            self.recent.append((now, method, units))
+            self._expire(now)
+
+    def _expire(self, now):
+        while self.recent and self.recent[0][0] < now - self.window:
+            self.recent.popleft()
+
+    # ({method: units in total}, {method: units in the window})
+    def usage(self):
+        with self.lock:
+            self._expire(time.monotonic())
+            window = {}
+            for _, method, units in self.recent:
+                window[method] = window.get(method, 0) + units
+            return dict(self.totals), window
+
+# Decides how fast, how big and how often an account's Gmail requests go out.
+#
+# Every call is charged to the account's token bucket and to a per-method ledger.
+# execute() runs a request with retries: transient errors back off exponentially with
+# jitter, and rate-limit errors (429, or 403 rateLimitExceeded) also pause every other
+# request of the account until the Retry-After Gmail sent, or the backoff, is over.
+# The list page size and the metadata batch width follow observed latency and error
+# rate: they halve when calls get slow, fail or are throttled, and grow step by step
+# while calls are healthy. report() says how much of the per-user quota is left.
+class RequestScheduler:
+    def __init__(self, bucket, page_size=100, batch_width=METADATA_BATCH_SIZE,
+                 quota_per_second=GMAIL_USER_QUOTA_PER_SECOND,
+                 max_retries=SCHEDULER_MAX_RETRIES, retry_delay=SCHEDULER_RETRY_DELAY):
+        self.bucket = bucket
+        self.quota_per_second = quota_per_second
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.ledger = QuotaLedger()
+        self.page_size = AdaptiveLimit(page_size, *PAGE_SIZE_RANGE)
+        self.batch_width = AdaptiveLimit(batch_width, *BATCH_WIDTH_RANGE)
+        self.limits = {
+            'messages.list': (self.page_size, LIST_LATENCY_TARGET),
+            'messages.get': (self.batch_width, BATCH_LATENCY_TARGET),
+        }
+        self.lock = threading.Lock()
+        self.paused_until = 0.0
+        self.throttle_streak = 0  # Rate-limit errors since the last healthy call
+        self.latency = {}  # method -> smoothed seconds per request
+        self.error_rate = {}  # method -> smoothed share of failed calls
+        self.stats = {
+            'calls': 0,
+            'errors': 0,
+            'pauses': 0,  # Times a rate-limit error paused the account
+            'retries': 0,
+            'paused_seconds': 0.0,
+        }
+
+    # Wait out a rate-limit pause, then spend the quota of `calls` calls to `method`
+    def charge(self, method, calls=1):
+        while True:
+            with self.lock:
+                delay = self.paused_until - time.monotonic()
+                if delay > 0:
+                    self.stats['paused_seconds'] += delay
+            if delay <= 0:
+                break
+            time.sleep(delay)
+        units = QUOTA_UNITS[method] * calls
+        self.bucket.acquire(units)
+        self.ledger.charge(method, units)
+
+    # Execute a single Gmail request, retrying transient and rate-limit errors
+    def execute(self, method, request):
+        attempt = 0
+        while True:
+            self.charge(method)
+            start = time.perf_counter()
+            try:
+                response = request.execute()
+            except Exception as e:
+                self.record_error(method, e)
+                attempt += 1
+                if not is_retryable(e) or attempt > self.max_retries:
+                    raise
+                delay = backoff_delay(attempt, self.retry_delay, retry_after_seconds(e))
+                with self.lock:
+                    self.stats['retries'] += 1
+                logger.info(f"{method} failed ({e}), retrying in {delay:.1f}s (attempt {attempt})")
+                time.sleep(delay)
+                continue
+            self.record(method, time.perf_counter() - start)
+            return response
+
+    # A call that succeeded after `seconds`; `calls` > 1 for a batch request
+    def record(self, method, seconds, calls=1, errors=0):
+        with self.lock:
+            self.stats['calls'] += calls
+            self.stats['errors'] += errors
+            self.latency[method] = self._smooth(self.latency.get(method), seconds)
+            error_rate = self.error_rate[method] = self._smooth(self.error_rate.get(method, 0.0), errors / max(calls, 1))
+            self.throttle_streak = 0
+            limit, target = self.limits.get(method, (None, None))
+            if limit is None:
+                return
+            if seconds > target or (errors and error_rate > ERROR_RATE_TARGET):
+                limit.shrink()
+            elif not errors:
+                limit.healthy_call()
+
+    # A call that failed with `exception`; rate-limit errors pause the whole account
+    def record_error(self, method, exception):
+        with self.lock:
+            self.stats['calls'] += 1
+            self.stats['errors'] += 1
+        if is_throttled(exception):
+            self.throttle(retry_after_seconds(exception))
+            return
+        with self.lock:
+            error_rate = self.error_rate[method] = self._smooth(self.error_rate.get(method, 0.0), 1.0)
+            limit, _ = self.limits.get(method, (None, None))
+            if limit is not None and error_rate > ERROR_RATE_TARGET:
+                limit.shrink()
+
+    # Outcome of fetch_metadata_batch for `calls` messages, from the stats it filled in.
+    # fetch_metadata_batch already retried its throttled messages, so the account only
+    # pauses when Gmail sent Retry-After or throttled a sizeable share of the batch.
+    def record_batch(self, method, calls, stats):
+        seconds = stats['request_seconds'] / max(stats['requests'], 1)
+        self.record(method, seconds, calls, min(stats['errors'], calls))
+        if stats['retry_after'] is not None or stats['throttled'] > calls * ERROR_RATE_TARGET:
+            self.throttle(stats['retry_after'])
+
+    # Gmail says we are over a rate limit: stop sending for a while and send less after.
+    # Without a Retry-After the pause grows with every rate-limit error in a row.
+    def throttle(self, retry_after=None):
+        with self.lock:
+            self.throttle_streak += 1
+            self.stats['pauses'] += 1
+            delay = max(retry_after or 0.0, backoff_delay(self.throttle_streak, self.retry_delay, cap=BACKOFF_MAX_DELAY))
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            self.page_size.shrink()
+            self.batch_width.shrink()
+        logger.warning(f"Gmail rate limit hit, pausing requests for {delay:.1f}s; page size {self.page_size.value}, batch width {self.batch_width.value}")
+
+    @staticmethod
+    def _smooth(average, sample):
+        return sample if average is None else average + SMOOTHING * (sample - average)
+
+    # Quota spent per method and how much throttle headroom is left
+    def report(self):
+        totals, window = self.ledger.usage()
+        window_units = sum(window.values())
+        used_per_second = window_units / QUOTA_WINDOW_SECONDS
+        with self.lock:
+            return dict(
+                self.stats,
+                paused_seconds=round(self.stats['paused_seconds'], 1),
+                units_by_method=totals,
+                units_last_minute=window,
+                units_per_second=round(used_per_second, 1),
+                quota_per_second=self.quota_per_second,
+                headroom_per_second=round(max(0.0, self.quota_per_second - used_per_second), 1),
+                headroom_ratio=round(max(0.0, 1 - used_per_second / self.quota_per_second), 3),
+                bucket_available=round(self.bucket.available(), 1),
+                paused_for=round(max(0.0, self.paused_until - time.monotonic()), 1),
+                page_size=self.page_size.value,
+                batch_width=self.batch_width.value,
+                latency_ms={method: round(seconds * 1000, 1) for method, seconds in self.latency.items()},
+                error_rate={method: round(rate, 3) for method, rate in self.error_rate.items()},
+            )
@@ -0,0 +1,311 @@
+import re
+import html
+import math
+import heapq
+import bisect
+import threading
+from array import array
+from metrics import Histogram
+
+SEARCH_RESULTS_LIMIT = 50  # Results returned by a search unless asked for fewer
+MIN_TOKEN_LENGTH = 2  # Shorter words are not indexed
+MAX_TOKEN_LENGTH = 40  # Longer "words" are tracking codes and hashes, not worth indexing
+BODY_INDEX_CHARS = 20000  # Text indexed per email body; the start of an email says what it is about
+PREFIX_EXPANSION_LIMIT = 200  # Most indexed words a query word expands to, the most common first
+PREFIX_PENALTY = 0.8  # Weight of a prefix match relative to an exact word match
+COMPACT_RATIO = 0.25  # Share of removed emails at which their postings are dropped
+COMPACT_MIN_REMOVED = 1000  # ...as long as at least this many were removed
+LOOKUP_FACTOR = 16  # Look candidates up in a posting array instead of scanning it when it is this many times longer
+
+# Fields a word was found in, as bits of a posting, and what a match in each is worth
+SENDER, SUBJECT, BODY = 1, 2, 4
+FIELD_BITS = 3
+FIELD_MASK = (1 << FIELD_BITS) - 1
+FIELD_WEIGHTS = {SENDER: 3.0, SUBJECT: 2.0, BODY: 1.0}
+MASK_WEIGHTS = tuple(sum(weight for bit, weight in FIELD_WEIGHTS.items() if mask & bit) for mask in range(FIELD_MASK + 1))
+
+TOKEN_PATTERN = re.compile(r'\w+')
+MARKUP_PATTERN = re.compile(r'<(script|style)\b.*?</\1\s*>|<[^>]*>', re.S | re.I)
+
+SEARCH_SECONDS = Histogram('search_index_duration_seconds', 'Time spent indexing and searching emails', ['op'])
+
+def tokenize(text, min_length=MIN_TOKEN_LENGTH):
+    return [
+        token for token in TOKEN_PATTERN.findall(text.lower())
+        if min_length <= len(token) <= MAX_TOKEN_LENGTH
+    ]
+
+# Visible text of an HTML email body
+def markup_text(markup):
+    return html.unescape(MARKUP_PATTERN.sub(' ', markup))
+
+# In-memory inverted index over the sender, subject and (once cached) body of emails.
+#
+# Every indexed email gets a document number; each word maps to an array of postings
+# `doc << FIELD_BITS | fields`, four bytes per email a word occurs in, so the index of a
+# large mailbox stays a fraction of the size of its records. Document numbers only
+# grow, so the sender and subject postings of a word are sorted and can be binary
+# searched; body postings arrive in any order and are kept in arrays of their own.
+# Removing an email only marks its document number free; once enough are free the
+# arrays are rewritten without them (compaction).
+#
+# Queries match every word as a prefix of indexed words (so "inv" finds "invoice"),
+# require all query words to match, and rank emails by the fields the words were found
+# in, weighted by how rare each word is (idf), newest email first among equal scores.
+# The rarest query word is scored first; the others are only looked up for the emails
+# it matched. The vocabulary is kept sorted for the prefix lookups; words added since
+# the last search are merged in lazily, so indexing during a fetch never pays for the sort.
+class SearchIndex:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.rebuild_lock = threading.Lock()  # Held by whoever refills the index from scratch
+        self._reset()
+
+    def _reset(self):
+        self.postings = {}  # word -> array of doc << FIELD_BITS | fields, sorted, for senders and subjects
+        self.body_postings = {}  # word -> array of doc << FIELD_BITS | BODY, unsorted
+        self.vocabulary = []  # Sorted words, for prefix lookups
+        self.new_words = []  # Words added since the vocabulary was last sorted
+        self.docs = {}  # message_id -> doc number
+        self.message_ids = []  # doc number -> message_id, or None once removed
+        self.bodies = set()  # Doc numbers whose body is indexed
+        self.removed = 0
+
+    def clear(self):
+        with self.lock:
+            self._reset()
+
+    def __len__(self):
+        return len(self.docs)
+
+    def _post(self, postings, doc, fields):
+        for word, mask in fields.items():
+            word_postings = postings.get(word)
+            if word_postings is None:
+                if word not in self.postings and word not in self.body_postings:
+                    self.new_words.append(word)
+                word_postings = postings[word] = array('I')
+            word_postings.append(doc << FIELD_BITS | mask)
+
+    def _discard(self, message_id):
+        doc = self.docs.pop(message_id, None)
+        if doc is None:
+            return False
+        self.message_ids[doc] = None
+        self.bodies.discard(doc)
+        self.removed += 1
+        return True
+
+    # Index the sender and subject of email records; records already indexed are replaced
+    def add_batch(self, records):
+        with self.lock, SEARCH_SECONDS.time(op='add'):
+            for record in records:
+                self._discard(record['id'])
+                doc = len(self.message_ids)
+                self.message_ids.append(record['id'])
+                self.docs[record['id']] = doc
+                fields = {}
+                for word in tokenize(record.get('sender', '')):
+                    fields[word] = fields.get(word, 0) | SENDER
+                for word in tokenize(record.get('subject', '')):
+                    fields[word] = fields.get(word, 0) | SUBJECT
+                self._post(self.postings, doc, fields)
+            self._maybe_compact()
+
+    # Index the body of an indexed email, given as HTML; does nothing for unknown emails
+    # or ones whose body is indexed already
+    def add_body(self, message_id, markup):
+        with self.lock:
+            doc = self.docs.get(message_id)
+            if doc is None or doc in self.bodies:
+                return False
+            self.bodies.add(doc)
+        # Extract the words outside the lock; bodies can be large
+        words = set(tokenize(markup_text(markup)[:BODY_INDEX_CHARS]))
+        with self.lock, SEARCH_SECONDS.time(op='add_body'):
+            if self.docs.get(message_id) != doc:
+                return False
+            self._post(self.body_postings, doc, dict.fromkeys(words, BODY))
+        return True
+
+    def remove(self, message_ids):
+        with self.lock, SEARCH_SECONDS.time(op='remove'):
+            removed = sum(1 for message_id in message_ids if self._discard(message_id))
+            self._maybe_compact()
+            return removed
+
+    def _maybe_compact(self):
+        if self.removed >= COMPACT_MIN_REMOVED and self.removed > len(self.message_ids) * COMPACT_RATIO:
+            self._compact()
+
+    # Renumber the remaining emails and drop the postings of removed ones
+    def _compact(self):
+        with SEARCH_SECONDS.time(op='compact'):
+            renumbered = {}
+            message_ids = []
+            for doc, message_id in enumerate(self.message_ids):
+                if message_id is not None:
+                    renumbered[doc] = len(message_ids)
+                    message_ids.append(message_id)
+            self.postings = self._renumber(self.postings, renumbered)
+            self.body_postings = self._renumber(self.body_postings, renumbered)
+            self.vocabulary = sorted(self.postings.keys() | self.body_postings.keys())
+            self.new_words = []
+            self.bodies = {renumbered[doc] for doc in self.bodies}
+            self.docs = {message_id: doc for doc, message_id in enumerate(message_ids)}
+            self.message_ids = message_ids
+            self.removed = 0
+
+    @staticmethod
+    def _renumber(postings, renumbered):
+        kept = {}
+        for word, old in postings.items():
+            new = array('I', (
+                renumbered[posting >> FIELD_BITS] << FIELD_BITS | posting & FIELD_MASK
+                for posting in old if posting >> FIELD_BITS in renumbered
+            ))
+            if new:
+                kept[word] = new
+        return kept
+
+    def _frequency(self, word):
+        return len(self.postings.get(word, ())) + len(self.body_postings.get(word, ()))
+
+    # Indexed words starting with `prefix`: all of them, or the most common ones and the word itself
+    def _expand(self, prefix):
+        if self.new_words:
+            self.vocabulary.extend(self.new_words)
+            self.vocabulary.sort()
+            self.new_words = []
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        stop = bisect.bisect_left(self.vocabulary, prefix + '\U0010ffff', start)
+        words = self.vocabulary[start:stop]
+        if len(words) > PREFIX_EXPANSION_LIMIT:
+            words = heapq.nlargest(PREFIX_EXPANSION_LIMIT, words, key=self._frequency)
+            if self._frequency(prefix) and prefix not in words:
+                words.append(prefix)
+        return words
+
+    # Best score per document for one query word, expanded to `words`; with `candidates`
+    # only those documents are scored
+    def _term_scores(self, term, words, candidates):
+        scores = {}
+        documents = len(self.docs) or 1
+        bits, mask, weights = FIELD_BITS, FIELD_MASK, MASK_WEIGHTS
+        for word in words:
+            weight = math.log(1 + documents / self._frequency(word))
+            if word != term:
+                weight *= PREFIX_PENALTY
+            for postings, is_sorted in ((self.postings.get(word), True), (self.body_postings.get(word), False)):
+                if not postings:
+                    continue
+                if candidates is None and not scores:
+                    # Each document occurs once per array, so the first array needs no merging
+                    field_scores = [field_weight * weight for field_weight in weights]
+                    scores = {posting >> bits: field_scores[posting & mask] for posting in postings}
+                elif candidates is not None and is_sorted and len(candidates) * LOOKUP_FACTOR < len(postings):
+                    for doc in candidates:
+                        index = bisect.bisect_left(postings, doc << bits)
+                        if index < len(postings) and postings[index] >> bits == doc:
+                            score = weights[postings[index] & mask] * weight
+                            if score > scores.get(doc, 0.0):
+                                scores[doc] = score
+                else:
+                    for posting in postings:
+                        doc = posting >> bits
+                        if candidates is not None and doc not in candidates:
+                            continue
+                        score = weights[posting & mask] * weight
+                        if score > scores.get(doc, 0.0):
+                            scores[doc] = score
+        return scores
+
+    # [(message_id, score)] of the best `limit` emails matching every word of `query`
+    def search(self, query, limit=SEARCH_RESULTS_LIMIT):
+        terms = list(dict.fromkeys(tokenize(query, min_length=1)))
+        if not terms:
+            return []
+        with self.lock, SEARCH_SECONDS.time(op='search'):
+            expanded = {term: self._expand(term) for term in terms}
+            scores = None
+            # The rarest word narrows the candidates the most
+            for term in sorted(terms, key=lambda term: sum(map(self._frequency, expanded[term]))):
+                term_scores = self._term_scores(term, expanded[term], scores)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {doc: score + term_scores[doc] for doc, score in scores.items() if doc in term_scores}
+                if not scores:
+                    return []
+            if self.removed:
+                scores = {doc: score for doc, score in scores.items() if self.message_ids[doc] is not None}
+            return [(self.message_ids[doc], round(score, 3)) for doc, score in self._best(scores, limit)]
+
+    # The `limit` best (doc, score) pairs. Among equal scores the lower document number,
+    # fetched earlier and so newer, wins. Scores take few distinct values, so the cut-off
+    # score is found first and only the emails at or above it are sorted.
+    @staticmethod
+    def _best(scores, limit):
+        if len(scores) > limit:
+            threshold = heapq.nlargest(limit, scores.values())[-1]
+            above = [(doc, score) for doc, score in scores.items() if score > threshold]
+            ties = heapq.nsmallest(limit - len(above), (doc for doc, score in scores.items() if score == threshold))
+            return sorted(above, key=lambda item: (-item[1], item[0])) + [(doc, threshold) for doc in ties]
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def stats(self):
+        with self.lock:
+            return {
+                'emails': len(self.docs),
+                'bodies': len(self.bodies),
+                'words': len(self.postings),
+                'postings': sum(map(len, self.postings.values())) + sum(map(len, self.body_postings.values())),
+                'removed': self.removed,
+            }
+
+# SearchIndex for mailboxes too large to hold in memory (STREAMING_FETCH), the way
+# StoredDomainIndex is for the domain grouping.
+#
+# The words live in the message store's FTS5 table, on disk, and triggers keep its
+# senders and subjects in step with the stored messages, so adding and removing emails
+# here does nothing; only bodies are added, as they are cached. Queries work as in
+# SearchIndex: every word matches as a prefix, all words are required, and emails rank
+# by bm25 with FIELD_WEIGHTS per field, the newest first among equal scores.
+class StoredSearchIndex:
+    def __init__(self, store):
+        self.store = store
+        self.rebuild_lock = threading.Lock()  # Nothing to rebuild, the store indexes itself
+
+    def __len__(self):
+        return self.store.count()
+
+    def clear(self):
+        pass
+
+    def add_batch(self, records):
+        pass
+
+    def remove(self, message_ids):
+        return 0
+
+    def add_body(self, message_id, markup):
+        text = markup_text(markup)[:BODY_INDEX_CHARS]
+        with SEARCH_SECONDS.time(op='add_body'):
+            return self.store.index_body(message_id, text)
+
+    def search(self, query, limit=SEARCH_RESULTS_LIMIT):
+        terms = list(dict.fromkeys(tokenize(query, min_length=1)))
+        if not terms:
+            return []
+        # Every word a quoted prefix query; FTS5 requires all of them by default
+        match = ' '.join('"' + term.replace('"', '""') + '"*' for term in terms)
+        weights = (FIELD_WEIGHTS[SENDER], FIELD_WEIGHTS[SUBJECT], FIELD_WEIGHTS[BODY])
+        with SEARCH_SECONDS.time(op='search'):
+            return [(message_id, round(score, 3)) for message_id, score in self.store.search_messages(match, limit, weights)]
+
+    def stats(self):
+        return {
+            'emails': self.store.count(),
+            'bodies': self.store.indexed_bodies(),
+            'removed': 0,
+        }
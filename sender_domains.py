@@ -0,0 +1,130 @@
+import re
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger('gmail_organizer')
+
+SENDER_CACHE_SIZE = 20000  # Distinct From headers whose domain is remembered
+UNKNOWN_DOMAIN = 'Other'  # Group for senders without a recognizable domain
+# Public suffix list files, in order of preference; the first one that exists is loaded
+PUBLIC_SUFFIX_FILES = ('public_suffix_list.dat', '/usr/share/publicsuffix/public_suffix_list.dat')
+# Common multi-label suffixes, used when no public suffix list file is installed
+FALLBACK_SUFFIXES = (
+    'ac.uk', 'co.uk', 'gov.uk', 'org.uk', 'com.au', 'net.au', 'org.au', 'edu.au', 'co.nz', 'org.nz',
+    'co.jp', 'ne.jp', 'or.jp', 'co.kr', 'co.in', 'co.za', 'co.il', 'com.br', 'com.cn', 'com.hk',
+    'com.mx', 'com.sg', 'com.tr', 'com.tw', 'com.ar', 'com.my', 'com.ph', 'com.vn', 'com.ua',
+)
+
+# A domain in an email address, or failing that a hostname-looking word
+ADDRESS_PATTERN = re.compile(r'[\w\.-]+@([\w\.-]+)')
+HOSTNAME_PATTERN = re.compile(r'([\w\.-]+\.(com|org|net|edu|io|co|gov))\b')
+
+# Host part of a From header, lowercased, or None when there is none
+def parse_host(sender):
+    match = ADDRESS_PATTERN.search(sender) or HOSTNAME_PATTERN.search(sender)
+    if match is None:
+        return None
+    return match.group(1).strip('.').lower() or None
+
+# Public suffix rules ("co.uk", wildcards like "*.ck", exceptions like "!www.ck") in a
+# trie of nested dicts keyed by label from the right. A node's '' key marks the end of
+# a rule and its '!' key the end of an exception.
+class SuffixTrie:
+    def __init__(self, rules=()):
+        self.root = {}
+        self.rules = 0
+        for rule in rules:
+            self.add(rule)
+
+    def add(self, rule):
+        exception = rule.startswith('!')
+        node = self.root
+        for label in reversed(rule.lstrip('!').lower().split('.')):
+            node = node.setdefault(label, {})
+        node['!' if exception else ''] = True
+        self.rules += 1
+
+    # Number of trailing labels that form the public suffix. Unlisted TLDs count as
+    # suffixes (the list's implicit "*" rule). Where a label matches both itself and a
+    # wildcard, only the exact match is followed.
+    def suffix_length(self, labels):
+        node = self.root
+        length = 1
+        for depth, label in enumerate(reversed(labels), 1):
+            child = node.get(label)
+            if child is None:
+                child = node.get('*')
+            if child is None:
+                break
+            if '!' in child:
+                # Exception rules win: the suffix is everything to the right of this label
+                return depth - 1
+            if '' in child:
+                length = depth
+            node = child
+        return length
+
+    # The public suffix plus one label (mail.foo.co.uk -> foo.co.uk); a domain that is
+    # itself a public suffix is returned as is
+    def registrable_domain(self, domain):
+        labels = domain.split('.')
+        length = self.suffix_length(labels)
+        if length >= len(labels):
+            return domain
+        return '.'.join(labels[-(length + 1):])
+
+def parse_suffix_rules(lines):
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('//'):
+            yield line.split()[0]
+
+# Load the first public suffix list found, or the built-in common suffixes
+def load_suffix_trie(paths=PUBLIC_SUFFIX_FILES):
+    for path in paths:
+        try:
+            with open(path, encoding='utf-8') as f:
+                trie = SuffixTrie(parse_suffix_rules(f))
+        except OSError:
+            continue
+        logger.info(f"Loaded {trie.rules} public suffix rules from {path}")
+        return trie
+    logger.warning("No public suffix list found, using the built-in list of common suffixes")
+    return SuffixTrie(FALLBACK_SUFFIXES)
+
+# Maps the raw From header of an email to the domain it is grouped under.
+#
+# The same few thousand senders repeat across a mailbox, so results are memoized per
+# header in a bounded LRU. By default emails are grouped by the sender's host
+# (news.foo.com); with registrable=True they are grouped by registrable domain
+# (foo.com), using a public suffix trie loaded once.
+class DomainNormalizer:
+    def __init__(self, registrable=False, suffixes=None, cache_size=SENDER_CACHE_SIZE):
+        self.registrable = registrable
+        self.suffixes = suffixes if suffixes is not None or not registrable else load_suffix_trie()
+        self.domain = lru_cache(maxsize=cache_size)(self._domain)
+
+    # Name of the grouping, stored with cached data so a change of mode can be detected
+    @property
+    def mode(self):
+        return 'registrable' if self.registrable else 'host'
+
+    def _domain(self, sender):
+        host = parse_host(sender)
+        if host is None:
+            return UNKNOWN_DOMAIN
+        if self.registrable:
+            return self.suffixes.registrable_domain(host)
+        return host
+
+    def stats(self):
+        info = self.domain.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            'mode': self.mode,
+            'hits': info.hits,
+            'misses': info.misses,
+            'hit_ratio': round(info.hits / lookups, 3) if lookups else None,
+            'entries': info.currsize,
+            'max_entries': info.maxsize,
+        }
@@ -2,7 +2,7 @@
 document.addEventListener('DOMContentLoaded', function() {
     // Global variables for pagination
     let nextPageToken = null;
-    let currentEmailCount = document.querySelectorAll('.email-item').length;
+    let currentEmailCount = parseInt(document.getElementById('fetched-count').textContent || '0');
     let isFetching = false;
     let totalUnreadCount = parseInt(document.querySelector('.unread-count').textContent.match(/\d+/)[0] || '0');
     let isBackgroundFetching = document.body.getAttribute('data-is-loading') === 'true';
@@ -11,259 +11,833 @@ document.addEventListener('DOMContentLoaded', function() {
     let initialLoadComplete = false;
     let isPaused = false;
     let selectedEmailCount = 0; // Track number of selected emails
+    let statusVersion = document.body.getAttribute('data-status-version'); // Change version of the list we have
+    let statusEtag = null; // ETag of the last /fetch-status response
 
-    // Store domain pagination state
-    const domainPagination = {};
+    // The email list lives in a client-side model and is rendered virtually: only the
+    // domain sections near the visible part of the list are in the DOM, each holding just
+    // its current page of rows. Rows are keyed by message ID and patched in place, and all
+    // changes to the model are written to the DOM together on the next animation frame.
     const EMAILS_PER_PAGE = 10; // Number of emails to show per page for each domain
+    const DOMAINS_PER_REQUEST = 20; // Domains loaded per /domains request
+    const EMAILS_PER_REQUEST = 50; // Emails loaded per /domains/<domain>/emails request
+    const OVERSCAN_PX = 800; // Sections rendered above and below the visible part of the list
+    const SECTION_GAP_PX = 10; // Bottom margin of .domain-section
+    const HEADER_HEIGHT_PX = 38; // Estimated heights, used until a section has been rendered once
+    const ROW_HEIGHT_PX = 62;
+    const PAGINATION_HEIGHT_PX = 44;
+
+    const domainStates = new Map(); // domain -> {domain, total, ids, page, selected, height}
+    const emailRecords = new Map(); // message ID -> {record, domain}
+    const mountedSections = new Map(); // domain -> section element currently in the DOM
+    const dirtyDomains = new Set(); // Sections to patch on the next frame
+    const loadingDomainEmails = {}; // In-flight email page requests by domain
+    let domainOrder = []; // Domains, largest first
+    let orderDirty = false; // Counts changed, so the domains need sorting again
+    let windowDirty = false; // Scroll position or heights changed, so the rendered window may too
+    let frameRequested = false;
+    let activeEmailId = null;
+    const collapsedDomains = JSON.parse(localStorage.getItem('collapsedDomains') || '{}');
+
+    const emailListContainer = document.querySelector('.email-list-container');
+    const emailListContent = document.querySelector('.email-list-content');
+    const emailActionForm = document.getElementById('email-action-form');
+
+    // Spacers stand in for the sections above and below the rendered window
+    const topSpacer = document.createElement('div');
+    const bottomSpacer = document.createElement('div');
+    const loadMoreDomainsContainer = document.querySelector('.load-more-domains');
+    if (loadMoreDomainsContainer) {
+        loadMoreDomainsContainer.before(topSpacer, bottomSpacer);
+    } else {
+        emailListContent.append(topSpacer, bottomSpacer);
+    }
 
-    // Function to update selected email count
-    function updateSelectedCount() {
-        const checkedEmails = document.querySelectorAll('.email-checkbox:checked');
-        selectedEmailCount = checkedEmails.length;
+    // Sections and rows are cloned from static templates and filled in with textContent
+    const sectionTemplate = document.createElement('template');
+    sectionTemplate.innerHTML = `
+        <div class="domain-section">
+            <div class="domain-header">
+                <div class="domain-checkbox">
+                    <input type="checkbox" class="select-domain">
+                    <label></label>
+                </div>
+                <h2 class="domain-name"><span class="email-count"></span></h2>
+                <button type="button" class="domain-rule-button" title="Apply the selected action to every unread email from this domain, fetched or not">
+                    <i class="fas fa-layer-group"></i> All
+                </button>
+            </div>
+            <div class="email-items"></div>
+            <div class="domain-pagination">
+                <div class="domain-pagination-info"></div>
+                <div class="domain-pagination-controls">
+                    <button type="button" class="domain-pagination-button prev-page">
+                        <i class="fas fa-chevron-left"></i> Prev
+                    </button>
+                    <div class="domain-pagination-page"></div>
+                    <button type="button" class="domain-pagination-button next-page">
+                        Next <i class="fas fa-chevron-right"></i>
+                    </button>
+                </div>
+            </div>
+        </div>
+    `;
+
+    const rowTemplate = document.createElement('template');
+    rowTemplate.innerHTML = `
+        <div class="email-item">
+            <div class="email-checkbox-container">
+                <input type="checkbox" class="email-checkbox">
+                <label></label>
+            </div>
+            <div class="email-content">
+                <div class="email-sender"></div>
+                <div class="email-subject"></div>
+                <div class="email-date"></div>
+            </div>
+        </div>
+    `;
+
+    function getDomainState(domain, create) {
+        let state = domainStates.get(domain);
+        if (!state && create) {
+            state = { domain: domain, total: 0, ids: [], page: 1, selected: new Set(), height: null };
+            domainStates.set(domain, state);
+            orderDirty = true;
+        }
+        return state;
+    }
 
-        // Update the count display
-        const selectedCountEl = document.getElementById('selected-count');
-        if (selectedCountEl) {
-            selectedCountEl.textContent = `(${selectedEmailCount} selected)`;
+    // Add emails to the end of a domain and update the records of ones already in the list.
+    // With `append` false only known emails are updated. Returns how many were added.
+    function putEmails(state, emails, append) {
+        let added = 0;
+        for (const email of emails) {
+            const known = emailRecords.get(email.id);
+            if (known) {
+                known.record = email;
+                markDirty(known.domain);
+            } else if (append) {
+                emailRecords.set(email.id, { record: email, domain: state.domain });
+                state.ids.push(email.id);
+                added++;
+            }
         }
+        markDirty(state.domain);
+        return added;
+    }
 
-        // Enable/disable the apply button
-        const applyBtn = document.getElementById('apply-action-btn');
-        if (applyBtn) {
-            applyBtn.disabled = selectedEmailCount === 0;
+    // Drop emails from the model; returns how many each domain lost
+    function dropEmails(emailIds) {
+        const touched = {};
+        emailIds.forEach(emailId => {
+            const known = emailRecords.get(emailId);
+            if (!known) return;
+            emailRecords.delete(emailId);
+            domainStates.get(known.domain).selected.delete(emailId);
+            touched[known.domain] = (touched[known.domain] || 0) + 1;
+        });
+
+        for (const domain in touched) {
+            const state = domainStates.get(domain);
+            state.ids = state.ids.filter(emailId => emailRecords.has(emailId));
+            markDirty(domain);
         }
+        return touched;
     }
 
-    // Setup collapsible domain sections
-    function setupCollapsibleDomains() {
-        const domainHeaders = document.querySelectorAll('.domain-header');
-
-        domainHeaders.forEach(header => {
-            if (!header.hasEventListener) {
-                header.hasEventListener = true;
-                header.addEventListener('click', function(e) {
-                    // Don't collapse if clicking on checkbox
-                    if (e.target.closest('.domain-checkbox')) {
-                        return;
-                    }
+    function dropDomain(domain) {
+        const state = domainStates.get(domain);
+        if (!state) return;
+        state.ids.forEach(emailId => emailRecords.delete(emailId));
+        domainStates.delete(domain);
+        orderDirty = true;
+        scheduleRender();
+    }
 
-                    const domainSection = this.closest('.domain-section');
-                    domainSection.classList.toggle('collapsed');
+    // Total emails of a domain on the server; the model may hold only some of them
+    function setDomainTotal(state, total) {
+        if (state.total !== total) {
+            state.total = total;
+            orderDirty = true;
+        }
+        markDirty(state.domain);
+    }
 
-                    // Store collapsed state in localStorage
-                    const domain = domainSection.getAttribute('data-domain');
-                    const collapsedDomains = JSON.parse(localStorage.getItem('collapsedDomains') || '{}');
+    function totalPages(state) {
+        return Math.max(Math.ceil(Math.max(state.total, state.ids.length) / EMAILS_PER_PAGE), 1);
+    }
 
-                    if (domainSection.classList.contains('collapsed')) {
-                        collapsedDomains[domain] = true;
-                    } else {
-                        delete collapsedDomains[domain];
-                    }
+    // Height of a section as last rendered, or an estimate from its current page
+    function sectionHeight(state) {
+        if (state.height !== null) {
+            return state.height;
+        }
+        if (collapsedDomains[state.domain]) {
+            return HEADER_HEIGHT_PX + SECTION_GAP_PX;
+        }
+        const rows = Math.min(EMAILS_PER_PAGE, Math.max(state.total - (state.page - 1) * EMAILS_PER_PAGE, 0));
+        const pagination = totalPages(state) > 1 ? PAGINATION_HEIGHT_PX : 0;
+        return HEADER_HEIGHT_PX + rows * ROW_HEIGHT_PX + pagination + SECTION_GAP_PX;
+    }
 
-                    localStorage.setItem('collapsedDomains', JSON.stringify(collapsedDomains));
-                });
+    function markDirty(domain) {
+        dirtyDomains.add(domain);
+        scheduleRender();
+    }
+
+    function markWindowDirty() {
+        windowDirty = true;
+        scheduleRender();
+    }
+
+    function scheduleRender() {
+        if (frameRequested) return;
+        frameRequested = true;
+        requestAnimationFrame(renderFrame);
+    }
+
+    // Write every pending change to the DOM, then measure what was rendered
+    function renderFrame() {
+        frameRequested = false;
+
+        if (orderDirty) {
+            orderDirty = false;
+            windowDirty = true;
+            // Array.prototype.sort is stable, so equal counts keep their arrival order
+            domainOrder = Array.from(domainStates.keys())
+                .sort((a, b) => domainStates.get(b).total - domainStates.get(a).total);
+        }
+        if (windowDirty) {
+            windowDirty = false;
+            renderWindow();
+        }
+
+        dirtyDomains.forEach(domain => {
+            const section = mountedSections.get(domain);
+            if (section) {
+                patchSection(section, domainStates.get(domain));
             }
         });
+        dirtyDomains.clear();
 
-        // Apply saved collapsed states
-        const collapsedDomains = JSON.parse(localStorage.getItem('collapsedDomains') || '{}');
-        for (const domain in collapsedDomains) {
-            const domainSection = document.querySelector(`.domain-section[data-domain="${domain}"]`);
-            if (domainSection) {
-                domainSection.classList.add('collapsed');
+        updateSelectedCount();
+        measureSections();
+    }
+
+    // Mount the sections that overlap the visible part of the list and size the spacers for the rest
+    function renderWindow() {
+        const listTop = topSpacer.offsetTop;
+        const viewStart = emailListContainer.scrollTop - listTop - OVERSCAN_PX;
+        const viewEnd = emailListContainer.scrollTop - listTop + emailListContainer.clientHeight + OVERSCAN_PX;
+
+        let offset = 0;
+        let before = 0;
+        let after = 0;
+        const visible = [];
+        domainOrder.forEach(domain => {
+            const height = sectionHeight(domainStates.get(domain));
+            if (offset + height <= viewStart) {
+                before += height;
+            } else if (offset >= viewEnd) {
+                after += height;
+            } else {
+                visible.push(domain);
             }
-        }
+            offset += height;
+        });
+
+        const visibleDomains = new Set(visible);
+        mountedSections.forEach((section, domain) => {
+            if (!visibleDomains.has(domain)) {
+                section.remove();
+                mountedSections.delete(domain);
+            }
+        });
+
+        // Insert new sections and move existing ones only where the order changed
+        let previous = topSpacer;
+        visible.forEach(domain => {
+            let section = mountedSections.get(domain);
+            if (!section) {
+                section = createSection(domain);
+                mountedSections.set(domain, section);
+                dirtyDomains.add(domain);
+            }
+            if (previous.nextSibling !== section) {
+                previous.after(section);
+            }
+            previous = section;
+        });
+
+        topSpacer.style.height = `${before}px`;
+        bottomSpacer.style.height = `${after}px`;
     }
 
-    // Initialize pagination for a domain
-    function initDomainPagination(domain) {
-        if (!domainPagination[domain]) {
-            domainPagination[domain] = {
-                currentPage: 1,
-                totalPages: 1,
-                selectedEmails: new Set() // Track selected emails by ID
-            };
+    // Remember the real heights of the rendered sections; the window is recomputed if they moved
+    function measureSections() {
+        let changed = false;
+        mountedSections.forEach((section, domain) => {
+            const state = domainStates.get(domain);
+            const height = section.offsetHeight + SECTION_GAP_PX;
+            if (state && Math.abs((state.height || 0) - height) > 1) {
+                state.height = height;
+                changed = true;
+            }
+        });
+        if (changed) {
+            markWindowDirty();
         }
+    }
 
-        const domainSection = document.querySelector(`.domain-section[data-domain="${domain}"]`);
-        if (!domainSection) return;
+    function createSection(domain) {
+        const section = sectionTemplate.content.firstElementChild.cloneNode(true);
+        section.setAttribute('data-domain', domain);
+        section.rows = new Map(); // message ID -> row element
 
-        const emailItems = domainSection.querySelectorAll('.email-item');
-        const totalEmails = emailItems.length;
-        const totalPages = Math.ceil(totalEmails / EMAILS_PER_PAGE);
+        const checkbox = section.querySelector('.select-domain');
+        checkbox.id = `select-domain-${domain}`;
+        section.querySelector('.domain-checkbox label').htmlFor = checkbox.id;
 
-        domainPagination[domain].totalPages = totalPages;
+        const name = section.querySelector('.domain-name');
+        name.insertBefore(document.createTextNode(`${domain} `), name.firstChild);
+        section.querySelector('.email-items').id = `domain-emails-${domain}`;
+        return section;
+    }
 
-        // Create or update pagination controls
-        let paginationContainer = domainSection.querySelector('.domain-pagination');
-        if (!paginationContainer) {
-            paginationContainer = document.createElement('div');
-            paginationContainer.className = 'domain-pagination';
+    function createRow(emailId, domain) {
+        const row = rowTemplate.content.firstElementChild.cloneNode(true);
+        row.setAttribute('data-email-id', emailId);
 
-            // Add pagination container after email items
-            const emailItemsContainer = domainSection.querySelector('.email-items');
-            if (emailItemsContainer) {
-                emailItemsContainer.after(paginationContainer);
-            }
-        }
+        const checkbox = row.querySelector('.email-checkbox');
+        checkbox.id = `email-${emailId}`;
+        checkbox.value = emailId;
+        checkbox.setAttribute('data-domain', domain);
+        row.querySelector('.email-checkbox-container label').htmlFor = checkbox.id;
+        return row;
+    }
 
-        // Only show pagination if there are multiple pages
-        if (totalPages <= 1) {
-            paginationContainer.style.display = 'none';
-            return;
-        } else {
-            paginationContainer.style.display = 'flex';
+    // Bring a row up to date with its record; fields are only written when the record changed
+    function patchRow(row, emailId, record, selected) {
+        if (row.record !== record) {
+            row.record = record;
+            row.querySelector('.email-sender').textContent = record.sender;
+            row.querySelector('.email-subject').textContent = record.subject;
+            row.querySelector('.email-date').textContent = record.date;
         }
+        row.querySelector('.email-checkbox').checked = selected;
+        row.classList.toggle('active', emailId === activeEmailId);
+    }
 
-        // Update pagination controls
-        paginationContainer.innerHTML = `
-            <div class="domain-pagination-info">
-                Showing page ${domainPagination[domain].currentPage} of ${totalPages}
-            </div>
-            <div class="domain-pagination-controls">
-                <button class="domain-pagination-button prev-page" ${domainPagination[domain].currentPage === 1 ? 'disabled' : ''}>
-                    <i class="fas fa-chevron-left"></i> Prev
-                </button>
-                <div class="domain-pagination-page">${domainPagination[domain].currentPage} / ${totalPages}</div>
-                <button class="domain-pagination-button next-page" ${domainPagination[domain].currentPage === totalPages ? 'disabled' : ''}>
-                    Next <i class="fas fa-chevron-right"></i>
-                </button>
-            </div>
-        `;
-
-        // Add event listeners to pagination buttons
-        const prevButton = paginationContainer.querySelector('.prev-page');
-        const nextButton = paginationContainer.querySelector('.next-page');
+    // Bring a mounted section up to date with its domain's state
+    function patchSection(section, state) {
+        if (!state) return;
+
+        const collapsed = Boolean(collapsedDomains[state.domain]);
+        section.classList.toggle('collapsed', collapsed);
+        section.setAttribute('data-total', state.total);
+        section.querySelector('.email-count').textContent = `(${state.total})`;
+
+        // The domain checkbox covers the emails we hold for the domain
+        const checkbox = section.querySelector('.select-domain');
+        const selectedCount = state.selected.size;
+        checkbox.checked = selectedCount > 0 && selectedCount === state.ids.length;
+        checkbox.indeterminate = selectedCount > 0 && selectedCount < state.ids.length;
+
+        const pages = totalPages(state);
+        state.page = Math.min(state.page, pages);
+        const start = (state.page - 1) * EMAILS_PER_PAGE;
+        const pageIds = collapsed ? [] : state.ids.slice(start, start + EMAILS_PER_PAGE);
+
+        // Load the rest of the page first if the server has more emails than we hold
+        if (!collapsed && pageIds.length < EMAILS_PER_PAGE && state.ids.length < state.total) {
+            loadDomainEmails(state.domain);
+        }
 
-        prevButton.addEventListener('click', function() {
-            if (domainPagination[domain].currentPage > 1) {
-                changePage(domain, domainPagination[domain].currentPage - 1);
+        // Patch the rows of the page in place, keyed by message ID
+        const container = section.querySelector('.email-items');
+        const rows = new Map();
+        let previous = null;
+        pageIds.forEach(emailId => {
+            let row = section.rows.get(emailId);
+            if (!row) {
+                row = createRow(emailId, state.domain);
+            }
+            patchRow(row, emailId, emailRecords.get(emailId).record, state.selected.has(emailId));
+            const expected = previous ? previous.nextSibling : container.firstChild;
+            if (expected !== row) {
+                container.insertBefore(row, expected);
             }
+            rows.set(emailId, row);
+            previous = row;
         });
-
-        nextButton.addEventListener('click', function() {
-            if (domainPagination[domain].currentPage < totalPages) {
-                changePage(domain, domainPagination[domain].currentPage + 1);
+        section.rows.forEach((row, emailId) => {
+            if (!rows.has(emailId)) {
+                row.remove();
             }
         });
+        section.rows = rows;
 
-        // Show the current page
-        showDomainPage(domain, domainPagination[domain].currentPage);
+        // Only show pagination if there are multiple pages
+        const pagination = section.querySelector('.domain-pagination');
+        if (pages <= 1 || collapsed) {
+            pagination.style.display = 'none';
+        } else {
+            pagination.style.display = 'flex';
+            section.querySelector('.domain-pagination-info').textContent = `Showing page ${state.page} of ${pages}`;
+            section.querySelector('.domain-pagination-page').textContent = `${state.page} / ${pages}`;
+            section.querySelector('.prev-page').disabled = state.page === 1;
+            section.querySelector('.next-page').disabled = state.page === pages;
+        }
     }
 
-    // Change page for a domain
-    function changePage(domain, pageNumber) {
-        if (!domainPagination[domain]) return;
-
-        // Save current page's selected emails
-        saveSelectedEmails(domain);
+    // Function to update selected email count
+    function updateSelectedCount() {
+        selectedEmailCount = 0;
+        domainStates.forEach(state => {
+            selectedEmailCount += state.selected.size;
+        });
 
-        // Update current page
-        domainPagination[domain].currentPage = pageNumber;
+        // Update the count display
+        const selectedCountEl = document.getElementById('selected-count');
+        if (selectedCountEl) {
+            selectedCountEl.textContent = `(${selectedEmailCount} selected)`;
+        }
 
-        // Show the new page
-        showDomainPage(domain, pageNumber);
+        // Enable/disable the apply button
+        const applyBtn = document.getElementById('apply-action-btn');
+        if (applyBtn) {
+            applyBtn.disabled = selectedEmailCount === 0;
+        }
+    }
 
-        // Update pagination controls
-        const domainSection = document.querySelector(`.domain-section[data-domain="${domain}"]`);
-        if (!domainSection) return;
+    // Ask the server to warm the body cache for a domain the user is browsing
+    function prefetchDomain(domain, afterEmailId) {
+        const params = new URLSearchParams({ domain: domain });
+        if (afterEmailId) {
+            params.append('after', afterEmailId);
+        }
+        fetch('/prefetch', { method: 'POST', body: params })
+            .catch(error => console.error('Error scheduling prefetch:', error));
+    }
 
-        const paginationInfo = domainSection.querySelector('.domain-pagination-info');
-        if (paginationInfo) {
-            paginationInfo.textContent = `Showing page ${pageNumber} of ${domainPagination[domain].totalPages}`;
+    // Apply the action picked in the action bar to every unread email of a domain on the
+    // server, including the ones not fetched yet, as a job whose progress shows in the action bar
+    function applyDomainRule(domain, button) {
+        const actionSelect = document.getElementById('global-action-type');
+        const label = actionSelect.options[actionSelect.selectedIndex].text;
+        if (!confirm(`${label}: every unread email from ${domain}, including ones not fetched yet?`)) {
+            return;
         }
+        const params = new URLSearchParams({ action_type: actionSelect.value, domain: domain });
+        button.disabled = true;
+        fetch('/bulk-action', { method: 'POST', body: params })
+            .then(response => response.json())
+            .then(data => {
+                if (data.status === 'error') {
+                    throw new Error(data.message);
+                }
+                trackJob(data.job);
+            })
+            .catch(error => {
+                console.error('Error applying bulk rule:', error);
+                alert(`Could not apply the action to ${domain}: ${error.message}`);
+            })
+            .finally(() => {
+                button.disabled = false;
+            });
+    }
 
-        const paginationPage = domainSection.querySelector('.domain-pagination-page');
-        if (paginationPage) {
-            paginationPage.textContent = `${pageNumber} / ${domainPagination[domain].totalPages}`;
+    // Load the next page of a domain's emails from the server
+    function loadDomainEmails(domain) {
+        if (loadingDomainEmails[domain]) {
+            return loadingDomainEmails[domain];
         }
 
-        const prevButton = domainSection.querySelector('.prev-page');
-        if (prevButton) {
-            prevButton.disabled = pageNumber === 1;
+        const state = domainStates.get(domain);
+        if (!state) return Promise.resolve();
+
+        // The cursor is the number of emails of this domain we already hold
+        const url = `/domains/${encodeURIComponent(domain)}/emails?cursor=${state.ids.length}&limit=${EMAILS_PER_REQUEST}`;
+
+        loadingDomainEmails[domain] = fetch(url)
+            .then(response => response.json())
+            .then(data => {
+                const added = putEmails(state, data.emails, true);
+
+                // The server has fewer emails than we thought
+                if (data.next_cursor === null || added === 0) {
+                    setDomainTotal(state, state.ids.length);
+                }
+            })
+            .catch(error => {
+                console.error(`Error loading emails for ${domain}:`, error);
+            })
+            .finally(() => {
+                delete loadingDomainEmails[domain];
+            });
+        return loadingDomainEmails[domain];
+    }
+
+    // Load the next page of domains, each with its first emails
+    function loadMoreDomains() {
+        const loadMoreDomainsBtn = document.getElementById('load-more-domains-btn');
+        if (!loadMoreDomainsBtn || loadMoreDomainsBtn.disabled) return;
+
+        // Like the email cursor, the offset is the number of domains we already hold
+        loadMoreDomainsBtn.disabled = true;
+        const offset = domainStates.size;
+
+        fetch(`/domains?offset=${offset}&limit=${DOMAINS_PER_REQUEST}&emails=${EMAILS_PER_REQUEST}`)
+            .then(response => response.json())
+            .then(data => {
+                const grouped = {};
+                const counts = {};
+                data.domains.forEach(entry => {
+                    grouped[entry.domain] = entry.emails || [];
+                    counts[entry.domain] = entry.count;
+                });
+
+                setMoreDomains(data.next_offset, data.total_domains);
+                updateEmailList(grouped, counts, true);
+            })
+            .catch(error => {
+                console.error('Error loading more domains:', error);
+            })
+            .finally(() => {
+                loadMoreDomainsBtn.disabled = false;
+            });
+    }
+
+    // Hide the "Show More Domains" button once there is no next page
+    function setMoreDomains(nextOffset, totalDomains) {
+        const loadMoreDomainsBtn = document.getElementById('load-more-domains-btn');
+        if (!loadMoreDomainsBtn) return;
+
+        if (totalDomains !== undefined) {
+            loadMoreDomainsBtn.setAttribute('data-total-domains', totalDomains);
         }
+        loadMoreDomainsBtn.parentNode.style.display = nextOffset === null ? 'none' : '';
+    }
+
+    // Whether every domain on the server is in the model
+    function allDomainsLoaded() {
+        const loadMoreDomainsBtn = document.getElementById('load-more-domains-btn');
+        return !loadMoreDomainsBtn || loadMoreDomainsBtn.parentNode.style.display === 'none';
+    }
+
+    // Load more domains by button, or by themselves when the button scrolls into view
+    const loadMoreDomainsBtn = document.getElementById('load-more-domains-btn');
+    if (loadMoreDomainsBtn) {
+        loadMoreDomainsBtn.addEventListener('click', loadMoreDomains);
 
-        const nextButton = domainSection.querySelector('.next-page');
-        if (nextButton) {
-            nextButton.disabled = pageNumber === domainPagination[domain].totalPages;
+        if (window.IntersectionObserver) {
+            const observer = new IntersectionObserver(entries => {
+                if (entries.some(entry => entry.isIntersecting)) {
+                    loadMoreDomains();
+                }
+            });
+            observer.observe(loadMoreDomainsBtn);
         }
     }
 
-    // Show a specific page for a domain
-    function showDomainPage(domain, pageNumber) {
-        const domainSection = document.querySelector(`.domain-section[data-domain="${domain}"]`);
-        if (!domainSection) return;
+    // One set of listeners on the list handles every section and row, mounted now or later
+    emailListContent.addEventListener('click', function(e) {
+        const section = e.target.closest('.domain-section');
+        if (!section) return;
+        const domain = section.getAttribute('data-domain');
+        const state = domainStates.get(domain);
+        if (!state) return;
+
+        // Pagination buttons
+        const pageButton = e.target.closest('.domain-pagination-button');
+        if (pageButton) {
+            e.preventDefault();
+            const step = pageButton.classList.contains('next-page') ? 1 : -1;
+            state.page = Math.min(Math.max(state.page + step, 1), totalPages(state));
+            state.height = null;
+            markDirty(domain);
+            markWindowDirty();
+            return;
+        }
+
+        const ruleButton = e.target.closest('.domain-rule-button');
+        if (ruleButton) {
+            applyDomainRule(domain, ruleButton);
+            return;
+        }
 
-        const emailItems = domainSection.querySelectorAll('.email-item');
-        const startIndex = (pageNumber - 1) * EMAILS_PER_PAGE;
-        const endIndex = startIndex + EMAILS_PER_PAGE;
+        // Collapse or expand the domain, unless the click was on its checkbox
+        const header = e.target.closest('.domain-header');
+        if (header) {
+            if (e.target.closest('.domain-checkbox')) {
+                return;
+            }
 
-        // Hide all emails first
-        emailItems.forEach((item, index) => {
-            if (index >= startIndex && index < endIndex) {
-                item.classList.remove('hidden-page');
+            // Store collapsed state in localStorage
+            if (collapsedDomains[domain]) {
+                delete collapsedDomains[domain];
+                prefetchDomain(domain);
             } else {
-                item.classList.add('hidden-page');
+                collapsedDomains[domain] = true;
             }
-        });
+            localStorage.setItem('collapsedDomains', JSON.stringify(collapsedDomains));
 
-        // Restore selected state for visible emails
-        restoreSelectedEmails(domain);
-    }
+            state.height = null;
+            markDirty(domain);
+            markWindowDirty();
+            return;
+        }
 
-    // Save selected emails for a domain
-    function saveSelectedEmails(domain) {
-        const domainSection = document.querySelector(`.domain-section[data-domain="${domain}"]`);
-        if (!domainSection) return;
+        const emailItem = e.target.closest('.email-item');
+        if (emailItem) {
+            handleEmailClick(emailItem);
+        }
+    });
 
-        // Clear previous selections for this domain
-        domainPagination[domain].selectedEmails = new Set();
+    emailListContent.addEventListener('change', function(e) {
+        const section = e.target.closest('.domain-section');
+        const state = section ? domainStates.get(section.getAttribute('data-domain')) : null;
+        if (!state) return;
 
-        // Save all checked emails
-        const checkedEmails = domainSection.querySelectorAll('.email-checkbox:checked');
-        checkedEmails.forEach(checkbox => {
-            domainPagination[domain].selectedEmails.add(checkbox.value);
+        if (e.target.classList.contains('email-checkbox')) {
+            if (e.target.checked) {
+                state.selected.add(e.target.value);
+            } else {
+                state.selected.delete(e.target.value);
+            }
+            markDirty(state.domain);
+        } else if (e.target.classList.contains('select-domain')) {
+            // Select or clear every email of the domain we hold, on every page
+            if (e.target.checked) {
+                state.ids.forEach(emailId => state.selected.add(emailId));
+            } else {
+                state.selected.clear();
+            }
+            markDirty(state.domain);
+        }
+    });
+
+    // Collapsing animates the section height, so measure again once it settles
+    emailListContent.addEventListener('transitionend', function(e) {
+        if (e.propertyName === 'max-height') {
+            markWindowDirty();
+        }
+    });
+    emailListContainer.addEventListener('scroll', markWindowDirty, { passive: true });
+    window.addEventListener('resize', markWindowDirty);
+
+    // Rows of other pages and domains are not in the DOM, so the selection is submitted from the model.
+    // The server queues the action as a job; its progress and the removed emails arrive as events.
+    if (emailActionForm) {
+        emailActionForm.addEventListener('submit', function(e) {
+            e.preventDefault();
+            const formData = new FormData();
+            formData.append('action_type', document.getElementById('global-action-type').value);
+            domainStates.forEach(state => {
+                state.selected.forEach(emailId => formData.append('email_ids', emailId));
+            });
+            fetch('/action', { method: 'POST', body: formData, headers: { 'Accept': 'application/json' } })
+                .then(response => response.json())
+                .then(data => {
+                    if (data.status === 'error') {
+                        throw new Error(data.message);
+                    }
+                    domainStates.forEach(state => {
+                        if (state.selected.size) {
+                            state.selected.clear();
+                            markDirty(state.domain);
+                        }
+                    });
+                    updateSelectedCount();
+                    trackJob(data.job);
+                })
+                .catch(error => {
+                    console.error('Error applying action:', error);
+                    alert(`Could not apply the action: ${error.message}`);
+                });
         });
     }
 
-    // Restore selected emails for a domain
-    function restoreSelectedEmails(domain) {
-        if (!domainPagination[domain] || !domainPagination[domain].selectedEmails) return;
+    // Progress of the action jobs started from this page
+    const jobStatus = document.getElementById('job-status');
+    const jobLines = new Map(); // job ID -> status line element
+    const JOB_DONE_STATES = ['done', 'failed', 'cancelled'];
+    const JOB_LINE_LINGER_MS = 5000;
+
+    function trackJob(job) {
+        if (!jobStatus || jobLines.has(job.id)) return;
+        const line = document.createElement('div');
+        line.className = 'job-line';
+        jobLines.set(job.id, line);
+        jobStatus.appendChild(line);
+        jobStatus.hidden = false;
+        showJob(job);
+        if (!eventStreamOpen) {
+            setTimeout(() => pollJob(job.id), 1000);
+        }
+    }
 
-        const domainSection = document.querySelector(`.domain-section[data-domain="${domain}"]`);
-        if (!domainSection) return;
+    function showJob(job) {
+        const line = jobLines.get(job.id);
+        if (!line) return;
+        const option = document.querySelector(`#global-action-type option[value="${job.action_type}"]`);
+        const label = option ? option.textContent.trim() : job.action_type;
+        const target = job.rule ? ` (${job.rule.value})` : '';
+        const count = job.total === null ? 'finding emails' : `${job.done} of ${job.total}`;
+        const failed = job.failed ? `, ${job.failed} failed` : '';
+        const state = JOB_DONE_STATES.includes(job.state) ? ` ${job.state}` : '';
+        line.textContent = `${label}${target}: ${count}${failed}${state}${job.error ? ` (${job.error})` : ''}`;
+        line.classList.toggle('job-failed', job.state === 'failed' || job.failed > 0);
+
+        if (JOB_DONE_STATES.includes(job.state)) {
+            jobLines.delete(job.id);
+            if (!eventStreamOpen) {
+                // Without the event stream the removed emails only show up with the next status check
+                checkEmailStatus();
+            }
+            setTimeout(() => {
+                line.remove();
+                jobStatus.hidden = !jobStatus.children.length;
+            }, JOB_LINE_LINGER_MS);
+        }
+    }
 
-        // Get all visible email checkboxes
-        const emailCheckboxes = domainSection.querySelectorAll('.email-item:not(.hidden-page) .email-checkbox');
+    // Search the fetched emails as the user types; picking a result opens its preview
+    const searchForm = document.getElementById('search-form');
+    const searchInput = document.getElementById('search-input');
+    const searchResults = document.getElementById('search-results');
+    const SEARCH_DELAY_MS = 150;
+    const SEARCH_LIMIT = 20;
+    let searchTimer = null;
+    let searchSequence = 0;
+
+    function runSearch() {
+        const query = searchInput.value.trim();
+        const sequence = ++searchSequence;
+        if (!query) {
+            searchResults.hidden = true;
+            return;
+        }
+        fetch(`/search?q=${encodeURIComponent(query)}&limit=${SEARCH_LIMIT}`)
+            .then(response => response.json())
+            .then(data => {
+                // Answers to older keystrokes may arrive after newer ones
+                if (sequence !== searchSequence) return;
+                searchResults.replaceChildren();
+                if (!data.results.length) {
+                    const empty = document.createElement('div');
+                    empty.className = 'search-empty';
+                    empty.textContent = `No emails match "${query}"`;
+                    searchResults.appendChild(empty);
+                }
+                data.results.forEach(result => {
+                    const item = document.createElement('div');
+                    item.className = 'search-result';
+                    item.dataset.emailId = result.id;
+                    const sender = document.createElement('div');
+                    sender.className = 'email-sender';
+                    sender.textContent = result.sender;
+                    const subject = document.createElement('div');
+                    subject.className = 'email-subject';
+                    subject.textContent = result.subject;
+                    const date = document.createElement('div');
+                    date.className = 'email-date';
+                    date.textContent = result.date;
+                    item.append(sender, subject, date);
+                    searchResults.appendChild(item);
+                });
+                searchResults.hidden = false;
+            })
+            .catch(error => console.error('Error searching emails:', error));
+    }
 
-        // Check the ones that were previously selected
-        emailCheckboxes.forEach(checkbox => {
-            if (domainPagination[domain].selectedEmails.has(checkbox.value)) {
-                checkbox.checked = true;
+    if (searchForm) {
+        searchForm.addEventListener('submit', function(e) {
+            e.preventDefault();
+            clearTimeout(searchTimer);
+            runSearch();
+        });
+        searchInput.addEventListener('input', function() {
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(runSearch, SEARCH_DELAY_MS);
+        });
+        searchResults.addEventListener('click', function(e) {
+            const result = e.target.closest('.search-result');
+            if (result) {
+                handleEmailClick(result);
+                searchResults.hidden = true;
+            }
+        });
+        document.addEventListener('click', function(e) {
+            if (!searchForm.contains(e.target)) {
+                searchResults.hidden = true;
+            }
+        });
+        searchInput.addEventListener('focus', function() {
+            if (searchResults.children.length && searchInput.value.trim()) {
+                searchResults.hidden = false;
             }
         });
+    }
 
-        // Update domain checkbox state
-        updateDomainCheckbox(domain);
+    // Show the jobs still queued or running when the page loads
+    if (jobStatus) {
+        fetch('/jobs')
+            .then(response => response.json())
+            .then(data => data.jobs.filter(job => !JOB_DONE_STATES.includes(job.state)).forEach(trackJob))
+            .catch(error => console.error('Error loading action jobs:', error));
+    }
 
-        // Update total selected count
-        updateSelectedCount();
+    // Fallback for when the event stream is down
+    function pollJob(jobId) {
+        if (!jobLines.has(jobId)) return;
+        if (eventStreamOpen) return;
+        fetch(`/jobs/${jobId}`)
+            .then(response => response.json())
+            .then(job => {
+                showJob(job);
+                setTimeout(() => pollJob(jobId), 1000);
+            })
+            .catch(error => console.error('Error checking action job:', error));
     }
 
-    // Initialize pagination for all domains
-    function initAllDomainPagination() {
-        const domainSections = document.querySelectorAll('.domain-section');
-        domainSections.forEach(section => {
-            const domain = section.getAttribute('data-domain');
-            if (domain) {
-                initDomainPagination(domain);
+    // Switch accounts, or name and add a new one from the last option
+    const accountSwitcher = document.getElementById('account-switcher');
+    if (accountSwitcher) {
+        const accountSelect = accountSwitcher.querySelector('select[name="account"]');
+        const currentAccount = accountSelect.value;
+        accountSelect.addEventListener('change', function() {
+            if (!accountSelect.value) {
+                const name = (prompt('Name for the new account (letters, digits, . @ + - _):') || '').trim();
+                if (!name) {
+                    accountSelect.value = currentAccount;
+                    return;
+                }
+                const option = document.createElement('option');
+                option.value = option.textContent = name;
+                accountSelect.insertBefore(option, accountSelect.lastElementChild);
+                accountSelect.value = name;
+                accountSwitcher.querySelector('input[name="create"]').value = '1';
             }
+            accountSwitcher.submit();
         });
     }
 
-    // Call setup on initial load
-    setupCollapsibleDomains();
-    initAllDomainPagination();
+    // Take over the sections the server rendered: read them into the model and render them again
+    document.querySelectorAll('.domain-section').forEach(section => {
+        const state = getDomainState(section.getAttribute('data-domain'), true);
+        const emails = Array.from(section.querySelectorAll('.email-item')).map(item => ({
+            id: item.dataset.emailId,
+            sender: item.querySelector('.email-sender').textContent,
+            subject: item.querySelector('.email-subject').textContent,
+            date: item.querySelector('.email-date').textContent
+        }));
+        putEmails(state, emails, true);
+        state.total = Math.max(parseInt(section.getAttribute('data-total') || '0'), state.ids.length);
+        section.remove();
+    });
+    scheduleRender();
 
     // Fetch control elements
     const pauseBtn = document.getElementById('pause-fetch-btn');
@@ -275,6 +849,10 @@ document.addEventListener('DOMContentLoaded', function() {
     const lastFetchTime = document.getElementById('last-fetch-time');
     const progressFill = document.querySelector('.progress-fill');
 
+    // Server-sent event stream for progress updates; polling is the fallback
+    let eventSource = null;
+    let eventStreamOpen = false;
+
     // Set up status checking if background fetching is happening
     if (isBackgroundFetching) {
         // Start with a faster check interval for initial load
@@ -282,11 +860,75 @@ document.addEventListener('DOMContentLoaded', function() {
 
         // After 5 seconds, slow down the check interval to reduce server load
         setTimeout(function() {
+            if (eventStreamOpen) return;
             clearInterval(updateInterval);
             updateInterval = setInterval(checkEmailStatus, 3000);
         }, 5000);
     }
 
+    // Connect to /fetch-events and let it replace polling while it is up
+    function connectEventStream() {
+        if (!window.EventSource) return;
+
+        eventSource = new EventSource('/fetch-events');
+
+        eventSource.addEventListener('open', function() {
+            eventStreamOpen = true;
+            if (updateInterval) {
+                clearInterval(updateInterval);
+                updateInterval = null;
+            }
+
+            // Catch up on anything that changed before the stream was open
+            lastUpdateTime = 0;
+            checkEmailStatus();
+        });
+
+        eventSource.addEventListener('progress', function(e) {
+            applyStatusUpdate(JSON.parse(e.data));
+        });
+
+        eventSource.addEventListener('emails', function(e) {
+            applyStatusUpdate(JSON.parse(e.data));
+        });
+
+        // Also picks up jobs started elsewhere, like ones resumed after a restart
+        eventSource.addEventListener('job', function(e) {
+            const job = JSON.parse(e.data);
+            if (!JOB_DONE_STATES.includes(job.state)) {
+                trackJob(job);
+            }
+            showJob(job);
+        });
+
+        eventSource.addEventListener('fetch-error', function(e) {
+            applyStatusUpdate({ status: 'error', error: JSON.parse(e.data).error });
+        });
+
+        // The server no longer has the events we missed, so reload the whole list once
+        eventSource.addEventListener('reset', function() {
+            statusVersion = null;
+            statusEtag = null;
+            lastUpdateTime = 0;
+            checkEmailStatus();
+        });
+
+        eventSource.addEventListener('error', function() {
+            eventStreamOpen = false;
+
+            // EventSource reconnects by itself unless the stream is unavailable
+            if (eventSource.readyState === EventSource.CLOSED) {
+                console.warn('Event stream unavailable, falling back to polling');
+                eventSource = null;
+                if (!updateInterval) {
+                    updateInterval = setInterval(checkEmailStatus, 3000);
+                }
+            }
+        });
+    }
+
+    connectEventStream();
+
     // Function to check email status and update UI
     function checkEmailStatus() {
         // Don't check too frequently
@@ -296,119 +938,147 @@ document.addEventListener('DOMContentLoaded', function() {
 
         lastUpdateTime = Date.now();
 
-        fetch('/fetch-status')
-            .then(response => response.json())
+        // Ask only for what changed since the version we already have
+        const statusUrl = statusVersion !== null ? `/fetch-status?since=${statusVersion}` : '/fetch-status';
+        const headers = statusEtag ? { 'If-None-Match': statusEtag } : {};
+
+        fetch(statusUrl, { headers: headers, cache: 'no-store' })
+            .then(response => {
+                // Nothing changed since the last poll
+                if (response.status === 304) {
+                    return null;
+                }
+                statusEtag = response.headers.get('ETag');
+                return response.json();
+            })
             .then(data => {
-                // Update the total count if needed
-                if (data.total > 0 && data.total !== totalUnreadCount) {
-                    totalUnreadCount = data.total;
-                    document.querySelector('.unread-count span').textContent = `${totalUnreadCount} Unread Emails`;
-
-                    const totalCountEl = document.getElementById('total-count');
-                    if (totalCountEl) {
-                        totalCountEl.textContent = totalUnreadCount;
-                    }
+                if (data) {
+                    applyStatusUpdate(data);
                 }
+            })
+            .catch(error => {
+                console.error('Error checking email status:', error);
+            });
+    }
 
-                // Update the fetched count
-                if (data.fetched > currentEmailCount) {
-                    const fetchedCountEl = document.getElementById('fetched-count');
-                    if (fetchedCountEl) {
-                        fetchedCountEl.textContent = data.fetched;
-                    }
+    // Function to apply a status update from /fetch-status or /fetch-events to the UI
+    function applyStatusUpdate(data) {
+        // Merge the changes into the email list
+        if (data.version !== undefined) {
+            statusVersion = data.version;
+        }
+        if (data.full) {
+            resetEmailList(data.grouped, data.counts, data.total_domains);
+        } else if (data.added || data.removed) {
+            removeEmails(data.removed);
+            if (data.added && Object.keys(data.added).length > 0) {
+                updateEmailList(data.added, data.counts);
+            }
+            applyDomainCounts(data.counts);
+        }
 
-                    // Update the email list with new emails
-                    updateEmailList(data.grouped);
+        // Update the total count if needed
+        if (data.total > 0 && data.total !== totalUnreadCount) {
+            totalUnreadCount = data.total;
+            document.querySelector('.unread-count span').textContent = `${totalUnreadCount} Unread Emails`;
 
-                    // Setup collapsible functionality for new domains
-                    setupCollapsibleDomains();
+            const totalCountEl = document.getElementById('total-count');
+            if (totalCountEl) {
+                totalCountEl.textContent = totalUnreadCount;
+            }
+        }
 
-                    // Update current count
-                    currentEmailCount = data.fetched;
+        // Update the fetched count
+        if (data.fetched > currentEmailCount) {
+            const fetchedCountEl = document.getElementById('fetched-count');
+            if (fetchedCountEl) {
+                fetchedCountEl.textContent = data.fetched;
+            }
 
-                    // Update progress bar - use fetched count as percentage of total
-                    // If total is 0, set progress to 100%
-                    if (totalUnreadCount > 0) {
-                        const progressPercent = Math.min((currentEmailCount / totalUnreadCount) * 100, 100);
-                        progressFill.style.width = `${progressPercent}%`;
-                    } else {
-                        progressFill.style.width = '100%';
-                    }
+            // Update current count
+            currentEmailCount = data.fetched;
 
-                    // If this is the first update after initial load, mark it complete
-                    if (!initialLoadComplete && data.fetched > 0) {
-                        initialLoadComplete = true;
+            // Update progress bar - use fetched count as percentage of total
+            // If total is 0, set progress to 100%
+            if (totalUnreadCount > 0) {
+                const progressPercent = Math.min((currentEmailCount / totalUnreadCount) * 100, 100);
+                progressFill.style.width = `${progressPercent}%`;
+            } else {
+                progressFill.style.width = '100%';
+            }
 
-                        // Hide any loading indicators
-                        const loadingIndicators = document.querySelectorAll('.loading-indicator');
-                        loadingIndicators.forEach(indicator => {
-                            indicator.style.display = 'none';
-                        });
-                    }
-                }
+            // If this is the first update after initial load, mark it complete
+            if (!initialLoadComplete && data.fetched > 0) {
+                initialLoadComplete = true;
 
-                // If total count is less than fetched count, update total to match fetched
-                // This can happen if our initial estimate was too low
-                if (totalUnreadCount < currentEmailCount) {
-                    totalUnreadCount = currentEmailCount;
-                    document.querySelector('.unread-count span').textContent = `${totalUnreadCount} Unread Emails`;
+                // Hide any loading indicators
+                const loadingIndicators = document.querySelectorAll('.loading-indicator');
+                loadingIndicators.forEach(indicator => {
+                    indicator.style.display = 'none';
+                });
+            }
+        }
 
-                    const totalCountEl = document.getElementById('total-count');
-                    if (totalCountEl) {
-                        totalCountEl.textContent = totalUnreadCount;
-                    }
+        // If total count is less than fetched count, update total to match fetched
+        // This can happen if our initial estimate was too low
+        if (totalUnreadCount < currentEmailCount) {
+            totalUnreadCount = currentEmailCount;
+            document.querySelector('.unread-count span').textContent = `${totalUnreadCount} Unread Emails`;
 
-                    // Update progress bar to show 100% if we've fetched all emails
-                    if (data.status === 'complete') {
-                        progressFill.style.width = '100%';
-                    }
-                }
+            const totalCountEl = document.getElementById('total-count');
+            if (totalCountEl) {
+                totalCountEl.textContent = totalUnreadCount;
+            }
 
-                // Update fetch status text and button states
-                updateFetchStatusUI(data.status);
+            // Update progress bar to show 100% if we've fetched all emails
+            if (data.status === 'complete') {
+                progressFill.style.width = '100%';
+            }
+        }
 
-                // Update last fetch time if available
-                if (data.last_fetch_time) {
-                    lastFetchTime.textContent = formatTimeAgo(new Date(data.last_fetch_time));
-                }
+        // Update fetch status text and button states
+        if (data.status) {
+            updateFetchStatusUI(data.status);
+        }
 
-                // If fetching is complete or paused, stop checking frequently
-                if (data.status === 'complete' || data.status === 'paused') {
-                    if (updateInterval) {
-                        clearInterval(updateInterval);
-                        // Set a slower interval for occasional updates
-                        updateInterval = setInterval(checkEmailStatus, 10000);
-                    }
+        // Update last fetch time if available
+        if (data.last_fetch_time) {
+            lastFetchTime.textContent = formatTimeAgo(new Date(data.last_fetch_time));
+        }
 
-                    // Show load more button if there are more emails to fetch
-                    const loadMoreBtn = document.getElementById('load-more-btn');
-                    if (loadMoreBtn) {
-                        if (data.status === 'paused' && currentEmailCount < totalUnreadCount) {
-                            loadMoreBtn.style.display = 'block';
-                        } else {
-                            loadMoreBtn.style.display = 'none';
-                        }
-                    }
+        // If fetching is complete or paused, stop checking frequently
+        if (data.status === 'complete' || data.status === 'paused') {
+            if (updateInterval) {
+                clearInterval(updateInterval);
+                // Set a slower interval for occasional updates
+                updateInterval = setInterval(checkEmailStatus, 10000);
+            }
 
-                    // Hide any loading indicators
-                    const loadingIndicators = document.querySelectorAll('.loading-indicator');
-                    loadingIndicators.forEach(indicator => {
-                        indicator.style.display = 'none';
-                    });
+            // Show load more button if there are more emails to fetch
+            const loadMoreBtn = document.getElementById('load-more-btn');
+            if (loadMoreBtn) {
+                if (data.status === 'paused' && currentEmailCount < totalUnreadCount) {
+                    loadMoreBtn.style.display = 'block';
+                } else {
+                    loadMoreBtn.style.display = 'none';
                 }
+            }
 
-                // Handle errors
-                if (data.status === 'error') {
-                    console.error('Error fetching emails:', data.error);
-                    if (updateInterval) {
-                        clearInterval(updateInterval);
-                        updateInterval = null;
-                    }
-                }
-            })
-            .catch(error => {
-                console.error('Error checking email status:', error);
+            // Hide any loading indicators
+            const loadingIndicators = document.querySelectorAll('.loading-indicator');
+            loadingIndicators.forEach(indicator => {
+                indicator.style.display = 'none';
             });
+        }
+
+        // Handle errors
+        if (data.status === 'error') {
+            console.error('Error fetching emails:', data.error);
+            if (updateInterval) {
+                clearInterval(updateInterval);
+                updateInterval = null;
+            }
+        }
     }
 
     // Function to update the fetch status UI
@@ -496,11 +1166,14 @@ document.addEventListener('DOMContentLoaded', function() {
                         updateFetchStatusUI('fetching');
                         console.log('Email fetching resumed');
 
-                        // Restart the status checking interval
+                        // Restart the status checking interval unless events are streaming
                         if (updateInterval) {
                             clearInterval(updateInterval);
+                            updateInterval = null;
+                        }
+                        if (!eventStreamOpen) {
+                            updateInterval = setInterval(checkEmailStatus, 2000);
                         }
-                        updateInterval = setInterval(checkEmailStatus, 2000);
                     }
                 })
                 .catch(error => {
@@ -576,189 +1249,108 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
-    // Function to update the email list with new emails
-    function updateEmailList(groupedEmails) {
+    // Function to update the email list with new emails. `counts` holds the server's email
+    // count of each domain when known. Domains not in the list are only added when they
+    // rank among the ones we hold, or when `force` is set (loading more domains).
+    function updateEmailList(groupedEmails, counts, force) {
         if (!groupedEmails) return;
 
-        const emailListContent = document.querySelector('.email-list-content');
-
         // Process each domain group
         for (const domain in groupedEmails) {
-            let domainSection = document.querySelector(`.domain-section[data-domain="${domain}"]`);
             const emails = groupedEmails[domain];
-
-            // If domain section doesn't exist, create it
-            if (!domainSection) {
-                domainSection = document.createElement('div');
-                domainSection.className = 'domain-section';
-                domainSection.setAttribute('data-domain', domain);
-
-                domainSection.innerHTML = `
-                    <div class="domain-header">
-                        <div class="domain-checkbox">
-                            <input type="checkbox" id="select-domain-${domain}" class="select-domain">
-                            <label for="select-domain-${domain}"></label>
-                        </div>
-                        <h2 class="domain-name">${domain} <span class="email-count">(${emails.length})</span></h2>
-                    </div>
-                    <div class="email-items" id="domain-emails-${domain}"></div>
-                `;
-
-                // Find where to insert the new domain (by email count)
-                const domainSections = Array.from(document.querySelectorAll('.domain-section'));
-                let inserted = false;
-
-                if (domainSections.length > 0) {
-                    for (let i = 0; i < domainSections.length; i++) {
-                        const section = domainSections[i];
-                        const sectionDomain = section.getAttribute('data-domain');
-                        const sectionCount = groupedEmails[sectionDomain] ? groupedEmails[sectionDomain].length : 0;
-
-                        if (emails.length > sectionCount) {
-                            section.parentNode.insertBefore(domainSection, section);
-                            inserted = true;
-                            break;
-                        }
-                    }
-                }
-
-                if (!inserted) {
-                    // Insert before the load more container or at the end
-                    const loadMoreContainer = document.querySelector('.load-more-container');
-                    if (loadMoreContainer) {
-                        emailListContent.insertBefore(domainSection, loadMoreContainer);
-                    } else {
-                        emailListContent.appendChild(domainSection);
-                    }
-                }
-
-                // Add event listener for domain checkbox
-                const domainCheckbox = domainSection.querySelector('.select-domain');
-                domainCheckbox.addEventListener('change', function() {
-                    const emailCheckboxes = document.querySelectorAll(`.email-checkbox[data-domain="${domain}"]`);
-                    emailCheckboxes.forEach(cb => {
-                        cb.checked = this.checked;
-                    });
-                });
-
-                // Add collapsible functionality to new domain
-                const domainHeader = domainSection.querySelector('.domain-header');
-                domainHeader.addEventListener('click', function(e) {
-                    // Don't collapse if clicking on checkbox
-                    if (e.target.closest('.domain-checkbox')) {
-                        return;
-                    }
-
-                    domainSection.classList.toggle('collapsed');
-
-                    // Store collapsed state in localStorage
-                    const collapsedDomains = JSON.parse(localStorage.getItem('collapsedDomains') || '{}');
-
-                    if (domainSection.classList.contains('collapsed')) {
-                        collapsedDomains[domain] = true;
-                    } else {
-                        delete collapsedDomains[domain];
-                    }
-
-                    localStorage.setItem('collapsedDomains', JSON.stringify(collapsedDomains));
-                });
-
-                // Apply saved collapsed state
-                const collapsedDomains = JSON.parse(localStorage.getItem('collapsedDomains') || '{}');
-                if (collapsedDomains[domain]) {
-                    domainSection.classList.add('collapsed');
+            const count = counts && counts[domain] !== undefined ? counts[domain] : null;
+            let state = domainStates.get(domain);
+            let previousTotal;
+
+            if (!state) {
+                if (!force && !allDomainsLoaded() && !(count !== null && count >= smallestDomainTotal())) {
+                    // It will come with a later page of domains
+                    continue;
                 }
+                state = getDomainState(domain, true);
 
-                // Initialize pagination for the new domain
-                initDomainPagination(domain);
+                // Emails listed here may be new ones of a domain that already had others,
+                // which have to be loaded first to keep the server's order
+                previousTotal = force ? 0 : Math.max((count || 0) - emails.length, 0);
+            } else {
+                previousTotal = state.total;
             }
 
-            // Get the email items container for this domain
-            const emailItemsContainer = domainSection.querySelector('.email-items');
-            const existingEmailIds = new Set(Array.from(emailItemsContainer.querySelectorAll('.email-item')).map(item => item.dataset.emailId));
-
-            // Update the email count
-            const emailCountElement = domainSection.querySelector('.email-count');
-
-            // Add new emails that don't already exist
-            for (const email of emails) {
-                if (!existingEmailIds.has(email.id)) {
-                    const emailItem = document.createElement('div');
-                    emailItem.className = 'email-item';
-                    emailItem.setAttribute('data-email-id', email.id);
-
-                    emailItem.innerHTML = `
-                        <div class="email-checkbox-container">
-                            <input type="checkbox" id="email-${email.id}" class="email-checkbox" data-domain="${domain}" name="email_ids" value="${email.id}">
-                            <label for="email-${email.id}"></label>
-                        </div>
-                        <div class="email-content">
-                            <div class="email-sender">${email.sender}</div>
-                            <div class="email-subject">${email.subject}</div>
-                            <div class="email-date">${email.date}</div>
-                        </div>
-                    `;
-
-                    emailItemsContainer.appendChild(emailItem);
-
-                    // Add click event for preview
-                    emailItem.addEventListener('click', handleEmailClick);
-
-                    // Add change event for checkbox
-                    const checkbox = emailItem.querySelector('.email-checkbox');
-                    checkbox.addEventListener('change', function() {
-                        updateDomainCheckbox(domain);
-
-                        // Update selected count when checkbox changes
-                        updateSelectedCount();
-                    });
-
-                    // Add to existing IDs set
-                    existingEmailIds.add(email.id);
-                }
-            }
+            // Emails only go straight into domains we hold everything of; the others pick
+            // them up when their later pages are loaded
+            const loaded = state.ids.length;
+            const complete = loaded >= previousTotal;
+            const added = putEmails(state, emails, complete);
 
             // Update the count
-            emailCountElement.textContent = `(${existingEmailIds.size})`;
+            if (count !== null) {
+                setDomainTotal(state, Math.max(count, loaded + added));
+            } else {
+                setDomainTotal(state, complete ? loaded + added : previousTotal + emails.length);
+            }
         }
 
         // If there were no emails before, remove the "no emails" message
         const noEmailsMessage = document.querySelector('.no-emails');
-        if (noEmailsMessage && Object.keys(groupedEmails).length > 0) {
+        if (noEmailsMessage && domainStates.size > 0) {
             noEmailsMessage.remove();
         }
+    }
 
-        // Re-sort domain sections by email count
-        sortDomainSections();
+    // Smallest email count among the domains we hold
+    function smallestDomainTotal() {
+        let smallest = null;
+        domainStates.forEach(state => {
+            if (smallest === null || state.total < smallest) {
+                smallest = state.total;
+            }
+        });
+        return smallest || 0;
+    }
+
+    // Set the server's counts for the domains a change touched, dropping domains that are gone
+    function applyDomainCounts(counts) {
+        if (!counts) return;
+
+        for (const domain in counts) {
+            const state = domainStates.get(domain);
+            if (!state) continue;
 
-        // Re-initialize pagination for all domains
-        initAllDomainPagination();
+            if (counts[domain] === 0) {
+                dropDomain(domain);
+            } else {
+                setDomainTotal(state, Math.max(counts[domain], state.ids.length));
+            }
+        }
     }
 
-    // Function to sort domain sections by email count
-    function sortDomainSections() {
-        const emailListContent = document.querySelector('.email-list-content');
-        const domainSections = Array.from(document.querySelectorAll('.domain-section'));
-        const loadMoreContainer = document.querySelector('.load-more-container');
+    // Replace the whole list with a fresh first screen from /fetch-status
+    function resetEmailList(groupedEmails, counts, totalDomains) {
+        domainStates.clear();
+        emailRecords.clear();
+        orderDirty = true;
 
-        // Remove all domain sections
-        domainSections.forEach(section => section.remove());
+        const shown = Object.keys(groupedEmails || {}).length;
+        setMoreDomains(shown < totalDomains ? shown : null, totalDomains);
+        updateEmailList(groupedEmails, counts, true);
+        scheduleRender();
+    }
 
-        // Sort by email count
-        domainSections.sort((a, b) => {
-            const aCount = parseInt(a.querySelector('.email-count').textContent.match(/\d+/)[0] || '0');
-            const bCount = parseInt(b.querySelector('.email-count').textContent.match(/\d+/)[0] || '0');
-            return bCount - aCount;
-        });
+    // Function to remove emails from the list, dropping domains that become empty
+    function removeEmails(emailIds) {
+        if (!emailIds || emailIds.length === 0) return;
 
-        // Re-insert in sorted order
-        domainSections.forEach(section => {
-            if (loadMoreContainer) {
-                emailListContent.insertBefore(section, loadMoreContainer);
+        const touchedDomains = dropEmails(emailIds);
+        for (const domain in touchedDomains) {
+            const state = domainStates.get(domain);
+            const total = Math.max(state.total - touchedDomains[domain], state.ids.length);
+            if (total === 0) {
+                dropDomain(domain);
             } else {
-                emailListContent.appendChild(section);
+                // The section loads the next emails if its current page ran short
+                setDomainTotal(state, total);
             }
-        });
+        }
     }
 
     // Add load more button if needed
@@ -818,83 +1410,10 @@ document.addEventListener('DOMContentLoaded', function() {
                 currentEmailCount += data.count;
                 document.getElementById('fetched-count').textContent = currentEmailCount;
 
-                // Add new emails to the list
-                for (const domain in data.emails) {
-                    let domainSection = document.querySelector(`.domain-section[data-domain="${domain}"]`);
-
-                    // If domain section doesn't exist, create it
-                    if (!domainSection) {
-                        const domainContainer = document.createElement('div');
-                        domainContainer.className = 'domain-section';
-                        domainContainer.setAttribute('data-domain', domain);
-
-                        domainContainer.innerHTML = `
-                            <div class="domain-header">
-                                <div class="domain-checkbox">
-                                    <input type="checkbox" id="select-domain-${domain}" class="select-domain">
-                                    <label for="select-domain-${domain}"></label>
-                                </div>
-                                <h2 class="domain-name">${domain} <span class="email-count">(${data.emails[domain].length})</span></h2>
-                            </div>
-                            <div class="email-items" id="domain-emails-${domain}"></div>
-                        `;
-
-                        // Insert at the end
-                        const loadMoreContainer = document.querySelector('.load-more-container');
-                        emailList.insertBefore(domainContainer, loadMoreContainer);
-
-                        domainSection = domainContainer;
-                    }
-
-                    // Get the email items container for this domain
-                    const emailItemsContainer = domainSection.querySelector('.email-items');
-
-                    // Update the email count
-                    const currentCount = parseInt(domainSection.querySelector('.email-count').textContent.match(/\d+/)[0] || '0');
-                    domainSection.querySelector('.email-count').textContent = `(${currentCount + data.emails[domain].length})`;
-
-                    // Add new emails
-                    for (const email of data.emails[domain]) {
-                        const emailItem = document.createElement('div');
-                        emailItem.className = 'email-item';
-                        emailItem.setAttribute('data-email-id', email.id);
-
-                        emailItem.innerHTML = `
-                            <div class="email-checkbox-container">
-                                <input type="checkbox" id="email-${email.id}" class="email-checkbox" data-domain="${domain}" name="email_ids" value="${email.id}">
-                                <label for="email-${email.id}"></label>
-                            </div>
-                            <div class="email-content">
-                                <div class="email-sender">${email.sender}</div>
-                                <div class="email-subject">${email.subject}</div>
-                                <div class="email-date">${email.date}</div>
-                            </div>
-                        `;
-
-                        emailItemsContainer.appendChild(emailItem);
-
-                        // Add click event for preview
-                        emailItem.addEventListener('click', handleEmailClick);
-
-                        // Add change event for checkbox
-                        const checkbox = emailItem.querySelector('.email-checkbox');
-                        checkbox.addEventListener('change', function() {
-                            updateDomainCheckbox(domain);
-
-                            // Update selected count when checkbox changes
-                            updateSelectedCount();
-                        });
-                    }
-                }
-
-                // Add event listeners to new checkboxes
-                setupCheckboxes();
-
-                // Re-sort domain sections by email count
-                sortDomainSections();
-
-                // Re-initialize pagination for all domains
-                initAllDomainPagination();
+                // Add new emails to the list; they were published to the event stream too,
+                // so the list skips the ones it already has
+                updateEmailList(data.emails);
+                updateSelectedCount();
 
                 // Update UI
                 const loadMoreBtn = document.getElementById('load-more-btn');
@@ -924,17 +1443,18 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     // Function to handle email click
-    function handleEmailClick() {
-        const emailId = this.dataset.emailId;
+    function handleEmailClick(emailItem) {
+        const emailId = emailItem.dataset.emailId;
 
         // Remove active class from previously active item
+        const activeEmailItem = emailListContent.querySelector('.email-item.active');
         if (activeEmailItem) {
             activeEmailItem.classList.remove('active');
         }
 
-        // Add active class to clicked item
-        this.classList.add('active');
-        activeEmailItem = this;
+        // Add active class to clicked item; rows rendered later pick it up from activeEmailId
+        emailItem.classList.add('active');
+        activeEmailId = emailId;
 
         // Show loading spinner
         previewEmpty.style.display = 'none';
@@ -946,6 +1466,12 @@ document.addEventListener('DOMContentLoaded', function() {
             previewContainer.classList.add('active');
         }
 
+        // Warm the cache for the emails that follow this one in its domain
+        const known = emailRecords.get(emailId);
+        if (known) {
+            prefetchDomain(known.domain, emailId);
+        }
+
         // Fetch email content
         fetch(`/email/${emailId}`)
             .then(response => response.json())
@@ -975,78 +1501,7 @@ document.addEventListener('DOMContentLoaded', function() {
             });
     }
 
-    // Function to set up checkbox event listeners
-    function setupCheckboxes() {
-        // Domain select all functionality
-        const domainCheckboxes = document.querySelectorAll('.select-domain');
-        domainCheckboxes.forEach(checkbox => {
-            if (!checkbox.hasEventListener) {
-                checkbox.hasEventListener = true;
-                checkbox.addEventListener('change', function() {
-                    const domainId = this.id.split('-').pop();
-                    const emailCheckboxes = document.querySelectorAll(`.email-checkbox[data-domain="${domainId}"]`);
-
-                    emailCheckboxes.forEach(cb => {
-                        cb.checked = this.checked;
-                    });
-
-                    // Update selected count after changing checkboxes
-                    updateSelectedCount();
-                });
-            }
-        });
-
-        // Individual email checkbox functionality
-        const emailCheckboxes = document.querySelectorAll('.email-checkbox');
-        emailCheckboxes.forEach(checkbox => {
-            if (!checkbox.hasEventListener) {
-                checkbox.hasEventListener = true;
-                checkbox.addEventListener('change', function() {
-                    const domainId = this.dataset.domain;
-                    updateDomainCheckbox(domainId);
-
-                    // Update selected count when checkbox changes
-                    updateSelectedCount();
-                });
-            }
-        });
-
-        // After setting up checkboxes, restore selected state
-        for (const domain in domainPagination) {
-            restoreSelectedEmails(domain);
-        }
-    }
-
-    // Initial setup of checkboxes
-    setupCheckboxes();
-
-    // Initial update of selected count
-    updateSelectedCount();
-
-    // Function to update domain checkbox state
-    function updateDomainCheckbox(domainId) {
-        const domainCheckbox = document.getElementById(`select-domain-${domainId}`);
-        const emailCheckboxes = document.querySelectorAll(`.email-checkbox[data-domain="${domainId}"]`);
-
-        let allChecked = true;
-        let allUnchecked = true;
-
-        emailCheckboxes.forEach(cb => {
-            if (cb.checked) {
-                allUnchecked = false;
-            } else {
-                allChecked = false;
-            }
-        });
-
-        if (domainCheckbox) {
-            domainCheckbox.checked = allChecked;
-            domainCheckbox.indeterminate = !allChecked && !allUnchecked;
-        }
-    }
-
     // Email preview functionality
-    const emailItems = document.querySelectorAll('.email-item');
     const previewEmpty = document.querySelector('.email-preview-empty');
     const previewContent = document.querySelector('.email-preview-content');
     const previewSubject = document.querySelector('.email-preview-subject');
@@ -1057,13 +1512,6 @@ document.addEventListener('DOMContentLoaded', function() {
     const loading = document.querySelector('.loading');
     const previewContainer = document.querySelector('.email-preview-container');
 
-    let activeEmailItem = null;
-
-    // Add click event to existing email items
-    emailItems.forEach(item => {
-        item.addEventListener('click', handleEmailClick);
-    });
-
     // Add close button for mobile view
     if (window.innerWidth <= 768) {
         const closeButton = document.createElement('div');
@@ -1082,7 +1530,4 @@ document.addEventListener('DOMContentLoaded', function() {
 
         previewContainer.appendChild(closeButton);
     }
-
-    // Initial sort of domain sections
-    sortDomainSections();
 });